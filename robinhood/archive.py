@@ -0,0 +1,194 @@
+"""
+Keeps every raw API response we fetch, so that the database can be rebuilt from scratch
+(e.g. when the normalization logic changes) without re-downloading years of orders.
+
+The archive is a directory of gzipped JSONL files, partitioned by feed and fetch date:
+
+    archive/
+      |- index.json                     # {feed: {date: {"file": ..., "records": ...}}}
+      |- digests                        # one sha256 per line, for deduplication
+      |- orders/2020-11-20.jsonl.gz
+      |- options/orders/2020-11-20.jsonl.gz
+      ...
+
+Each record is content-addressed by the digest of its payload, so fetching the same page
+twice only stores it once.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any
+from typing import DefaultDict
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Set
+
+from .offline import OfflineClient
+from .util import get_path_to
+from .util import split_api_url
+
+
+class Archive:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        self._index: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+        self._digests: Optional[Set[str]] = None
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if self._index is None:
+            try:
+                with open(os.path.join(self.path, 'index.json')) as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {}
+
+        return self._index
+
+    @property
+    def digests(self) -> Set[str]:
+        if self._digests is None:
+            try:
+                with open(os.path.join(self.path, 'digests')) as f:
+                    self._digests = set(f.read().split())
+            except FileNotFoundError:
+                self._digests = set()
+
+        return self._digests
+
+    def append(
+        self,
+        url: Any,
+        payload: Dict[str, Any],
+        params: Optional[Dict[str, Any]] = None,
+        fetched_at: Optional[datetime.datetime] = None,
+    ) -> bool:
+        """
+        :returns: True if the payload was new, and therefore written.
+        """
+        content = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if digest in self.digests:
+            return False
+
+        if not fetched_at:
+            fetched_at = datetime.datetime.utcnow()
+
+        feed, _ = split_api_url(url)
+        date = fetched_at.strftime('%Y-%m-%d')
+        filename = os.path.join(feed, f'{date}.jsonl.gz')
+        os.makedirs(os.path.join(self.path, feed), exist_ok=True)
+
+        record = json.dumps({
+            'digest': digest,
+            'feed': feed,
+            'url': str(url),
+            'params': params or {},
+            'fetched_at': fetched_at.isoformat(),
+        }, separators=(',', ':'))
+
+        # Splice in the serialized payload, so that we don't need to serialize it twice.
+        line = f'{record[:-1]},"payload":{content}}}\n'
+
+        # NOTE: gzip files can be concatenated, so appending a new member is valid.
+        with gzip.open(os.path.join(self.path, filename), 'at') as f:
+            f.write(line)
+
+        with open(os.path.join(self.path, 'digests'), 'a') as f:
+            f.write(f'{digest}\n')
+        self.digests.add(digest)
+
+        entry = self.index.setdefault(feed, {}).setdefault(
+            date,
+            {'file': filename, 'records': 0},
+        )
+        entry['records'] += 1
+        self._save_index()
+
+        return True
+
+    def iter_records(
+        self,
+        feed: Optional[str] = None,
+        from_date: Optional[datetime.date] = None,
+        to_date: Optional[datetime.date] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        :param feed: e.g. `orders`, or `options/instruments`
+        :param from_date: filter by fetch date
+        :param to_date: filter by fetch date
+        :returns: records, in the order they were fetched (per feed).
+        """
+        feeds = [feed] if feed else sorted(self.index)
+        for name in feeds:
+            for date, entry in sorted(self.index.get(name, {}).items()):
+                if from_date and date < from_date.isoformat():
+                    continue
+                if to_date and date > to_date.isoformat():
+                    continue
+
+                with gzip.open(os.path.join(self.path, entry['file']), 'rt') as f:
+                    for line in f:
+                        yield json.loads(line)
+
+    def get_client(self) -> OfflineClient:
+        """
+        :returns: a client that serves the latest known version of every archived item.
+        """
+        feeds: DefaultDict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        instruments: DefaultDict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        for record in self.iter_records():
+            _, uuid = split_api_url(record['url'])
+            if uuid:
+                instruments[record['feed']][uuid] = record['payload']
+                continue
+
+            # Later fetches override earlier ones, since orders can be updated after the fact.
+            items = feeds[record['feed']]
+            for item in record['payload'].get('results', []):
+                items[item['id']] = item
+
+        return OfflineClient(
+            feeds={name: items.values() for name, items in feeds.items()},
+            instruments=dict(instruments),
+        )
+
+    def _save_index(self) -> None:
+        path = os.path.join(self.path, 'index.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+
+        os.replace(f'{path}.tmp', path)
+
+
+@lru_cache(maxsize=1)
+def get_archive() -> Optional[Archive]:
+    """
+    The archive location can be configured through the `ROBINHOOD_ARCHIVE` environment
+    variable. Setting it to an empty string disables archiving.
+    """
+    path = os.environ.get('ROBINHOOD_ARCHIVE', get_path_to('archive'))
+    if not path:
+        return None
+
+    return Archive(path)
+
+
+def record(
+    client: Any,
+    url: Any,
+    payload: Dict[str, Any],
+    params: Optional[Dict[str, Any]] = None,
+) -> None:
+    if getattr(client, 'offline', False):
+        return
+
+    archive = get_archive()
+    if archive:
+        archive.append(url, payload, params=params)
@@ -0,0 +1,343 @@
+"""
+Runs syncs, reports and exports without a notebook.
+
+Usage:
+    robinhood [--metrics PATH] COMMAND ...
+    robinhood sync [--watch] [--interval SECONDS]
+    robinhood report {harvest,positions,rollup,timeseries,trades} [--from-date ...] [--to-date ...]
+    robinhood export DIRECTORY [--from-date ...] [--to-date ...]
+    robinhood verify [--from-date ...] [--dry-run]
+    robinhood freeze [--through YEAR]
+    robinhood serve [--socket PATH]
+    robinhood report-server [--host HOST] [--port PORT]
+
+With `robinhood sync --watch` running in the background, notebooks can pass `sync=False` to
+reports, so that they never wait on the API. With `robinhood serve` running too, those reports
+are answered from memory.
+
+With `--metrics PATH`, timings and counters (see `robinhood.metrics`) are written to PATH when
+the command finishes: in Prometheus' format if it ends with `.prom`, else JSON.
+"""
+import argparse
+import datetime
+import sys
+import time
+import traceback
+from typing import List
+from typing import Optional
+
+
+# How often (in seconds) `sync --watch` fetches new data, by default.
+SYNC_INTERVAL = 15 * 60
+
+REPORTS = ('harvest', 'positions', 'rollup', 'timeseries', 'trades')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    from . import metrics
+    if args.metrics:
+        metrics.enable()
+
+    try:
+        return run(args)
+    finally:
+        if args.metrics:
+            metrics.dump(args.metrics)
+
+
+def run(args: argparse.Namespace) -> int:
+    # NOTE: These pull in SQLAlchemy, so we only import them once we know what to run.
+    from . import database
+    database.session.setup()
+
+    if args.command == 'sync':
+        if args.watch:
+            return watch(args.interval)
+
+        sync()
+        return 0
+
+    if args.command == 'report':
+        return print_report(args)
+
+    if args.command == 'verify':
+        return verify_database(args)
+
+    if args.command == 'freeze':
+        return freeze(args.through)
+
+    if args.command == 'serve':
+        return serve(args.socket)
+
+    if args.command == 'report-server':
+        return serve_reports(args)
+
+    return export_sales(args)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='robinhood', description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--metrics',
+        metavar='PATH',
+        help='Collect metrics, and write them to PATH when done (`.prom` for Prometheus\' '
+        'format, otherwise JSON).',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_sync = subparsers.add_parser(
+        'sync',
+        help='Fetches new trades from the API, and updates the P&L rollup.',
+    )
+    parser_sync.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running, and sync every `--interval` seconds.',
+    )
+    parser_sync.add_argument(
+        '--interval',
+        type=float,
+        default=SYNC_INTERVAL,
+        help='Defaults to %(default)s.',
+    )
+
+    parser_report = subparsers.add_parser('report', help='Prints a report.')
+    parser_report.add_argument('name', choices=REPORTS)
+    parser_report.add_argument(
+        '--output',
+        metavar='PATH',
+        help='Write the report to a CSV file, rather than printing it.',
+    )
+
+    parser_export = subparsers.add_parser(
+        'export',
+        help='Exports realized sales as Form 8949-style CSVs.',
+    )
+    parser_export.add_argument('directory')
+
+    parser_verify = subparsers.add_parser(
+        'verify',
+        help='Compares the database with the API month by month, and repairs the months '
+        'that differ.',
+    )
+    parser_verify.add_argument(
+        '--from-date',
+        help='YYYY-MM-DD. Defaults to the start of your trade history.',
+    )
+    parser_verify.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Only report the months that differ.',
+    )
+
+    parser_freeze = subparsers.add_parser(
+        'freeze',
+        help='Moves trades from closed years out of the database, into read-only files.',
+    )
+    parser_freeze.add_argument(
+        '--through',
+        type=int,
+        metavar='YEAR',
+        help='The last year to move. Defaults to last year.',
+    )
+
+    parser_serve = subparsers.add_parser(
+        'serve',
+        help='Keeps the portfolio replayed in memory, so that reports run with `sync=False` '
+        'are answered straight away.',
+    )
+    parser_serve.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='Defaults to a socket next to the database.',
+    )
+
+    parser_report_server = subparsers.add_parser(
+        'report-server',
+        help='Serves reports over a read-only HTTP API, for dashboards.',
+    )
+    parser_report_server.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Defaults to %(default)s.',
+    )
+    parser_report_server.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help='Defaults to %(default)s.',
+    )
+    parser_report_server.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='Number of reports to compute concurrently. Defaults to %(default)s.',
+    )
+
+    for subparser in (parser_report, parser_export):
+        subparser.add_argument(
+            '--from-date',
+            help='YYYY-MM-DD',
+        )
+        subparser.add_argument(
+            '--to-date',
+            help='YYYY-MM-DD. For positions (and harvest), this is the date to report on.',
+        )
+        subparser.add_argument(
+            '--no-sync',
+            dest='sync',
+            action='store_false',
+            help='Only use what is already in the database.',
+        )
+
+    return parser.parse_args(argv)
+
+
+def sync() -> None:
+    from . import database
+    from .logic import rollup
+    from .logic.trades import sync_all
+
+    # The rollup reads trades too, so this holds the lock until it's updated (e.g. so that
+    # `robinhood freeze` can't move them in the meantime).
+    with database.lock():
+        sync_all()
+        rollup.update()
+
+
+def watch(interval: float) -> int:
+    from . import database
+    from .client import get_session_client
+
+    try:
+        # There's no point in more than one of these running at a time.
+        with database.lock('watch', blocking=False):
+            while True:
+                start = time.monotonic()
+
+                # This checks whether the session is still valid (and refreshes it, if not),
+                # since a long-running process can easily outlive it.
+                get_session_client.cache_clear()
+                try:
+                    sync()
+                    print(f'{datetime.datetime.now().isoformat(timespec="seconds")} Synced.')
+                except Exception:
+                    # We'll try again next time: the API is flaky at times.
+                    traceback.print_exc()
+                finally:
+                    # Otherwise, every object we've ever loaded stays in memory.
+                    database.session.remove()
+
+                time.sleep(max(0, interval - (time.monotonic() - start)))
+
+    except BlockingIOError:
+        print('ERROR: `robinhood sync --watch` is already running.', file=sys.stderr)
+        return 1
+
+    except KeyboardInterrupt:
+        return 0
+
+
+def print_report(args: argparse.Namespace) -> int:
+    import importlib
+
+    module = importlib.import_module(f'.logic.dataframe.{args.name}', __package__)
+    if args.name in ('harvest', 'positions'):
+        df = module.get(args.to_date, sync=args.sync)
+    else:
+        df = module.get(from_date=args.from_date, to_date=args.to_date, sync=args.sync)
+
+    if args.output:
+        df.to_csv(args.output)
+    else:
+        print(df.to_string())
+
+    return 0
+
+
+def serve(path: Optional[str]) -> int:
+    from . import service
+
+    try:
+        service.serve(path)
+    except BlockingIOError:
+        print('ERROR: `robinhood serve` is already running.', file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def serve_reports(args: argparse.Namespace) -> int:
+    from . import report_server
+
+    try:
+        report_server.serve(args.host, args.port, max_workers=args.workers)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def verify_database(args: argparse.Namespace) -> int:
+    from .logic.verify import verify
+
+    mismatches = verify(
+        from_date=datetime.date.fromisoformat(args.from_date) if args.from_date else None,
+        repair=not args.dry_run,
+    )
+    for item in mismatches:
+        print(
+            f'{item.month.strftime("%Y-%m")}  {item.table:<24} '
+            f'{item.local.count:>6} local, {item.remote.count:>6} remote',
+        )
+
+    if not mismatches:
+        print('Everything matches.')
+    elif not args.dry_run:
+        print(f'Repaired {len(mismatches)} month(s).')
+
+    return 0
+
+
+def freeze(through: Optional[int]) -> int:
+    from . import cold_storage
+
+    try:
+        counts = cold_storage.freeze(through)
+    except BlockingIOError:
+        print(
+            'ERROR: Stop `robinhood sync --watch` and `robinhood serve` first.',
+            file=sys.stderr,
+        )
+        return 1
+
+    for year, count in sorted(counts.items()):
+        print(f'{year} {count:>8} rows')
+
+    if not counts:
+        print('Nothing to move.')
+
+    return 0
+
+
+def export_sales(args: argparse.Namespace) -> int:
+    from .logic import form8949
+
+    counts = form8949.export(
+        args.directory,
+        from_date=args.from_date,
+        to_date=args.to_date,
+        sync=args.sync,
+    )
+    for (year, term), count in sorted(counts.items()):
+        print(f'{year} {term:<6} {count:>8} sales')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
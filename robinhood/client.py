@@ -1,38 +1,100 @@
+import datetime
 import io
+import json
 import os
 import sys
+import time
 from contextlib import contextmanager
 from functools import lru_cache
 from getpass import getpass
+from typing import Any
+from typing import Dict
 from typing import Generator
-
-import pyotp
+from typing import Optional
+from typing import TYPE_CHECKING
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
 
 from .util import get_path_to
-from pyrh import dump_session
-from pyrh import load_session
-from pyrh import Robinhood
-from pyrh.exceptions import AuthenticationError
-from pyrh.exceptions import InvalidCacheFile
+
+if TYPE_CHECKING:
+    from pyrh import Robinhood
+
+try:
+    # Optional, but considerably faster at decoding large pages.
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+
+# Treat tokens that are about to expire as expired, so that we don't start a long sync
+# with credentials that lapse halfway through.
+SESSION_EXPIRY_MARGIN = datetime.timedelta(hours=1)
+
+# Set through `use_client`, to run our ETL logic against something other than Robinhood.
+_client_override: Optional[Any] = None
+
+
+def get_client() -> 'Robinhood':
+    if _client_override is not None:
+        return _client_override
+
+    # This allows us to point at a stand-in for the API (e.g. `robinhood.fake_server`).
+    api_url = os.environ.get('ROBINHOOD_API_URL')
+    if api_url:
+        return get_http_client(api_url)
+
+    return get_session_client()
+
+
+@contextmanager
+def use_client(client: Any) -> Generator[None, None, None]:
+    """
+    Temporarily swaps out the Robinhood client (e.g. for `robinhood.offline.OfflineClient`).
+    """
+    global _client_override
+
+    original = _client_override
+    try:
+        _client_override = client
+        yield
+    finally:
+        _client_override = original
 
 
 @lru_cache(maxsize=1)
-def get_client():
+def get_session_client() -> 'Robinhood':
+    # NOTE: pyrh pulls in requests and marshmallow, so we only pay for it when we actually
+    # need to talk to Robinhood.
+    from pyrh import load_session
+    from pyrh.exceptions import AuthenticationError
+    from pyrh.exceptions import InvalidCacheFile
+
+    path = get_path_to('session.json')
     try:
-        client = load_session(get_path_to('session.json'))
-        client.user()
+        client = load_session(path)
+        if not is_session_fresh(path):
+            # We can't vouch for this token locally, so ask the server (this will refresh
+            # the token, if possible).
+            client.user()
+            dump_session(client, path)
     except (AuthenticationError, InvalidCacheFile):
         email = os.environ.get('USERNAME') or input('Email: ')
         password = os.environ.get('PASSWORD') or getpass()
         mfa_secret = os.environ.get('MFA_SECRET') or getpass('MFA Secret: ')
 
         client = login(email, password, mfa_secret)
-        dump_session(client, get_path_to('session.json'))
+        dump_session(client, path)
 
     return client
 
 
-def login(email: str, password: str, mfa_secret: str) -> Robinhood:
+def login(email: str, password: str, mfa_secret: str) -> 'Robinhood':
+    import pyotp
+    from pyrh import Robinhood
+
     client = Robinhood(email, password)
     totp = pyotp.TOTP(mfa_secret)
 
@@ -45,6 +107,103 @@ def login(email: str, password: str, mfa_secret: str) -> Robinhood:
     return client
 
 
+def dump_session(client: 'Robinhood', path: str) -> None:
+    """
+    Saves the session, making sure that the token's expiry is recorded alongside it, so that
+    subsequent runs can check it without a network call.
+    """
+    import pyrh
+
+    pyrh.dump_session(client, path)
+
+    with open(path) as f:
+        data = json.load(f)
+
+    if not data.get('expires_at') and getattr(client, 'expires_at', None):
+        data['expires_at'] = client.expires_at.isoformat()
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=4)
+
+
+def get_session_expiry(path: str) -> Optional[datetime.datetime]:
+    """
+    :returns: when the cached OAuth2 token expires (in UTC), if known.
+    """
+    try:
+        with open(path) as f:
+            value = json.load(f).get('expires_at')
+    except (OSError, ValueError):
+        return None
+
+    if not value:
+        return None
+
+    try:
+        expiry = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    if not expiry.tzinfo:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+
+    return expiry
+
+
+def is_session_fresh(path: str) -> bool:
+    expiry = get_session_expiry(path)
+    if not expiry:
+        return False
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now + SESSION_EXPIRY_MARGIN < expiry
+
+
+@lru_cache(maxsize=None)
+def get_http_client(base_url: str) -> 'HTTPClient':
+    return HTTPClient(base_url)
+
+
+class HTTPClient:
+    """
+    An unauthenticated client with just enough of the `pyrh.Robinhood` interface for our ETL
+    logic to work. Requests for the Robinhood API are redirected to `base_url`.
+    """
+    # This talks to stand-ins, so what it fetches shouldn't end up in the payload archive.
+    offline = True
+
+    API_BASE = 'https://api.robinhood.com'
+
+    def __init__(self, base_url: str, retries: int = 5, timeout: float = 10) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.timeout = timeout
+
+    def get(self, url: Any, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        url = str(url)
+        if url.startswith(self.API_BASE):
+            url = self.base_url + url[len(self.API_BASE):]
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(params)
+
+        for attempt in range(self.retries + 1):
+            try:
+                with urlopen(url, timeout=self.timeout) as response:
+                    return _loads(response.read())
+            except HTTPError as e:
+                if e.code != 429 or attempt == self.retries:
+                    raise
+
+                time.sleep(float(e.headers.get('Retry-After') or 1))
+            except (ConnectionError, URLError):
+                if attempt == self.retries:
+                    raise
+
+                time.sleep(min(2 ** attempt * 0.1, 5))
+
+    def user(self) -> Any:
+        return self.get(f'{self.API_BASE}/user/')
+
+
 @contextmanager
 def mock_stdin(value: str) -> Generator[None, None, None]:
     try:
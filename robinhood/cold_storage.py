@@ -0,0 +1,396 @@
+"""
+Trades (and events) from closed years are moved out of the database, into one read-only
+SQLite file per year next to it:
+
+    database.sqlite3          the working database, which the sync writes to
+    database.2019.sqlite3
+    database.2020.sqlite3
+    ...
+
+so that vacuuming, backing up and opening the working database don't get slower with every
+year traded. Each year's file is compacted and indexed once, when it's written.
+
+Year files are attached (read-only) to every connection, and each archived table is read
+through a temporary view of the same name, which is the UNION of the working database and
+every year. Each year's part of the view is bounded by that year's dates, so that queries
+for a date range only ever seek into (rather than scan) the other years' date indexes.
+
+Writes always go to the working database (see `qualify_writes`), and rows in year files can't
+be changed. This is why `robinhood verify` only checks what's still in the working database.
+
+Usage: robinhood freeze [--through YEAR]
+"""
+import datetime
+import glob
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from urllib.parse import quote
+
+
+class ArchivedTable(NamedTuple):
+    # Rows are moved to the year of this column. If None, rows follow their strategy.
+    date_column: Optional[str]
+
+    # Year files are never written to again, so they're indexed for how they're read.
+    indexes: Tuple[str, ...]
+
+
+ARCHIVED_TABLES = {
+    'option_expiration_event': ArchivedTable('date', ('date', 'option_id')),
+    'option_strategy': ArchivedTable('date', ('date',)),
+    'option_strategy_legs': ArchivedTable(None, ('strategy_id', 'trade_id')),
+    'option_trade': ArchivedTable('date', ('date', 'option_id')),
+    'stock_trade': ArchivedTable('date', ('date', 'instrument_id', 'name')),
+}
+
+# Matches writes to archived tables, so that they can be pointed at the working database.
+WRITE_PATTERN = re.compile(
+    r'^(INSERT INTO|UPDATE|DELETE FROM) ({})\b'.format('|'.join(ARCHIVED_TABLES)),
+)
+
+
+def get_path(year: int, path: Optional[str] = None) -> str:
+    """
+    :param path: to the working database. Defaults to ours.
+    """
+    root, extension = os.path.splitext(path or _get_database_path())
+    return f'{root}.{year}{extension}'
+
+
+def get_years(path: Optional[str] = None) -> List[int]:
+    """
+    :returns: years that have been moved out of the working database, in order.
+    """
+    pattern = re.compile(r'\.(\d{4})$')
+
+    output = []
+    for filename in glob.glob(get_path(9999, path).replace('9999', '[0-9]' * 4)):
+        match = pattern.search(os.path.splitext(filename)[0])
+        if match:
+            output.append(int(match.group(1)))
+
+    return sorted(output)
+
+
+def get_hot_start() -> Optional[datetime.date]:
+    """
+    :returns: the first date that's (entirely) in the working database, if any years have
+        been moved out of it.
+    """
+    years = get_years()
+    if not years:
+        return None
+
+    return datetime.date(years[-1] + 1, 1, 1)
+
+
+def attach(dbapi_connection: sqlite3.Connection, connection_record: Any) -> None:
+    """
+    Called for every new connection to the working database.
+    """
+    years = tuple(get_years())
+    if not years:
+        return
+
+    for year in years:
+        dbapi_connection.execute(
+            f'ATTACH DATABASE ? AS year_{year}',
+            (_get_uri(get_path(year)),),
+        )
+
+    for statement in _get_views(years):
+        dbapi_connection.execute(statement)
+
+    connection_record.info['cold_storage'] = True
+
+
+def qualify_writes(
+    connection: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> Tuple[str, Any]:
+    """
+    Views shadow the archived tables, so writes to them need to name the working database.
+    """
+    if connection.info.get('cold_storage'):
+        statement = WRITE_PATTERN.sub(r'\1 main.\2', statement)
+
+    return statement, parameters
+
+
+def freeze(through: Optional[int] = None) -> Dict[int, int]:
+    """
+    Moves closed years out of the working database. If this is interrupted, run it again.
+
+    NOTE: Since every connection attaches the year files that exist when it's opened, this
+    needs `robinhood sync --watch` and `robinhood serve` to be stopped (and checks that they
+    are, through their locks).
+
+    :param through: the last year to move. Defaults to last year.
+    :raises: BlockingIOError, if another process is using the database.
+    :returns: year => number of rows moved.
+    """
+    from . import database
+
+    if through is None:
+        through = datetime.date.today().year - 1
+
+    database.session.setup()
+    with ExitStack() as stack:
+        for name in ('sync', 'service', 'watch'):
+            stack.enter_context(database.lock(name, blocking=False))
+
+        # Don't hold on to connections that are attached to the files we're replacing.
+        _disconnect()
+
+        output = {}
+        connection = sqlite3.connect(
+            _get_uri(database.ENGINE_URI, readonly=False),
+            uri=True,
+            isolation_level=None,
+        )
+        try:
+            for year in _get_closed_years(connection, through):
+                output[year] = _freeze_year(connection, year)
+
+            if output:
+                connection.execute('VACUUM')
+        finally:
+            connection.close()
+
+    _get_views.cache_clear()
+    return output
+
+
+@contextmanager
+def set_aside() -> Generator[None, None, None]:
+    """
+    Takes every year file out of the database, e.g. to rebuild it from scratch. Since they
+    can't be made again, they're only deleted once this finishes, and are put back if it
+    fails. If this is killed, they're left next to where they were, as `*.aside`.
+    """
+    _disconnect()
+
+    paths = [get_path(year) for year in get_years()]
+    for path in paths:
+        os.replace(path, f'{path}.aside')
+    _get_views.cache_clear()
+
+    try:
+        yield
+    except BaseException:
+        _disconnect()
+        for path in paths:
+            os.replace(f'{path}.aside', path)
+        raise
+    finally:
+        _get_views.cache_clear()
+
+    for path in paths:
+        os.remove(f'{path}.aside')
+
+
+def _get_closed_years(connection: sqlite3.Connection, through: int) -> List[int]:
+    years = set()
+    for table, info in ARCHIVED_TABLES.items():
+        if not info.date_column:
+            continue
+
+        years.update(
+            int(row[0])
+            for row in connection.execute(
+                f"SELECT DISTINCT strftime('%Y', {info.date_column}) FROM main.{table} "
+                f'WHERE {info.date_column} < ? AND id < (SELECT max(id) FROM main.{table})',
+                (f'{through + 1}-01-01',),
+            )
+        )
+
+    return sorted(years)
+
+
+def _freeze_year(connection: sqlite3.Connection, year: int) -> int:
+    """
+    :returns: number of rows moved.
+    """
+    from .models.change_log import TRIGGERS
+
+    path = get_path(year)
+    temporary = f'{path}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    # First, write (and compact) the new file, including whatever was already in it.
+    connection.execute('ATTACH DATABASE ? AS frozen', (temporary,))
+    if os.path.exists(path):
+        connection.execute('ATTACH DATABASE ? AS previous', (_get_uri(path),))
+
+    count = 0
+    try:
+        connection.execute('BEGIN')
+        for table, info in ARCHIVED_TABLES.items():
+            columns = _get_columns(connection, 'main', table)
+            connection.execute(_get_schema(connection, table))
+            if os.path.exists(path):
+                previous = [
+                    column
+                    for column in columns
+                    if column in _get_columns(connection, 'previous', table)
+                ]
+                connection.execute(
+                    f'INSERT INTO frozen.{table} ({", ".join(previous)}) '
+                    f'SELECT {", ".join(previous)} FROM previous.{table}',
+                )
+
+            # NOTE: SQLite gives new rows one more than the highest ID in the table, so the
+            # latest row always stays behind. Otherwise, its ID could be given out again.
+            if info.date_column:
+                condition = (
+                    f"{info.date_column} >= '{year}-01-01' "
+                    f"AND {info.date_column} < '{year + 1}-01-01'"
+                )
+            else:
+                condition = 'strategy_id IN (SELECT id FROM frozen.option_strategy)'
+
+            count += connection.execute(
+                f'INSERT OR IGNORE INTO frozen.{table} ({", ".join(columns)}) '
+                f'SELECT {", ".join(columns)} FROM main.{table} '
+                f'WHERE {condition} AND id < (SELECT max(id) FROM main.{table})',
+            ).rowcount
+
+            for column in info.indexes:
+                connection.execute(
+                    f'CREATE INDEX frozen.ix_{table}_{column} ON {table} ({column})',
+                )
+
+        connection.execute('COMMIT')
+        connection.execute('ANALYZE frozen')
+        connection.execute('VACUUM frozen')
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.execute('DETACH DATABASE frozen')
+        if os.path.exists(path):
+            connection.execute('DETACH DATABASE previous')
+
+    os.chmod(temporary, 0o444)
+    os.replace(temporary, path)
+
+    # Then, remove what's been moved from the working database. Moving rows between files
+    # isn't a change to what they say, so this stays out of the change log.
+    connection.execute('ATTACH DATABASE ? AS frozen', (_get_uri(path),))
+    try:
+        connection.execute('BEGIN')
+        for table in reversed(list(ARCHIVED_TABLES)):
+            trigger = f'change_log_{table}_delete'
+            if trigger in TRIGGERS:
+                connection.execute(f'DROP TRIGGER IF EXISTS main.{trigger}')
+
+            connection.execute(
+                f'DELETE FROM main.{table} WHERE id IN (SELECT id FROM frozen.{table})',
+            )
+
+            if trigger in TRIGGERS:
+                connection.execute(TRIGGERS[trigger])
+
+        connection.execute('COMMIT')
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.execute('DETACH DATABASE frozen')
+
+    return count
+
+
+@lru_cache(maxsize=4)
+def _get_views(years: Tuple[int, ...]) -> List[str]:
+    from .database import Base
+
+    output = []
+    for table, info in ARCHIVED_TABLES.items():
+        columns = [column.name for column in Base.metadata.tables[table].columns]
+        selects = [f'SELECT {", ".join(columns)} FROM main.{table}']
+        for year in years:
+            connection = sqlite3.connect(_get_uri(get_path(year)), uri=True)
+            try:
+                existing = _get_columns(connection, 'main', table)
+            finally:
+                connection.close()
+
+            # Columns that were added after the year was frozen are empty.
+            select = 'SELECT {} FROM year_{}.{}'.format(
+                ', '.join(
+                    column if column in existing else f'NULL AS {column}'
+                    for column in columns
+                ),
+                year,
+                table,
+            )
+            if info.date_column:
+                select += (
+                    f" WHERE {info.date_column} >= '{year}-01-01' "
+                    f"AND {info.date_column} < '{year + 1}-01-01'"
+                )
+
+            selects.append(select)
+
+        output.append(f'CREATE TEMP VIEW {table} AS ' + ' UNION ALL '.join(selects))
+
+    return output
+
+
+def _disconnect() -> None:
+    """
+    Connections attach the year files that exist when they're opened, so this closes them.
+    """
+    from . import database
+
+    database.session.remove()
+    database.session.get_bind().dispose()
+
+
+def _get_schema(connection: sqlite3.Connection, table: str) -> str:
+    """
+    :returns: the statement to create `table` in the frozen database, as it is in ours.
+    """
+    sql = connection.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+        (table,),
+    ).fetchone()[0]
+
+    return re.sub(r'^CREATE TABLE "?\w+"?', f'CREATE TABLE frozen.{table}', sql)
+
+
+def _get_columns(connection: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [row[1] for row in connection.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _get_uri(path: str, readonly: bool = True) -> str:
+    uri = f'file:{quote(os.path.abspath(path))}'
+    if readonly:
+        uri += '?mode=ro'
+
+    return uri
+
+
+def _get_database_path() -> str:
+    from .database import ENGINE_URI
+
+    return ENGINE_URI
@@ -1,16 +1,26 @@
+import os
+import threading
 from abc import abstractproperty
 from contextlib import contextmanager
+from contextlib import ExitStack
 from enum import Enum
 from functools import lru_cache
 from typing import Any
 from typing import Dict
 from typing import Generator
+from typing import Optional
 from typing import Tuple
 from typing import Type
+from urllib.parse import quote
 
 from sqlalchemy import Column
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
 from sqlalchemy import Integer
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import sessionmaker
@@ -18,9 +28,16 @@ from sqlalchemy.orm.scoping import ScopedSession
 from sqlalchemy.orm.session import Session
 from sqlalchemy.types import TypeDecorator
 
+from . import cold_storage
+from . import metrics
+from .query_profiler import QueryProfiler
 from .util import get_path_to
 
 
+# Bump this whenever the models change, so that existing databases pick up the new tables.
+SCHEMA_VERSION = 8
+
+
 class BaseMeta(DeclarativeMeta):
     """
     Adding a little magic for DRYer code.
@@ -101,23 +118,205 @@ class scoped_session(ScopedSession):
 
     @lru_cache(maxsize=1)
     def setup(self) -> None:
+        import robinhood.models.change_log  # noqa: F401
+        import robinhood.models.instrument  # noqa: F401
         import robinhood.models.option      # noqa: F401
+        import robinhood.models.rollup      # noqa: F401
         import robinhood.models.stock       # noqa: F401
+        from .migrations import migrate
+        from .migrations import prepare
 
         # Since we're using an on-disk sqlite3 database (as compared to a database server),
-        # let's create the tables every time to make sure all tables are created for our
-        # operations.
-        Base.metadata.bind = self.get_bind()
-        Base.metadata.create_all()
+        # we need to make sure all tables are created for our operations. However, this is
+        # only necessary when the models have changed since the database was last stamped.
+        engine = self.get_bind()
+        Base.metadata.bind = engine
+        version = get_schema_version(engine)
+        if version != SCHEMA_VERSION:
+            Base.metadata.create_all()
+
+            # `create_all` skips tables that already exist, so new columns (and indexes) on
+            # them need to be created separately.
+            add_missing_columns(engine)
+            prepare(version)
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=engine, checkfirst=True)
+
+            migrate(version)
+            set_schema_version(engine, SCHEMA_VERSION)
+
+
+def get_schema_version(engine: Engine) -> Optional[int]:
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text('SELECT version FROM schema_version')).scalar()
+    except OperationalError:
+        # The table doesn't exist yet.
+        return None
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """
+    SQLite can only add columns to existing tables (without rebuilding them) if they're
+    nullable, so new columns on existing models need to be too.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                if not column.nullable:
+                    raise ValueError(
+                        f'Unable to add non-nullable column {table.name}.{column.name} '
+                        'to an existing table.',
+                    )
+
+                connection.execute(
+                    text(
+                        f'ALTER TABLE main.{table.name} ADD COLUMN {column.name} '
+                        f'{column.type.compile(dialect=engine.dialect)}',
+                    ),
+                )
 
 
-# ENGINE_URI = ':memory:'
-ENGINE_URI = get_path_to('database.sqlite3')
+def set_schema_version(engine: Engine, version: int) -> None:
+    with engine.begin() as connection:
+        connection.execute(
+            text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'),
+        )
+        connection.execute(text('DELETE FROM schema_version'))
+        connection.execute(
+            text('INSERT INTO schema_version (version) VALUES (:version)'),
+            {'version': version},
+        )
+
+
+def add_listeners(engine: Engine) -> None:
+    # Closed years are read from their own files (see `robinhood.cold_storage`).
+    event.listen(engine, 'connect', cold_storage.attach)
+    event.listen(engine, 'before_cursor_execute', cold_storage.qualify_writes, retval=True)
+
+
+# NOTE: For a copy of the database in memory, see `in_memory`.
+ENGINE_URI = os.environ.get('ROBINHOOD_DATABASE') or get_path_to('database.sqlite3')
 session = scoped_session(
     sessionmaker(
-        bind=create_engine(f'sqlite+pysqlite:///{ENGINE_URI}'),
+        # URI filenames, so that closed years can be attached read-only.
+        bind=create_engine(f'sqlite+pysqlite:///file:{quote(ENGINE_URI)}?uri=true'),
     ),
 )
+add_listeners(session.get_bind())
+event.listen(session, 'after_commit', lambda _: metrics.increment('commits_total'))
+
+
+# Locks (see `lock`) that the current thread holds.
+_held_locks = threading.local()
+
+
+@contextmanager
+def lock(name: str = 'sync', blocking: bool = True) -> Generator[None, None, None]:
+    """
+    An inter-process lock (next to the database file), so that only one process writes to
+    the database at a time. For example, the `robinhood sync --watch` daemon and a notebook.
+
+    Threads can take a lock they already hold again, e.g. to call `sync_all` while holding
+    the sync lock.
+
+    :raises: BlockingIOError if not `blocking`, and another process holds the lock.
+    """
+    # NOTE: This is POSIX only, so we only pay for it when we actually need it.
+    import fcntl
+
+    path = f'{ENGINE_URI}.{name}.lock'
+    held = _held_locks.__dict__.setdefault('paths', set())
+    if path in held:
+        yield
+        return
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def in_memory(mirror: bool = False) -> Generator[None, None, None]:
+    """
+    Answers every query from a copy of the database in memory, e.g. for notebooks that run
+    many reports. They then never wait on the disk (or on a sync that's writing to it), and
+    see the database as it was when this started, throughout.
+
+    :param mirror: whether changes are copied back to the database, whenever the session
+        commits. Otherwise, they're discarded at the end. Since this overwrites the database,
+        nothing else can write to it in the meantime: this holds the sync lock throughout.
+    :raises: BlockingIOError if `mirror`, and another process holds the sync lock.
+    """
+    import sqlite3
+    from sqlalchemy.pool import StaticPool
+
+    # Make sure the database is up-to-date with the models, before we copy it.
+    session.setup()
+
+    with ExitStack() as stack:
+        if mirror:
+            stack.enter_context(lock(blocking=False))
+
+        disk = sqlite3.connect(f'file:{quote(ENGINE_URI)}', uri=True, check_same_thread=False)
+        stack.callback(disk.close)
+
+        # NOTE: This is a URI too, so that closed years can be attached to it.
+        memory = sqlite3.connect('file::memory:', uri=True, check_same_thread=False)
+        stack.callback(memory.close)
+
+        # This copies a consistent snapshot, even if another process is writing to it.
+        disk.backup(memory)
+
+        # There's only one in-memory database per connection, so every session shares it.
+        engine = create_engine(
+            'sqlite+pysqlite://',
+            creator=lambda: memory,
+            poolclass=StaticPool,
+        )
+        add_listeners(engine)
+
+        def copy_back(_: Session) -> None:
+            memory.backup(disk)
+
+        if mirror:
+            event.listen(session, 'after_commit', copy_back)
+            stack.callback(event.remove, session, 'after_commit', copy_back)
+
+        original = session.get_bind()
+        session.remove()
+        session.configure(bind=engine)
+        try:
+            yield
+        finally:
+            session.remove()
+            session.configure(bind=original)
+            engine.dispose()
+
+
+@contextmanager
+def profile_queries(**kwargs: Any) -> Generator[QueryProfiler, None, None]:
+    """
+    Records every statement executed within this context.
+    See `robinhood.query_profiler.QueryProfiler` for arguments.
+    """
+    profiler = QueryProfiler(**kwargs)
+    profiler.attach(session.get_bind())
+    try:
+        yield profiler
+    finally:
+        profiler.detach()
 
 
 class SerializedEnum(TypeDecorator):
@@ -0,0 +1,226 @@
+"""
+A local stand-in for the Robinhood API, so that we can load-test syncing without a network
+connection (or a Robinhood account).
+
+Usage: python -m robinhood.fake_server [--orders N] [--port PORT] [--latency SECONDS] ...
+
+Then, point the client at it:
+
+    $ export ROBINHOOD_API_URL=http://127.0.0.1:<PORT>
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import DefaultDict
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from .offline import OfflineClient
+from .util import split_api_url
+
+
+class Faults(NamedTuple):
+    # Seconds added to every response, and how much (uniformly) it can vary by.
+    latency: float = 0
+    jitter: float = 0
+
+    # Requests per second before we start responding with `429 Too Many Requests`.
+    max_requests_per_second: Optional[float] = None
+
+    # Probability that a connection is closed without a response.
+    drop_rate: float = 0
+
+    # Simulates orders being placed while we're paginating: after this many pages of a
+    # feed have been served, `insertions` are added to the front of it (once).
+    insert_after_pages: Optional[int] = None
+    insertions: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        data: OfflineClient,
+        faults: Optional[Faults] = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param data: what to serve. e.g. `robinhood.synthetic.generate().get_client()`
+        :param port: 0 picks a free port.
+        """
+        super().__init__((host, port), RequestHandler)
+
+        self.data = data
+        self.data.base_url = self.url
+        self.faults = faults or Faults()
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.request_times: List[float] = []
+        self.pages_served: DefaultDict[str, int] = defaultdict(int)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def should_throttle(self) -> bool:
+        limit = self.faults.max_requests_per_second
+        if not limit:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            self.request_times = [value for value in self.request_times if now - value < 1]
+            if len(self.request_times) >= limit:
+                return True
+
+            self.request_times.append(now)
+            return False
+
+    def should_drop(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.faults.drop_rate
+
+    def get_delay(self) -> float:
+        with self.lock:
+            return max(
+                0,
+                self.faults.latency + self.rng.uniform(-1, 1) * self.faults.jitter,
+            )
+
+    def on_page_served(self, feed: str) -> None:
+        with self.lock:
+            self.pages_served[feed] += 1
+            if (
+                self.faults.insert_after_pages is None
+                or self.pages_served[feed] != self.faults.insert_after_pages
+            ):
+                return
+
+            items = (self.faults.insertions or {}).get(feed)
+            if items:
+                self.data.feeds[feed][:0] = items
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server: FakeServer
+
+    def do_GET(self) -> None:
+        if self.server.should_drop():
+            # Simulates the connection being reset.
+            self.close_connection = True
+            return
+
+        delay = self.server.get_delay()
+        if delay:
+            time.sleep(delay)
+
+        if self.server.should_throttle():
+            self.send_json(429, {'detail': 'Request was throttled.'}, {'Retry-After': '1'})
+            return
+
+        try:
+            data = self.server.data.get(f'{self.server.url}{self.path}')
+        except LookupError as e:
+            self.send_json(404, {'detail': str(e)})
+            return
+
+        feed, uuid = split_api_url(self.path)
+        if not uuid and 'results' in data:
+            self.server.on_page_served(feed)
+
+        self.send_json(200, data)
+
+    def send_json(
+        self,
+        status: int,
+        data: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # This is noisy, and slows down load tests.
+        pass
+
+
+@contextmanager
+def serve(
+    data: OfflineClient,
+    faults: Optional[Faults] = None,
+    port: int = 0,
+) -> Generator[FakeServer, None, None]:
+    """
+    Runs the server in a background thread, for the duration of the context.
+    """
+    server = FakeServer(data, faults=faults, port=port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def main() -> None:
+    from . import synthetic
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000, help='Defaults to %(default)s.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8000, help='Defaults to %(default)s.')
+    parser.add_argument('--page-size', type=int, default=100, help='Defaults to %(default)s.')
+    parser.add_argument('--latency', type=float, default=0, help='In seconds.')
+    parser.add_argument('--jitter', type=float, default=0, help='In seconds.')
+    parser.add_argument('--max-requests-per-second', type=float)
+    parser.add_argument('--drop-rate', type=float, default=0)
+    args = parser.parse_args()
+
+    history = synthetic.generate(args.orders, seed=args.seed)
+    server = FakeServer(
+        history.get_client(page_size=args.page_size),
+        faults=Faults(
+            latency=args.latency,
+            jitter=args.jitter,
+            max_requests_per_second=args.max_requests_per_second,
+            drop_rate=args.drop_rate,
+        ),
+        port=args.port,
+        seed=args.seed,
+    )
+
+    print(f'Serving {args.orders} synthetic orders on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""
+An optional analytical layer over the database, in DuckDB. Rather than building DataFrames row
+by row from ORM objects and grouping them in pandas, reports are computed in (vectorized) SQL
+over the realized sales that the rollup keeps (see `robinhood.logic.rollup`), and come back as
+Arrow-backed DataFrames.
+
+This needs `duckdb` and `pyarrow`:
+
+    $ pip install duckdb pyarrow
+
+The database is attached read-only, and exposed through these views:
+
+    realized_sales  one row per lot (or part of a lot) sold, with its instrument
+    trades          every stock trade and options leg, with its instrument
+
+Alternatively, these can be exported to (and queried from) Parquet files, e.g. to share them
+without the rest of the database:
+
+    analytics.export_parquet('exports/')
+    analytics.get_rollup(connection=analytics.connect(parquet='exports/'))
+"""
+import datetime
+import os
+from functools import lru_cache
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+
+import pandas as pd
+
+from .. import cold_storage
+from .. import metrics
+from .dataframe.trades import _parse_date
+from .dataframe.trades import OPTION_MULTIPLIER
+from .rollup import update
+from .trades import sync_all
+
+if TYPE_CHECKING:
+    import duckdb
+
+
+# Dimensions that reports can be grouped by (the same as `dataframe.rollup`'s).
+DIMENSIONS = {
+    'Month': "CAST(date_trunc('month', date_sold) AS DATE)",
+    'Type': "CASE WHEN is_option THEN 'Options' ELSE 'Stocks' END",
+    'Term': "CASE WHEN is_long_term THEN 'Long' ELSE 'Short' END",
+    'Underlying': 'underlying',
+}
+
+# NOTE: SQLite doesn't enforce column types (e.g. sides are stored as text, in an integer
+# column), so everything is read as text, and cast here.
+VIEWS = {
+    'realized_sales': """
+        SELECT
+            CAST(s.id AS BIGINT) AS id,
+            CAST(s.instrument_id AS BIGINT) AS instrument_id,
+            i.name,
+            i.underlying,
+            CAST(CAST(i.is_option AS INTEGER) AS BOOLEAN) AS is_option,
+            CAST(s.date_bought AS DATE) AS date_bought,
+            CAST(s.price_bought AS DOUBLE) AS price_bought,
+            CAST(s.date_sold AS DATE) AS date_sold,
+            CAST(s.price_sold AS DOUBLE) AS price_sold,
+            CAST(s.quantity AS DOUBLE) AS quantity,
+            CAST(s.earnings AS DOUBLE) AS earnings,
+            -- Held past the anniversary of the purchase (see `rollup.is_long_term`).
+            CAST(s.date_bought AS DATE) + INTERVAL 1 YEAR < CAST(s.date_sold AS DATE)
+                AS is_long_term
+        FROM db.realized_sale s
+        JOIN db.instrument i ON i.id = s.instrument_id
+    """,
+    'trades': f"""
+        SELECT
+            CAST(t.id AS BIGINT) AS id,
+            CAST(t.instrument_id AS BIGINT) AS instrument_id,
+            i.name,
+            i.underlying,
+            FALSE AS is_option,
+            t.side,
+            CAST(t.date AS TIMESTAMP) AS date,
+            CAST(t.price AS DOUBLE) AS price,
+            CAST(t.quantity AS DOUBLE) AS quantity,
+            CAST(t.price AS DOUBLE) * CAST(t.quantity AS DOUBLE) AS amount
+        FROM stock_trade t
+        JOIN db.instrument i ON i.id = t.instrument_id
+        UNION ALL
+        SELECT
+            CAST(t.id AS BIGINT),
+            CAST(o.instrument_id AS BIGINT),
+            i.name,
+            i.underlying,
+            TRUE,
+            t.side,
+            CAST(t.date AS TIMESTAMP),
+            CAST(t.price AS DOUBLE),
+            CAST(t.quantity AS DOUBLE),
+            CAST(t.price AS DOUBLE) * CAST(t.quantity AS DOUBLE) * {OPTION_MULTIPLIER}
+        FROM option_trade t
+        JOIN db.option o ON o.id = t.option_id
+        JOIN db.instrument i ON i.id = o.instrument_id
+    """,
+}
+
+
+def connect(
+    path: Optional[str] = None,
+    parquet: Optional[str] = None,
+) -> 'duckdb.DuckDBPyConnection':
+    """
+    :param path: to the SQLite database. Defaults to ours.
+    :param parquet: if provided, views are read from the Parquet files in this directory
+        (see `export_parquet`), rather than the database.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError('This needs DuckDB (and pyarrow): `pip install duckdb pyarrow`.')
+
+    connection = duckdb.connect()
+    if parquet:
+        for name in VIEWS:
+            source = _quote(_get_file(parquet, name))
+            connection.execute(f'CREATE VIEW {name} AS SELECT * FROM read_parquet({source})')
+
+        return connection
+
+    if not path:
+        from ..database import ENGINE_URI
+        path = ENGINE_URI
+
+    connection.execute('INSTALL sqlite')
+    connection.execute('LOAD sqlite')
+    connection.execute('SET GLOBAL sqlite_all_varchar = true')
+    connection.execute(f'ATTACH {_quote(path)} AS db (TYPE sqlite, READ_ONLY)')
+
+    # Trades from closed years are in their own files (see `robinhood.cold_storage`).
+    years = cold_storage.get_years(path)
+    for year in years:
+        connection.execute(
+            f'ATTACH {_quote(cold_storage.get_path(year, path))} AS db_{year} '
+            '(TYPE sqlite, READ_ONLY)',
+        )
+    for table in ('option_trade', 'stock_trade'):
+        connection.execute(
+            f'CREATE VIEW {table} AS '
+            + ' UNION ALL BY NAME '.join(
+                f'SELECT * FROM {schema}.{table}'
+                for schema in ['db'] + [f'db_{year}' for year in years]
+            ),
+        )
+
+    for name, query in VIEWS.items():
+        connection.execute(f'CREATE VIEW {name} AS {query}')
+
+    return connection
+
+
+@lru_cache(maxsize=1)
+def get_connection() -> 'duckdb.DuckDBPyConnection':
+    """
+    :returns: a connection to our database, which is shared by default.
+    """
+    return connect()
+
+
+def export_parquet(
+    directory: str,
+    connection: Optional['duckdb.DuckDBPyConnection'] = None,
+) -> None:
+    """
+    Writes each view to `<directory>/<view>.parquet`.
+    """
+    connection = connection or get_connection()
+
+    os.makedirs(directory, exist_ok=True)
+    for name in VIEWS:
+        connection.execute(
+            f'COPY (SELECT * FROM {name}) TO {_quote(_get_file(directory, name))} '
+            '(FORMAT parquet)',
+        )
+
+
+def get_sales(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    is_option: Optional[bool] = None,
+    underlying: Optional[str] = None,
+    sync: bool = True,
+    connection: Optional['duckdb.DuckDBPyConnection'] = None,
+) -> pd.DataFrame:
+    """
+    Like `dataframe.trades.get`, but ordered by when (and what) was sold.
+
+    :param from_date: YYYY-MM-DD format. Only sales on (or after) this date are included.
+    :param to_date: YYYY-MM-DD format. Likewise, only sales on (or before) this date.
+    """
+    where, params = _get_filters(from_date, to_date, is_option, underlying)
+    with metrics.timer('report_seconds', report='analytics.sales'):
+        _refresh(to_date, sync, connection)
+        return _execute(
+            connection,
+            f"""
+            SELECT
+                name AS "Name",
+                underlying AS "Underlying",
+                is_option AS "Is Option",
+                date_bought AS "Date Bought",
+                round(price_bought, 2) AS "Price Bought",
+                date_sold AS "Date Sold",
+                round(price_sold, 2) AS "Price Sold",
+                CAST(trunc(quantity) AS BIGINT) AS "Quantity",
+                round(earnings, 2) AS "Earnings"
+            FROM realized_sales
+            {where}
+            ORDER BY date_sold, name, date_bought, id
+            """,
+            params,
+        )
+
+
+def get_rollup(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    by: Sequence[str] = ('Month', 'Type', 'Term', 'Underlying'),
+    is_option: Optional[bool] = None,
+    underlying: Optional[str] = None,
+    sync: bool = True,
+    connection: Optional['duckdb.DuckDBPyConnection'] = None,
+) -> pd.DataFrame:
+    """
+    Like `dataframe.rollup.get`, except that dates filter individual sales, rather than the
+    months they're in.
+
+    :param by: any of `DIMENSIONS`, to group by.
+    :returns: Earnings, Count and Volume, indexed by `by`.
+    """
+    where, params = _get_filters(from_date, to_date, is_option, underlying)
+    columns = [f'{DIMENSIONS[name]} AS "{name}"' for name in by]
+    group_by = ''
+    if by:
+        positions = ', '.join(str(index + 1) for index in range(len(by)))
+        group_by = f'GROUP BY {positions} ORDER BY {positions}'
+
+    with metrics.timer('report_seconds', report='analytics.rollup'):
+        _refresh(to_date, sync, connection)
+        df = _execute(
+            connection,
+            f"""
+            SELECT
+                {''.join(f'{column}, ' for column in columns)}
+                round(sum(earnings), 2) AS "Earnings",
+                count(*) AS "Count",
+                sum(quantity) AS "Volume"
+            FROM realized_sales
+            {where}
+            {group_by}
+            """,
+            params,
+        )
+
+    if by:
+        df = df.set_index(list(by))
+
+    return df
+
+
+def get_cumulative_earnings(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    by: Sequence[str] = ('Type',),
+    is_option: Optional[bool] = None,
+    underlying: Optional[str] = None,
+    sync: bool = True,
+    connection: Optional['duckdb.DuckDBPyConnection'] = None,
+) -> pd.DataFrame:
+    """
+    :param by: any of `DIMENSIONS` (other than Month), for separate running totals.
+    :returns: Earnings per month, and the running total (Cumulative Earnings) since
+        `from_date`, indexed by `by` and Month.
+    """
+    if 'Month' in by:
+        raise ValueError('Cumulative earnings are already per month.')
+
+    where, params = _get_filters(from_date, to_date, is_option, underlying)
+    keys = [*by, 'Month']
+    columns = ', '.join(f'{DIMENSIONS[name]} AS "{name}"' for name in keys)
+    positions = ', '.join(str(index + 1) for index in range(len(keys)))
+    partition = ''
+    if by:
+        partition = 'PARTITION BY ' + ', '.join(f'"{name}"' for name in by)
+
+    with metrics.timer('report_seconds', report='analytics.cumulative_earnings'):
+        _refresh(to_date, sync, connection)
+        df = _execute(
+            connection,
+            f"""
+            SELECT
+                *,
+                round(
+                    sum("Earnings") OVER ({partition} ORDER BY "Month"),
+                    2
+                ) AS "Cumulative Earnings"
+            FROM (
+                SELECT {columns}, sum(earnings) AS "Earnings"
+                FROM realized_sales
+                {where}
+                GROUP BY {positions}
+            )
+            ORDER BY {positions}
+            """,
+            params,
+        )
+
+    df['Earnings'] = df['Earnings'].round(2)
+    return df.set_index(keys)
+
+
+def _refresh(
+    to_date: Optional[Union[datetime.date, str]],
+    sync: bool,
+    connection: Optional['duckdb.DuckDBPyConnection'],
+) -> None:
+    if connection:
+        # This might not even be our database (or not a database at all, for Parquet).
+        return
+
+    # First, make sure your data is up-to-date.
+    if sync:
+        sync_all(_parse_date(to_date))
+
+    # Realized sales are maintained by the rollup.
+    update()
+
+
+def _get_filters(
+    from_date: Optional[Union[datetime.date, str]],
+    to_date: Optional[Union[datetime.date, str]],
+    is_option: Optional[bool],
+    underlying: Optional[str],
+) -> Tuple[str, List[Any]]:
+    """
+    :returns: WHERE clause (if any), and its parameters.
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    from_date = _parse_date(from_date)
+    if from_date:
+        conditions.append('date_sold >= ?')
+        params.append(from_date)
+
+    to_date = _parse_date(to_date)
+    if to_date:
+        conditions.append('date_sold <= ?')
+        params.append(to_date)
+
+    if is_option is not None:
+        conditions.append('is_option = ?')
+        params.append(is_option)
+
+    if underlying:
+        conditions.append('underlying = ?')
+        params.append(underlying)
+
+    if not conditions:
+        return '', params
+
+    return 'WHERE ' + ' AND '.join(conditions), params
+
+
+def _execute(
+    connection: Optional['duckdb.DuckDBPyConnection'],
+    query: str,
+    params: List[Any],
+) -> pd.DataFrame:
+    connection = connection or get_connection()
+    return (
+        connection.execute(query, params)
+        .fetch_arrow_table()
+        .to_pandas(types_mapper=pd.ArrowDtype)
+    )
+
+
+def _get_file(directory: str, name: str) -> str:
+    return os.path.join(directory, f'{name}.parquet')
+
+
+def _quote(value: str) -> str:
+    return "'{}'".format(value.replace("'", "''"))
@@ -0,0 +1,83 @@
+"""
+A single feed of what has changed in the database, for derived data to catch up from.
+
+Every insert, update and delete on the tables that reports are derived from is appended to
+`change_log` by SQLite triggers, in the same transaction as the change itself (see
+`robinhood.models.change_log`). Since SQLite only has one writer at a time, sequence numbers
+become visible in order: a consumer that has applied everything up to N never misses a
+change by reading after N. This includes backdated rows (e.g. stock splits, or orders filled
+after the fact), and rows that `robinhood verify` repairs.
+
+Consumers keep track of the last sequence number they've applied, e.g.
+
+    until = change_log.get_sequence()
+    for batch in change_log.iter_changes(since, until):
+        ...
+    since = until
+"""
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+
+from sqlalchemy.sql.expression import func
+
+from .. import database
+from ..models.change_log import ChangeLog
+
+
+BATCH_SIZE = 1000
+
+
+def get_sequence() -> int:
+    """
+    :returns: the sequence number of the latest change (or 0, if there are none).
+    """
+    return database.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+
+def iter_changes(
+    since: int,
+    until: Optional[int] = None,
+    tables: Optional[Iterable[str]] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[List[ChangeLog]]:
+    """
+    :param since: sequence number of the last change that was already applied.
+    :param until: if provided, only changes up to (and including) this one are returned.
+    :param tables: if provided, only changes to these tables are returned.
+    :returns: batches of changes, in order. The `id` of the last change in each batch is the
+        sequence number to resume from.
+    """
+    tables = set(tables) if tables is not None else None
+    while True:
+        query = database.session.query(ChangeLog).filter(ChangeLog.id > since)
+        if until is not None:
+            query = query.filter(ChangeLog.id <= until)
+        if tables is not None:
+            query = query.filter(ChangeLog.table_name.in_(tables))
+
+        batch = query.order_by(ChangeLog.id.asc()).limit(batch_size).all()
+        if not batch:
+            return
+
+        yield batch
+        since = batch[-1].id
+
+
+def get_changed_instruments(
+    since: int,
+    until: Optional[int] = None,
+    tables: Optional[Iterable[str]] = None,
+) -> Set[int]:
+    """
+    :returns: instruments affected by changes after `since`. Changes that don't affect a
+        single instrument (e.g. option strategies) are left out.
+    """
+    return {
+        change.instrument_id
+        for batch in iter_changes(since, until, tables)
+        for change in batch
+        if change.instrument_id is not None
+    }
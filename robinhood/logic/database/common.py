@@ -10,9 +10,15 @@ from sqlalchemy.orm import Query
 from sqlalchemy.sql.expression import func
 
 from ... import database
+from ... import metrics
 from ...database import Base
 
 
+# Older versions of SQLite limit the number of variables in a single query, so we need to
+# batch large `IN` clauses.
+MAX_VARIABLES = 500
+
+
 class BaseDBLogic(metaclass=ABCMeta):
     @abstractproperty
     def MODEL(self) -> Base:
@@ -21,6 +27,7 @@ class BaseDBLogic(metaclass=ABCMeta):
     def create(self, **kwargs: Any) -> Base:
         item = self.MODEL(**kwargs)
         database.session.add(item)
+        metrics.increment('rows_inserted_total', table=self.MODEL.__tablename__)
 
         return item
 
@@ -35,12 +42,16 @@ class BaseDBLogic(metaclass=ABCMeta):
         return query
 
     def get_by_ids(self, *ids: int) -> Dict[int, Base]:
-        return {
-            item.id: item
-            for item in database.session.query(self.MODEL).filter(
-                self.MODEL.id.in_(ids),
-            )
-        }
+        output = {}
+        for index in range(0, len(ids), MAX_VARIABLES):
+            output.update({
+                item.id: item
+                for item in database.session.query(self.MODEL).filter(
+                    self.MODEL.id.in_(ids[index:index + MAX_VARIABLES]),
+                )
+            })
+
+        return output
 
 
 class DateMixin:
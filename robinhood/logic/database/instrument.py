@@ -0,0 +1,45 @@
+from typing import Dict
+from typing import MutableMapping
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ... import database
+from ...models.instrument import Instrument as InstrumentModel
+from .common import BaseDBLogic
+
+
+class InstrumentDBLogic(BaseDBLogic):
+    # engine => name => id. Since instruments are never deleted, this can be shared across
+    # instances. It's kept per engine, since IDs from one database (e.g. a copy of it, see
+    # `database.in_memory`) mean nothing in another.
+    _ids: MutableMapping[Engine, Dict[str, int]] = WeakKeyDictionary()
+
+    @property
+    def MODEL(self) -> InstrumentModel:
+        return InstrumentModel
+
+    def get_id(self, name: str, underlying: str, is_option: bool) -> int:
+        """
+        :returns: the ID interned for this instrument, creating one if necessary.
+        """
+        ids = self._ids.setdefault(database.session.get_bind(), {})
+        try:
+            return ids[name]
+        except KeyError:
+            pass
+
+        item = self.get_filtered_query(name=name).one_or_none()
+        if not item:
+            item = self.create(name=name, underlying=underlying, is_option=is_option)
+
+            # This is needed, so that an ID will be auto-assigned.
+            database.session.flush()
+
+        ids[name] = item.id
+        return item.id
+
+
+# Newly created instruments may not survive a rollback.
+event.listen(database.session, 'after_rollback', lambda _: InstrumentDBLogic._ids.clear())
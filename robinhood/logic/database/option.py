@@ -2,10 +2,14 @@ import datetime
 from urllib.parse import urlparse
 
 from ... import database
+from ... import metrics
 from ...client import get_client
+from ...models.option import get_occ_symbol
 from ...models.option import Option as OptionModel
 from ...models.option import OptionType
+from ...util import get_json
 from .common import BaseDBLogic
+from .instrument import InstrumentDBLogic
 
 
 class OptionDBLogic(BaseDBLogic):
@@ -22,19 +26,33 @@ class OptionDBLogic(BaseDBLogic):
         uuid = urlparse(url).path.rstrip('/').split('/')[-1]
         results = self.get(uuid=uuid)
         if results:
+            metrics.increment('instrument_cache_hits_total', type='option')
             return results[0]
 
+        metrics.increment('instrument_cache_misses_total', type='option')
         client = get_client()
-        data = client.get(url)
+        data = get_json(client, url)
 
+        option_type = OptionType(data['type'])
+        expiration_date = datetime.datetime.strptime(data['expiration_date'], '%Y-%m-%d')
+        symbol = get_occ_symbol(
+            data['chain_symbol'],
+            option_type,
+            expiration_date,
+            float(data['strike_price']),
+        )
         item = self.create(
             uuid=uuid,
             name=data['chain_symbol'],
-            type=OptionType(data['type']),
-            expiration_date=datetime.datetime.strptime(
-                data['expiration_date'], '%Y-%m-%d',
-            ).date(),
+            type=option_type,
+            expiration_date=expiration_date.date(),
             strike_price=data['strike_price'],
+            symbol=symbol,
+            instrument_id=InstrumentDBLogic().get_id(
+                symbol,
+                data['chain_symbol'],
+                is_option=True,
+            ),
         )
         database.session.commit()
         return item
@@ -0,0 +1,34 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy.sql.expression import func
+
+from ... import database
+from ...models.option import OptionExpirationEvent as OptionExpirationEventModel
+from ...payloads import OptionEvent
+from .common import BaseDBLogic
+from .common import DateMixin
+from .option import OptionDBLogic
+
+
+class OptionExpirationDBLogic(DateMixin, BaseDBLogic):
+    @property
+    def MODEL(self) -> OptionExpirationEventModel:
+        return OptionExpirationEventModel
+
+    def create_from_event(self, event: OptionEvent) -> OptionExpirationEventModel:
+        result = self.get(uuid=event.id)
+        if result:
+            return result[0]
+
+        option = OptionDBLogic().get_from_instrument_url(event.option)
+        return self.create(
+            uuid=event.id,
+            option_id=option.id,
+            date=datetime.datetime.combine(event.event_date, datetime.time()),
+            quantity=event.quantity,
+            updated_at=event.updated_at,
+        )
+
+    def get_latest_update(self) -> Optional[datetime.datetime]:
+        return database.session.query(func.max(self.MODEL.updated_at)).scalar()
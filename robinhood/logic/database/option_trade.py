@@ -1,6 +1,5 @@
-import datetime
-from typing import Any
-from typing import Dict
+from collections import defaultdict
+from typing import DefaultDict
 from typing import List
 
 from ... import database
@@ -9,8 +8,11 @@ from ...models.option import OptionStrategy as OptionStrategyModel
 from ...models.option import OptionStrategyLegs as OptionStrategyLegsModel
 from ...models.option import OptionStrategyType
 from ...models.option import OptionTrade as OptionTradeModel
+from ...payloads import OptionLeg
+from ...payloads import OptionOrder
 from .common import BaseDBLogic
 from .common import DateMixin
+from .common import MAX_VARIABLES
 from .option import OptionDBLogic
 
 
@@ -19,34 +21,31 @@ class OptionStrategyDBLogic(DateMixin, BaseDBLogic):
     def MODEL(self) -> OptionStrategyModel:
         return OptionStrategyModel
 
-    def create_from_raw_payload(self, payload: Dict[str, Any]) -> OptionStrategyModel:
-        result = self.get(uuid=payload['id'])
+    def create_from_order(self, order: OptionOrder) -> OptionStrategyModel:
+        result = self.get(uuid=order.id)
         if result:
             return result[0]
 
-        if payload['opening_strategy']:
-            strategy_type = payload['opening_strategy']
+        if order.opening_strategy:
+            strategy_type = order.opening_strategy
             strategy_side = Side.BUY
         else:
-            strategy_type = payload['closing_strategy']
+            strategy_type = order.closing_strategy
             strategy_side = Side.SELL
 
         strategy = self.create(
-            uuid=payload['id'],
-            name=payload['chain_symbol'],
+            uuid=order.id,
+            name=order.chain_symbol,
             side=strategy_side,
             type=OptionStrategyType(strategy_type),
-            date=datetime.datetime.strptime(
-                payload['updated_at'].rstrip('Z').split('.')[0],
-                '%Y-%m-%dT%H:%M:%S',
-            ),
+            date=order.updated_at,
         )
         strategy.legs = []
 
         trade_logic = OptionTradeDBLogic()
         leg_logic = OptionStrategyLegsDBLogic()
-        for leg in payload['legs']:
-            item = trade_logic.create_from_raw_payload(leg)
+        for leg in order.legs:
+            item = trade_logic.create_from_leg(leg)
             leg_logic.create(strategy_id=strategy.id, trade_id=item.id)
 
             strategy.legs.append(item)
@@ -55,17 +54,23 @@ class OptionStrategyDBLogic(DateMixin, BaseDBLogic):
         return strategy
 
     def hydrate(self, *items: OptionStrategyModel) -> List[OptionStrategyModel]:
-        # TODO: We probably can improve this with a join.
-        trade_logic = OptionTradeDBLogic()
+        trade_ids: DefaultDict[int, List[int]] = defaultdict(list)
         leg_logic = OptionStrategyLegsDBLogic()
+        strategy_ids = [item.id for item in items]
+        for index in range(0, len(strategy_ids), MAX_VARIABLES):
+            for entry in leg_logic.get_filtered_query().filter(
+                leg_logic.MODEL.strategy_id.in_(strategy_ids[index:index + MAX_VARIABLES]),
+            ):
+                trade_ids[entry.strategy_id].append(entry.trade_id)
+
+        trade_logic = OptionTradeDBLogic()
+        trades = trade_logic.get_by_ids(
+            *[trade_id for ids in trade_ids.values() for trade_id in ids]
+        )
+        trade_logic.hydrate(*trades.values())
+
         for item in items:
-            item.legs = trade_logic.hydrate(
-                *list(
-                    trade_logic.get_by_ids(
-                        *[entry.trade_id for entry in leg_logic.get(strategy_id=item.id)]
-                    ).values(),
-                )
-            )
+            item.legs = [trades[trade_id] for trade_id in sorted(trade_ids[item.id])]
 
         return items
 
@@ -75,42 +80,19 @@ class OptionTradeDBLogic(BaseDBLogic):
     def MODEL(self) -> OptionTradeModel:
         return OptionTradeModel
 
-    def create_from_raw_payload(self, payload: Dict[str, Any]) -> OptionTradeModel:
-        result = self.get(uuid=payload['id'])
+    def create_from_leg(self, leg: OptionLeg) -> OptionTradeModel:
+        result = self.get(uuid=leg.id)
         if result:
             return result[0]
 
-        option = OptionDBLogic().get_from_instrument_url(payload['option'])
-
-        date = None
-        price = 0
-        quantity = 0
-        for execution in payload['executions']:
-            if not date:
-                # NOTE: It looks like Robinhood supports "Good till Cancelled" options orders,
-                # so technically, you could have a leg that executes over multiple days. This
-                # would result in multiple `OptionTrade` items created, which I'm not sure what
-                # to do with currently.
-                #
-                # Therefore, I'm just going to assume this feature is disabled (I don't currently
-                # use it anyway), to simplify our data model. As such, we'll just take the first
-                # date of execution.
-                date = execution['timestamp']
-
-            price += float(execution['price'])
-            quantity += float(execution['quantity'])
-
+        option = OptionDBLogic().get_from_instrument_url(leg.option)
         output = self.create(
-            uuid=payload['id'],
+            uuid=leg.id,
             option_id=option.id,
-            side=Side(payload['side']),
-            date=datetime.datetime.strptime(
-                date.rstrip(
-                    'Z',
-                ).split('.')[0], '%Y-%m-%dT%H:%M:%S',
-            ),
-            price=price / len(payload['executions']),       # average price
-            quantity=quantity,
+            side=Side(leg.side),
+            date=leg.date,
+            price=leg.price,
+            quantity=leg.quantity,
         )
 
         # This is needed, so that an ID will be auto-assigned.
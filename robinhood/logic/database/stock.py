@@ -1,8 +1,10 @@
 from urllib.parse import urlparse
 
 from ... import database
+from ... import metrics
 from ...client import get_client
 from ...models.stock import Stock as StockModel
+from ...util import get_json
 from .common import BaseDBLogic
 
 
@@ -20,10 +22,12 @@ class StockDBLogic(BaseDBLogic):
         uuid = urlparse(url).path.rstrip('/').split('/')[-1]
         results = self.get(uuid=uuid)
         if results:
+            metrics.increment('instrument_cache_hits_total', type='stock')
             return results[0]
 
+        metrics.increment('instrument_cache_misses_total', type='stock')
         client = get_client()
-        data = client.get(url)
+        data = get_json(client, url)
         ticker = data['symbol']
 
         item = self.create(uuid=uuid, name=ticker)
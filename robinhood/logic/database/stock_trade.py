@@ -1,11 +1,9 @@
-import datetime
-from typing import Any
-from typing import Dict
-
 from ...models import Side
 from ...models.stock import StockTrade as StockTradeModel
+from ...payloads import StockOrder
 from .common import BaseDBLogic
 from .common import DateMixin
+from .instrument import InstrumentDBLogic
 from .stock import StockDBLogic
 
 
@@ -14,22 +12,19 @@ class StockTradeDBLogic(DateMixin, BaseDBLogic):
     def MODEL(self) -> StockTradeModel:
         return StockTradeModel
 
-    def create_from_raw_payload(self, payload: Dict[str, Any]) -> StockTradeModel:
-        result = self.get(uuid=payload['id'])
+    def create_from_order(self, order: StockOrder) -> StockTradeModel:
+        result = self.get(uuid=order.id)
         if result:
             return result[0]
 
-        ticker = StockDBLogic().get_from_instrument_url(payload['instrument'])
+        ticker = StockDBLogic().get_from_instrument_url(order.instrument)
         return self.create(
-            uuid=payload['id'],
+            uuid=order.id,
             name=ticker.name,
-            side=Side(payload['side']),
-            date=datetime.datetime.strptime(
-                # Clear off the %f part, because it seems that the data may sometimes
-                # not include it. (!!)
-                payload['last_transaction_at'].rstrip('Z').split('.')[0],
-                '%Y-%m-%dT%H:%M:%S',
-            ),
-            price=float(payload['average_price']),
-            quantity=float(payload['cumulative_quantity']),
+            side=Side(order.side),
+            date=order.date,
+            price=order.price,
+            quantity=order.quantity,
+            updated_at=order.updated_at,
+            instrument_id=InstrumentDBLogic().get_id(ticker.name, ticker.name, is_option=False),
         )
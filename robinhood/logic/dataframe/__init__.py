@@ -1 +1,21 @@
-from . import trades    # noqa: F401
+import importlib
+from types import ModuleType
+
+
+# NOTE: The report builders pull in pandas, SQLAlchemy and pyrh. Since notebooks (and the CLI)
+# import this package before doing anything else, we only load them on first access.
+_SUBMODULES = {
+    'backends',
+    'harvest',
+    'positions',
+    'rollup',
+    'timeseries',
+    'trades',
+}
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,213 @@
+"""
+Reports can be returned as Polars DataFrames, rather than pandas, e.g.
+
+    trades.get(backend='polars')
+
+Polars runs group-bys (and most other expressions) on every core, and can optimize lazy query
+plans as a whole. For example, `get_rollup` cuts P&L from trades the same way that
+`dataframe.rollup` does from the database, without ever building an intermediate frame:
+
+    backends.get_rollup(trades.get(backend='polars'), by=['Month', 'Type']).collect()
+
+This needs `polars` (and `pyarrow`, to convert to and from pandas):
+
+    $ pip install polars pyarrow
+
+Since Polars has no index, indexed reports (e.g. `rollup` and `timeseries`) have it as their
+leading column(s) instead. Notebooks written against pandas can use `to_pandas` on either.
+"""
+from types import ModuleType
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+from typing import Union
+
+import pandas as pd
+
+from .trades import _get_cost_basis
+from .trades import COLUMNS
+from .trades import MIN_ANNUALIZED_DAYS
+from .trades import Sale
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+BACKENDS = ('pandas', 'polars')
+
+
+def import_polars() -> ModuleType:
+    try:
+        import polars
+    except ImportError:
+        raise ImportError('This needs Polars (and pyarrow): `pip install polars pyarrow`.')
+
+    return polars
+
+
+def check(backend: str) -> None:
+    """
+    :raises: ValueError
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend: {backend} (expected one of {BACKENDS}).')
+
+
+def convert(df: pd.DataFrame, backend: str) -> Union[pd.DataFrame, 'pl.DataFrame']:
+    """
+    :raises: ValueError
+    """
+    check(backend)
+    if backend == 'pandas':
+        return df
+
+    return from_pandas(df)
+
+
+def from_sales(sales: Iterable[Sale], cost_basis: bool = False) -> 'pl.DataFrame':
+    """
+    Like `trades.to_dataframe`, but built column by column (and rounded in bulk).
+    """
+    pl = import_polars()
+
+    columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+    if cost_basis:
+        columns['Cost Basis'] = []
+    for sale in sales:
+        columns['Name'].append(sale.name)
+        columns['Underlying'].append(sale.underlying)
+        columns['Is Option'].append(sale.is_option)
+        columns['Date Bought'].append(sale.bought.date)
+        columns['Price Bought'].append(sale.bought.price)
+        columns['Date Sold'].append(sale.sold.date)
+        columns['Price Sold'].append(sale.sold.price)
+        columns['Quantity'].append(sale.quantity)
+        columns['Earnings'].append(sale.earnings)
+        if cost_basis:
+            columns['Cost Basis'].append(_get_cost_basis(sale))
+
+    return pl.DataFrame(
+        columns,
+        schema={
+            'Name': pl.String,
+            'Underlying': pl.String,
+            'Is Option': pl.Boolean,
+            'Date Bought': pl.Date,
+            'Price Bought': pl.Float64,
+            'Date Sold': pl.Date,
+            'Price Sold': pl.Float64,
+            'Quantity': pl.Float64,
+            'Earnings': pl.Float64,
+            **({'Cost Basis': pl.Float64} if cost_basis else {}),
+        },
+    ).with_columns(
+        pl.col('Price Bought', 'Price Sold', 'Earnings').round(2),
+
+        # assumes we don't have partial purchases (though supported)
+        pl.col('Quantity').cast(pl.Int64),
+    )
+
+
+def add_returns(df: 'pl.DataFrame') -> 'pl.DataFrame':
+    """
+    The same as `trades.add_returns`, for Polars.
+
+    :raises: ValueError
+    """
+    pl = import_polars()
+    if 'Cost Basis' not in df.columns:
+        raise ValueError('Cost basis is missing: use `from_sales(sales, cost_basis=True)`.')
+
+    cost_basis = pl.col('Cost Basis')
+    return df.with_columns(
+        cost_basis.round(2).alias('Cost Basis'),
+        (pl.col('Date Sold') - pl.col('Date Bought')).dt.total_days().alias('Holding Days'),
+        pl.when(cost_basis > 0).then(pl.col('Earnings') / cost_basis).alias('Return'),
+    ).with_columns(
+        pl.when(pl.col('Holding Days') >= MIN_ANNUALIZED_DAYS)
+        .then((1 + pl.col('Return')).pow(365 / pl.col('Holding Days')) - 1)
+        .alias('Annualized Return'),
+    )
+
+
+def from_pandas(df: pd.DataFrame) -> 'pl.DataFrame':
+    pl = import_polars()
+
+    # Polars has no index, so it needs to be a column (unless it's just row numbers).
+    if not isinstance(df.index, pd.RangeIndex):
+        df = df.reset_index()
+
+    return pl.from_pandas(df)
+
+
+def to_pandas(df: Union[pd.DataFrame, 'pl.DataFrame', 'pl.LazyFrame']) -> pd.DataFrame:
+    """
+    For notebooks (and libraries) that only work with pandas.
+    """
+    if isinstance(df, pd.DataFrame):
+        return df
+
+    pl = import_polars()
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+
+    return df.to_pandas()
+
+
+def get_rollup(
+    trades: Union['pl.DataFrame', 'pl.LazyFrame'],
+    by: Sequence[str] = ('Month', 'Type', 'Term', 'Underlying'),
+    is_option: Optional[bool] = None,
+    underlying: Optional[str] = None,
+) -> 'pl.LazyFrame':
+    """
+    The same cuts as `dataframe.rollup.get`, from trades (see `trades.get`) rather than the
+    pre-aggregated rollup.
+
+    :param by: any of `dataframe.rollup.DIMENSIONS`, to group by.
+    :param is_option: if provided, only includes options (or stocks).
+    :param underlying: if provided, only includes this ticker (and options on it).
+    :returns: a query plan for Earnings, Count and Volume, grouped (and sorted) by `by`.
+    """
+    pl = import_polars()
+
+    dimensions = {
+        'Month': pl.col('Date Sold').dt.truncate('1mo'),
+        'Type': (
+            pl.when(pl.col('Is Option'))
+            .then(pl.lit('Options'))
+            .otherwise(pl.lit('Stocks'))
+        ),
+        'Term': (
+            # Held past the anniversary of the purchase (see `rollup.is_long_term`).
+            pl.when(pl.col('Date Bought').dt.offset_by('1y') < pl.col('Date Sold'))
+            .then(pl.lit('Long'))
+            .otherwise(pl.lit('Short'))
+        ),
+        'Underlying': pl.col('Underlying'),
+    }
+    aggregations = [
+        pl.col('Earnings').sum().round(2),
+        pl.len().alias('Count'),
+        pl.col('Quantity').sum().alias('Volume'),
+    ]
+
+    query = trades.lazy()
+    if is_option is not None:
+        query = query.filter(pl.col('Is Option') == is_option)
+    if underlying:
+        query = query.filter(pl.col('Underlying') == underlying)
+
+    if not by:
+        return query.select(aggregations)
+
+    return (
+        query
+        .group_by([dimensions[name].alias(name) for name in by])
+        .agg(aggregations)
+        .sort(list(by))
+    )
@@ -0,0 +1,471 @@
+"""
+What-if analysis over open lots: what would selling them (at given prices) realize, and what
+would it do to this year's taxes? Scenarios are evaluated in bulk, as arrays of shape
+(scenarios, lots), so that thousands of them can be compared at once.
+
+This powers a tax-loss harvesting plan: which positions to sell, at their latest prices, to
+save the most tax this year.
+
+NOTE: This is a simplified model of (US federal) taxes. Short-term gains are taxed as ordinary
+income, and long-term gains at their own rates, stacked on top. Net losses in one term offset
+gains in the other, and whatever's left offsets up to `LOSS_LIMIT` of ordinary income (we
+don't carry the rest over). Wash sales are only checked against lots of the same instrument
+bought within `WASH_SALE_DAYS` before the sale, that would still be held after it.
+"""
+import datetime
+from typing import Any
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from . import backends
+from ... import metrics
+from ..rollup import get_long_term_cutoff
+from ..rollup import is_long_term
+from .positions import _get_resident_portfolio
+from .positions import get_portfolio
+from .positions import to_dataframe as get_positions
+from .trades import _get_trades
+from .trades import _parse_date
+from .trades import OPTION_MULTIPLIER
+from .trades import Portfolio
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+# (taxable income above this, marginal rate). These are for single filers, as of 2020.
+ORDINARY_BRACKETS = (
+    (0, .10),
+    (9875, .12),
+    (40125, .22),
+    (85525, .24),
+    (163300, .32),
+    (207350, .35),
+    (518400, .37),
+)
+LONG_TERM_BRACKETS = (
+    (0, .0),
+    (40000, .15),
+    (441450, .20),
+)
+
+# How much of a net capital loss can be deducted from ordinary income, per year.
+LOSS_LIMIT = 3000
+
+# Losses are disallowed if the same security was bought within this many days of the sale.
+WASH_SALE_DAYS = 30
+
+# Upper bound on the number of (scenario, lot) cells evaluated at a time, to bound memory.
+MAX_CELLS = 10 ** 7
+
+
+class TaxRates(NamedTuple):
+    ordinary: Sequence[Tuple[float, float]] = ORDINARY_BRACKETS
+    long_term: Sequence[Tuple[float, float]] = LONG_TERM_BRACKETS
+
+    # Taxable income for the year, other than capital gains.
+    income: float = 0
+
+
+class Lots(NamedTuple):
+    """
+    Open lots, as parallel arrays. Lots are grouped by instrument, in the order that they'd be
+    sold (FIFO).
+    """
+    # One entry per instrument.
+    instrument_ids: np.ndarray
+    names: np.ndarray
+    underlying: np.ndarray
+    is_option: np.ndarray
+
+    # The index of each instrument's first lot.
+    starts: np.ndarray
+
+    # One entry per lot.
+    instrument: np.ndarray
+    dates: np.ndarray
+    prices: np.ndarray
+    quantities: np.ndarray
+    multipliers: np.ndarray
+
+    # How much of the same instrument needs to be sold before this lot is.
+    held_before: np.ndarray
+
+    @classmethod
+    def from_portfolio(
+        cls,
+        portfolio: Portfolio,
+        instrument_ids: Optional[Iterable[int]] = None,
+    ) -> 'Lots':
+        """
+        :param instrument_ids: only include these instruments. Defaults to all of them.
+        """
+        if instrument_ids is None:
+            instrument_ids = portfolio.instruments.keys()
+
+        ids = [
+            instrument_id
+            for instrument_id in instrument_ids
+            if portfolio.instruments.get(instrument_id)
+        ]
+        info = [portfolio.info[instrument_id] for instrument_id in ids]
+        lots = [portfolio.instruments[instrument_id] for instrument_id in ids]
+
+        counts = np.array([len(items) for items in lots], dtype=np.int64)
+        starts = np.cumsum(counts) - counts
+        is_option = np.array([item.is_option for item in info], dtype=bool)
+
+        quantities = np.array(
+            [lot.quantity for items in lots for lot in items],
+            dtype=np.float64,
+        )
+        instrument = np.repeat(np.arange(len(ids)), counts)
+
+        # Quantities are accumulated across instruments, so subtract what came before each
+        # instrument's first lot.
+        before = np.cumsum(quantities) - quantities
+        held_before = before - np.repeat(before[starts], counts)
+
+        return cls(
+            instrument_ids=np.array(ids, dtype=np.int64),
+            names=np.array([item.name for item in info], dtype=object),
+            underlying=np.array([item.underlying for item in info], dtype=object),
+            is_option=is_option,
+            starts=starts,
+            instrument=instrument,
+            dates=np.array(
+                [np.datetime64(lot.date, 'D') for items in lots for lot in items],
+                dtype='datetime64[D]',
+            ),
+            prices=np.array([lot.price for items in lots for lot in items], dtype=np.float64),
+            quantities=quantities,
+            multipliers=np.where(is_option, OPTION_MULTIPLIER, 1)[instrument].astype(np.float64),
+            held_before=held_before,
+        )
+
+    def get_totals(self) -> np.ndarray:
+        """
+        :returns: the quantity held of each instrument.
+        """
+        return _sum_by_instrument(self, self.quantities[np.newaxis, :])[0]
+
+
+class Scenarios(NamedTuple):
+    # All of these have one entry per scenario.
+    short_term: np.ndarray
+    long_term: np.ndarray
+
+    # Losses that would be disallowed (as a positive amount), because of wash sales.
+    wash_sale: np.ndarray
+
+    # How much more tax would be owed for the year (negative, if it'd save tax).
+    tax: np.ndarray
+
+    # Realized gains, less tax.
+    after_tax: np.ndarray
+
+
+def get(
+    date: Optional[Union[datetime.date, str]] = None,
+    income: float = 0,
+    rates: Optional[TaxRates] = None,
+    sync: bool = True,
+    backend: str = 'pandas',
+) -> Union[pd.DataFrame, 'pl.DataFrame']:
+    """
+    :param date: YYYY-MM-DD format. Defaults to today.
+    :param income: taxable income for the year, other than capital gains.
+    :param rates: tax brackets to use (`income` is ignored, if these are provided).
+    :param sync: whether to fetch new data (trades and prices) from the API first.
+    :param backend: either `pandas` or `polars` (see `robinhood.logic.dataframe.backends`).
+    :returns: a tax-loss harvesting plan for positions held at the end of `date`, at their
+        latest prices (see `get_plan`). Since we don't have their prices, options aren't
+        considered.
+    """
+    backends.check(backend)
+    date = _parse_date(date) or datetime.date.today()
+    rates = rates or TaxRates(income=income)
+    with metrics.timer('report_seconds', report='harvest'):
+        portfolio = None
+        if not sync and date == datetime.date.today():
+            portfolio = _get_resident_portfolio()
+        if portfolio is None:
+            portfolio = get_portfolio(date, sync=sync)
+
+        positions = get_positions(portfolio, date, sync=sync)
+        prices = dict(zip(positions['Name'], positions['Price']))
+        lots = Lots.from_portfolio(
+            portfolio,
+            [
+                instrument_id
+                for instrument_id, info in portfolio.info.items()
+                if not info.is_option and not pd.isna(prices.get(info.name))
+            ],
+        )
+
+        plan = get_plan(
+            lots,
+            np.array([prices[name] for name in lots.names], dtype=np.float64),
+            date,
+            rates=rates,
+            realized=get_realized_gains(date),
+        )
+
+    return backends.convert(plan, backend)
+
+
+def get_realized_gains(date: datetime.date) -> Tuple[float, float]:
+    """
+    :returns: (short-term, long-term) gains realized so far in `date`'s year, up to `date`.
+    """
+    sales = _get_trades(
+        from_date=date.replace(month=1, day=1),
+        to_date=date + datetime.timedelta(days=1),
+        sync=False,
+    )
+    short_term = long_term = 0.
+    for sale in sales:
+        if sale.sold.date > date:
+            continue
+
+        if is_long_term(sale.bought.date, sale.sold.date):
+            long_term += sale.earnings
+        else:
+            short_term += sale.earnings
+
+    return short_term, long_term
+
+
+def evaluate(
+    lots: Lots,
+    prices: Any,
+    quantities: Optional[Any] = None,
+    date: Optional[datetime.date] = None,
+    rates: TaxRates = TaxRates(),
+    realized: Tuple[float, float] = (0., 0.),
+) -> Scenarios:
+    """
+    :param prices: to sell each instrument at (in `lots` order). Either one per instrument,
+        or an array of shape (scenarios, instruments).
+    :param quantities: to sell of each instrument (FIFO), likewise. Defaults to everything.
+    :param date: to sell on. Defaults to today.
+    :param realized: (short-term, long-term) gains already realized this year.
+    """
+    if quantities is None:
+        quantities = lots.get_totals()
+
+    prices, quantities = np.broadcast_arrays(
+        np.atleast_2d(np.asarray(prices, dtype=np.float64)),
+        np.atleast_2d(np.asarray(quantities, dtype=np.float64)),
+    )
+    if not len(lots.instrument):
+        # `np.add.reduceat` doesn't support empty arrays.
+        zeros = np.zeros(len(prices))
+        return Scenarios(
+            short_term=zeros,
+            long_term=zeros,
+            wash_sale=zeros,
+            tax=zeros,
+            after_tax=zeros,
+        )
+
+    date = date or datetime.date.today()
+    is_held_long = lots.dates < np.datetime64(get_long_term_cutoff(date), 'D')
+    date = np.datetime64(date, 'D')
+
+    # (scenarios, lots)
+    sold = np.clip(quantities[:, lots.instrument] - lots.held_before, 0, lots.quantities)
+    gains = sold * (prices[:, lots.instrument] - lots.prices) * lots.multipliers
+    losses = np.minimum(gains, 0)
+
+    # Whatever is bought within the wash sale window, and isn't sold, replaces what was sold
+    # at a loss. (scenarios, instruments)
+    is_recent = (date - lots.dates).astype(np.int64) <= WASH_SALE_DAYS
+    replacements = _sum_by_instrument(lots, (lots.quantities - sold) * is_recent)
+    sold_at_loss = _sum_by_instrument(lots, sold * (losses < 0))
+    disallowed = np.divide(
+        np.minimum(replacements, sold_at_loss),
+        sold_at_loss,
+        out=np.zeros_like(sold_at_loss),
+        where=sold_at_loss > 0,
+    )
+
+    # Disallowed losses are spread evenly over the lots sold at a loss.
+    adjustments = -losses * disallowed[:, lots.instrument]
+    short_term = (gains * ~is_held_long).sum(axis=1)
+    long_term = (gains * is_held_long).sum(axis=1)
+
+    tax = get_tax(
+        realized[0] + short_term + (adjustments * ~is_held_long).sum(axis=1),
+        realized[1] + long_term + (adjustments * is_held_long).sum(axis=1),
+        rates,
+    ) - get_tax(np.float64(realized[0]), np.float64(realized[1]), rates)
+
+    return Scenarios(
+        short_term=short_term,
+        long_term=long_term,
+        wash_sale=adjustments.sum(axis=1),
+        tax=tax,
+        after_tax=short_term + long_term - tax,
+    )
+
+
+def get_plan(
+    lots: Lots,
+    prices: Any,
+    date: Optional[datetime.date] = None,
+    rates: TaxRates = TaxRates(),
+    realized: Tuple[float, float] = (0., 0.),
+) -> pd.DataFrame:
+    """
+    Since sales are FIFO, the candidates for each instrument are selling its first lot, its
+    first two lots, and so on. Every candidate is evaluated on its own, and the one that saves
+    the most tax (if any) is picked for each instrument.
+
+    :param prices: to sell each instrument at (in `lots` order).
+    :returns: the picked sales, ranked by how much tax they'd save. Cumulative Tax Savings is
+        what selling each (and everything ranked above it) would save together: it levels
+        off once gains are offset, and `LOSS_LIMIT` is reached.
+    """
+    columns = [
+        'Name',
+        'Underlying',
+        'Lots',
+        'Quantity',
+        'Price',
+        'Cost Basis',
+        'Short-Term',
+        'Long-Term',
+        'Wash Sale',
+        'Tax Savings',
+        'Cumulative Tax Savings',
+    ]
+
+    # One candidate per lot: selling up to (and including) it.
+    num_lots = len(lots.instrument)
+    if not num_lots:
+        return pd.DataFrame(columns=columns)
+
+    prices = np.asarray(prices, dtype=np.float64)
+    candidates = lots.held_before + lots.quantities
+    results = []
+    chunksize = max(MAX_CELLS // num_lots, 1)
+    for start in range(0, num_lots, chunksize):
+        end = min(start + chunksize, num_lots)
+        quantities = np.zeros((end - start, len(lots.names)))
+        quantities[np.arange(end - start), lots.instrument[start:end]] = candidates[start:end]
+        results.append(evaluate(lots, prices, quantities, date, rates, realized))
+
+    scenarios = Scenarios(*(np.concatenate(values) for values in zip(*results)))
+
+    df = pd.DataFrame({
+        'Instrument': lots.instrument,
+        'Lots': np.arange(num_lots) - lots.starts[lots.instrument] + 1,
+        'Quantity': candidates,
+        'Cost Basis': _cumsum_by_instrument(lots, lots.prices * lots.quantities * lots.multipliers),
+        'Short-Term': scenarios.short_term,
+        'Long-Term': scenarios.long_term,
+        'Wash Sale': scenarios.wash_sale,
+        'Tax Savings': -scenarios.tax,
+    })
+    df = df[df['Tax Savings'] > 0]
+    df = df.loc[df.groupby('Instrument')['Tax Savings'].idxmax()]
+    df = df.sort_values('Tax Savings', ascending=False, ignore_index=True)
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    # Selling everything ranked at (or above) each row, together.
+    quantities = np.zeros((len(df), len(lots.names)))
+    quantities[:, df['Instrument'].to_numpy()] = np.where(
+        np.tri(len(df), dtype=bool),
+        df['Quantity'].to_numpy(),
+        0,
+    )
+    df['Cumulative Tax Savings'] = -evaluate(
+        lots,
+        prices,
+        quantities,
+        date,
+        rates,
+        realized,
+    ).tax
+
+    instruments = df['Instrument'].to_numpy()
+    df['Name'] = lots.names[instruments]
+    df['Underlying'] = lots.underlying[instruments]
+    df['Price'] = prices[instruments]
+
+    return df[columns].round({
+        'Price': 2,
+        'Cost Basis': 2,
+        'Short-Term': 2,
+        'Long-Term': 2,
+        'Wash Sale': 2,
+        'Tax Savings': 2,
+        'Cumulative Tax Savings': 2,
+    })
+
+
+def get_tax(short_term: np.ndarray, long_term: np.ndarray, rates: TaxRates) -> np.ndarray:
+    """
+    :param short_term: net short-term gains for the year (one per scenario).
+    :param long_term: likewise, for long-term gains.
+    :returns: total tax owed for the year, including on `rates.income`.
+    """
+    # Losses in one term offset gains in the other.
+    short_taxable = np.where(
+        long_term < 0,
+        np.maximum(short_term + long_term, 0),
+        np.maximum(short_term, 0),
+    )
+    long_taxable = np.where(
+        short_term < 0,
+        np.maximum(long_term + short_term, 0),
+        np.maximum(long_term, 0),
+    )
+    deduction = np.minimum(np.maximum(-(short_term + long_term), 0), LOSS_LIMIT)
+
+    ordinary = np.maximum(rates.income + short_taxable - deduction, 0)
+    return (
+        _get_bracket_tax(ordinary, rates.ordinary)
+
+        # Long-term gains are taxed as if they were the last dollars earned.
+        + _get_bracket_tax(ordinary + long_taxable, rates.long_term)
+        - _get_bracket_tax(ordinary, rates.long_term)
+    )
+
+
+def _get_bracket_tax(income: np.ndarray, brackets: Sequence[Tuple[float, float]]) -> np.ndarray:
+    thresholds = np.array([threshold for threshold, _ in brackets], dtype=np.float64)
+    rates = np.array([rate for _, rate in brackets], dtype=np.float64)
+    widths = np.append(np.diff(thresholds), np.inf)
+
+    # (..., brackets)
+    taxed = np.clip(np.asarray(income)[..., np.newaxis] - thresholds, 0, widths)
+    return (taxed * rates).sum(axis=-1)
+
+
+def _sum_by_instrument(lots: Lots, values: np.ndarray) -> np.ndarray:
+    """
+    :param values: of shape (scenarios, lots).
+    :returns: of shape (scenarios, instruments).
+    """
+    return np.add.reduceat(values, lots.starts, axis=1)
+
+
+def _cumsum_by_instrument(lots: Lots, values: np.ndarray) -> np.ndarray:
+    """
+    :param values: one per lot.
+    :returns: the running total of `values`, for each instrument.
+    """
+    totals = np.cumsum(values)
+    before = totals - values
+    return totals - before[lots.starts][lots.instrument]
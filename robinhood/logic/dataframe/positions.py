@@ -0,0 +1,176 @@
+"""
+Open positions on any given date, and how much they've gained (or lost) since they were
+bought.
+"""
+import datetime
+import itertools
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import TYPE_CHECKING
+from typing import Union
+
+import pandas as pd
+
+from . import backends
+from ... import metrics
+from ... import service
+from ..database.stock_split import StockSplitDBLogic
+from ..prices import get_prices
+from .trades import _get_event_date
+from .trades import _get_events
+from .trades import _parse_date
+from .trades import _replay
+from .trades import InstrumentInfo
+from .trades import OPTION_MULTIPLIER
+from .trades import Portfolio
+from .trades import Stock
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+def get(
+    date: Optional[Union[datetime.date, str]] = None,
+    sync: bool = True,
+    backend: str = 'pandas',
+) -> Union[pd.DataFrame, 'pl.DataFrame']:
+    """
+    :param date: YYYY-MM-DD format. Defaults to today.
+    :param sync: whether to fetch new data (trades and prices) from the API first. If not,
+        today's positions are valued at the last price we know of (and if `robinhood serve`
+        is running, they're taken from its memory).
+    :param backend: either `pandas` or `polars` (see `robinhood.logic.dataframe.backends`).
+    :returns: positions held at the end of `date`, valued at that day's closing price (or
+        the latest quote, for today). Options aren't valued, since we don't have their
+        price history.
+    """
+    backends.check(backend)
+    date = _parse_date(date) or datetime.date.today()
+    with metrics.timer('report_seconds', report='positions'):
+        portfolio = None
+        if not sync and date == datetime.date.today():
+            portfolio = _get_resident_portfolio()
+        if portfolio is None:
+            portfolio = get_portfolio(date, sync=sync)
+
+        return backends.convert(to_dataframe(portfolio, date, sync=sync), backend)
+
+
+def get_portfolio(date: datetime.date, sync: bool = True) -> Portfolio:
+    """
+    :param sync: whether to fetch new data from the API first.
+    :returns: the portfolio, as of the end of `date`.
+    """
+    end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time())
+
+    portfolio = Portfolio()
+    events = itertools.takewhile(
+        lambda event: _get_event_date(event) < end,
+        _get_events(date + datetime.timedelta(days=1), sync=sync),
+    )
+    for _ in _replay(events, portfolio=portfolio):
+        pass
+
+    return portfolio
+
+
+def _get_resident_portfolio() -> Optional[Portfolio]:
+    """
+    :returns: today's portfolio, as held by `robinhood serve` (if it's running).
+    """
+    try:
+        lots = service.get_lots()
+    except OSError:
+        return None
+
+    portfolio = Portfolio()
+    for instrument_id, name, underlying, is_option, date, price, quantity in zip(
+        *(lots[column] for column in service.LOT_COLUMNS)
+    ):
+        portfolio.info[instrument_id] = InstrumentInfo(
+            name=name,
+            underlying=underlying,
+            is_option=is_option,
+        )
+        portfolio.instruments[instrument_id].append(
+            Stock(date=date, price=price, quantity=quantity),
+        )
+
+    return portfolio
+
+
+def to_dataframe(
+    portfolio: Portfolio,
+    date: datetime.date,
+    sync: bool = True,
+) -> pd.DataFrame:
+    rows: List[Dict[str, Any]] = []
+    for instrument_id, lots in portfolio.instruments.items():
+        if not lots:
+            continue
+
+        info = portfolio.info[instrument_id]
+        rows.append({
+            'Name': info.name,
+            'Underlying': info.underlying,
+            'Is Option': info.is_option,
+            'Quantity': sum(lot.quantity for lot in lots),
+            'Cost Basis': sum(lot.price * lot.quantity for lot in lots) * (
+                OPTION_MULTIPLIER if info.is_option else 1
+            ),
+        })
+
+    columns = [
+        'Name',
+        'Underlying',
+        'Is Option',
+        'Quantity',
+        'Cost Basis',
+        'Price',
+        'Market Value',
+        'Unrealized Earnings',
+    ]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.DataFrame(rows).sort_values('Name', ignore_index=True)
+
+    stocks = df.loc[~df['Is Option'], 'Name']
+    prices = get_prices(stocks, date, sync=sync)
+    ratios = _get_split_ratios(date)
+    df['Price'] = df['Name'].map(
+        lambda name: (
+            prices[name] * ratios.get(name, 1)
+            if prices.get(name) is not None
+            else None
+        ),
+    ).astype(float)
+
+    df['Market Value'] = df['Price'] * df['Quantity']
+    df['Unrealized Earnings'] = df['Market Value'] - df['Cost Basis']
+
+    return df[columns].round({
+        'Cost Basis': 2,
+        'Price': 2,
+        'Market Value': 2,
+        'Unrealized Earnings': 2,
+    })
+
+
+def _get_split_ratios(date: datetime.date) -> Dict[str, float]:
+    """
+    Historical prices are adjusted for splits that happened since, but our quantities
+    (as of `date`) aren't.
+
+    :returns: ticker => how much to multiply historical prices by, to undo this.
+    """
+    end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time())
+
+    output: Dict[str, float] = {}
+    for split in StockSplitDBLogic().get():
+        if split.date >= end:
+            output[split.name] = output.get(split.name, 1) * split.to_amount / split.from_amount
+
+    return output
@@ -0,0 +1,101 @@
+"""
+P&L dashboard cuts (e.g. earnings per month, or by holding term), answered from the
+pre-aggregated rollup (see `robinhood.logic.rollup`) rather than every individual sale.
+"""
+import datetime
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+from typing import Union
+
+import pandas as pd
+from sqlalchemy.sql.expression import func
+
+from . import backends
+from ... import database
+from ... import metrics
+from ...models.rollup import PnlRollup
+from ..rollup import update
+from ..trades import sync_all
+from .trades import _parse_date
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+DIMENSIONS = {
+    'Month': PnlRollup.month,
+    'Type': PnlRollup.is_option,
+    'Term': PnlRollup.is_long_term,
+    'Underlying': PnlRollup.underlying,
+}
+
+
+def get(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    by: Sequence[str] = ('Month', 'Type', 'Term', 'Underlying'),
+    is_option: Optional[bool] = None,
+    underlying: Optional[str] = None,
+    sync: bool = True,
+    refresh: bool = True,
+    backend: str = 'pandas',
+) -> Union[pd.DataFrame, 'pl.DataFrame']:
+    """
+    :param from_date: YYYY-MM-DD format. Since sales are aggregated by month, this includes
+        the entire month it's in.
+    :param to_date: YYYY-MM-DD format. Likewise, this includes the entire month.
+    :param by: any of `DIMENSIONS`, to group by.
+    :param is_option: if provided, only includes options (or stocks).
+    :param underlying: if provided, only includes this ticker (and options on it).
+    :param sync: whether to fetch new data from the API first.
+    :param refresh: whether to bring the rollup up-to-date with the database. If not (e.g.
+        when `robinhood sync --watch` already does), this only reads from the database.
+    :param backend: either `pandas` or `polars` (see `robinhood.logic.dataframe.backends`).
+    :returns: Earnings, Count and Volume (number of shares, or contracts, sold), indexed by
+        `by`. Type is either `Stocks` or `Options`, and Term is either `Short` or `Long`.
+    """
+    backends.check(backend)
+    from_date = _parse_date(from_date)
+    to_date = _parse_date(to_date)
+
+    with metrics.timer('report_seconds', report='rollup'):
+        # First, make sure your data is up-to-date.
+        if sync:
+            sync_all(to_date)
+        if refresh:
+            update()
+
+        columns = [DIMENSIONS[name].label(name) for name in by]
+        query = database.session.query(
+            *columns,
+            func.sum(PnlRollup.earnings).label('Earnings'),
+            func.sum(PnlRollup.count).label('Count'),
+            func.sum(PnlRollup.volume).label('Volume'),
+        )
+        if from_date:
+            query = query.filter(PnlRollup.month >= from_date.replace(day=1))
+        if to_date:
+            query = query.filter(PnlRollup.month <= to_date.replace(day=1))
+        if is_option is not None:
+            query = query.filter(PnlRollup.is_option.is_(is_option))
+        if underlying:
+            query = query.filter(PnlRollup.underlying == underlying)
+        if columns:
+            query = query.group_by(*columns).order_by(*columns)
+
+        df = pd.DataFrame(
+            query.all(),
+            columns=[*by, 'Earnings', 'Count', 'Volume'],
+        )
+
+    if 'Type' in df:
+        df['Type'] = df['Type'].map({True: 'Options', False: 'Stocks'})
+    if 'Term' in df:
+        df['Term'] = df['Term'].map({True: 'Long', False: 'Short'})
+
+    df['Earnings'] = df['Earnings'].round(2)
+    if by:
+        df = df.set_index(list(by))
+
+    return backends.convert(df, backend)
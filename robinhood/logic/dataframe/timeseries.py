@@ -0,0 +1,177 @@
+"""
+Day-by-day view of the portfolio: how much capital is tied up in open positions, how many
+positions are open, and how much has been realized so far.
+
+This is computed in a single pass over the event stream (rather than replaying the
+portfolio once per day), so it's cheap enough to chart the entire trade history.
+"""
+import datetime
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import TYPE_CHECKING
+from typing import Union
+
+import pandas as pd
+
+from . import backends
+from ... import metrics
+from ...models import Side
+from ...models.option import OptionStrategy
+from ...models.stock import StockSplit
+from ...models.stock import StockTrade
+from ..trades import OptionExpiration
+from .trades import _apply_event
+from .trades import _get_event_date
+from .trades import _get_events
+from .trades import _parse_date
+from .trades import OPTION_MULTIPLIER
+from .trades import Portfolio
+
+if TYPE_CHECKING:
+    import polars as pl
+
+COLUMNS = ['Cost Basis', 'Open Positions', 'Realized Earnings']
+
+
+def get(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    sync: bool = True,
+    backend: str = 'pandas',
+) -> Union[pd.DataFrame, 'pl.DataFrame']:
+    """
+    :param from_date: YYYY-MM-DD format. Values are still cumulative over the entire
+        history; this only limits which days are returned.
+    :param to_date: YYYY-MM-DD format
+    :param sync: whether to fetch new data from the API first.
+    :param backend: either `pandas` or `polars` (see `robinhood.logic.dataframe.backends`).
+    :returns: a daily DatetimeIndex'ed DataFrame (or a Date column, for Polars), with columns:
+        Cost Basis          total purchase price of positions held at the end of the day
+        Open Positions      number of instruments held at the end of the day
+        Realized Earnings   cumulative earnings from sales, up to (and including) the day
+    """
+    backends.check(backend)
+    from_date = _parse_date(from_date)
+    to_date = _parse_date(to_date)
+
+    with metrics.timer('report_seconds', report='timeseries'):
+        df = to_dataframe(_get_events(to_date, sync=sync), end_date=to_date)
+        if from_date:
+            df = df.loc[pd.Timestamp(from_date):]
+
+        if backend == 'polars':
+            df = df.rename_axis('Date')
+
+        return backends.convert(df, backend)
+
+
+def to_dataframe(
+    events: Iterable[Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade]],
+    end_date: Optional[datetime.date] = None,
+) -> pd.DataFrame:
+    """
+    :param events: in chronological order
+    :param end_date: the last day in the index. Defaults to the date of the last event.
+    """
+    portfolio = Portfolio()
+
+    # One row per event: the changes it makes, and the number of open positions after it.
+    dates: List[datetime.date] = []
+    cost_basis_changes: List[float] = []
+    earnings_changes: List[float] = []
+    open_positions: List[int] = []
+
+    num_open_positions = 0
+    for event in events:
+        instrument_ids = _get_instrument_ids(portfolio, event)
+        was_open = {
+            instrument_id
+            for instrument_id in instrument_ids
+            if portfolio.instruments.get(instrument_id)
+        }
+
+        sales = _apply_event(portfolio, event)
+
+        multiplier = 1 if isinstance(event, (StockSplit, StockTrade)) else OPTION_MULTIPLIER
+        cost_basis = multiplier * (
+            _get_purchase_cost(event)
+            - sum(sale.bought.price * sale.quantity for sale in sales)
+        )
+
+        num_open_positions += sum(
+            bool(portfolio.instruments.get(instrument_id)) - (instrument_id in was_open)
+            for instrument_id in instrument_ids
+        )
+
+        date = _get_event_date(event)
+        dates.append(date.date() if isinstance(date, datetime.datetime) else date)
+        cost_basis_changes.append(cost_basis)
+        earnings_changes.append(sum(sale.earnings for sale in sales))
+        open_positions.append(num_open_positions)
+
+    if not dates:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([]))
+
+    changes = pd.DataFrame(
+        {
+            'Cost Basis': cost_basis_changes,
+            'Open Positions': open_positions,
+            'Realized Earnings': earnings_changes,
+        },
+        index=pd.DatetimeIndex(dates),
+    )
+    daily = changes.groupby(level=0).agg({
+        'Cost Basis': 'sum',
+        'Open Positions': 'last',
+        'Realized Earnings': 'sum',
+    })
+
+    index = pd.date_range(
+        daily.index[0],
+        pd.Timestamp(end_date) if end_date else daily.index[-1],
+        freq='D',
+    )
+    daily = daily.reindex(index)
+
+    output = pd.DataFrame(index=index)
+    output['Cost Basis'] = daily['Cost Basis'].fillna(0).cumsum().round(2)
+    output['Open Positions'] = daily['Open Positions'].ffill().astype(int)
+    output['Realized Earnings'] = daily['Realized Earnings'].fillna(0).cumsum().round(2)
+
+    return output
+
+
+def _get_instrument_ids(
+    portfolio: Portfolio,
+    event: Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade],
+) -> Set[int]:
+    """
+    :returns: the portfolio's instruments affected by this event.
+    """
+    if isinstance(event, OptionStrategy):
+        return {leg.option.instrument_id for leg in event.legs}
+
+    if isinstance(event, OptionExpiration):
+        return {event.option.instrument_id}
+
+    if isinstance(event, StockSplit):
+        return set(portfolio.get_stock_ids(event.name))
+
+    return {event.instrument_id}
+
+
+def _get_purchase_cost(
+    event: Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade],
+) -> float:
+    """
+    :returns: amount spent opening positions with this event (per share).
+    """
+    if isinstance(event, StockTrade):
+        return event.price * event.quantity if event.side == Side.BUY else 0
+
+    if isinstance(event, OptionStrategy):
+        return sum(leg.price * leg.quantity for leg in event.legs if leg.side == Side.BUY)
+
+    return 0
@@ -1,27 +1,69 @@
 import datetime
+import heapq
+import itertools
 from collections import defaultdict
 from collections import deque
 from typing import Any
 from typing import DefaultDict
 from typing import Deque
+from typing import Dict
+from typing import Iterable
 from typing import Iterator
 from typing import List
 from typing import NamedTuple
 from typing import Optional
+from typing import TYPE_CHECKING
 from typing import Union
 
+import numpy as np
 import pandas as pd
 
+from ... import metrics
+from ... import service
 from ...models import Side
+from ...models.option import Option
 from ...models.option import OptionStrategy
 from ...models.option import OptionTrade
 from ...models.stock import StockSplit
 from ...models.stock import StockTrade
 from ..database.stock_split import StockSplitDBLogic
 from ..trades import get_options_expirations
-from ..trades import get_options_orders
-from ..trades import get_stock_orders
+from ..trades import iter_options_orders
+from ..trades import iter_stock_orders
 from ..trades import OptionExpiration
+from ..trades import sync_all
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+# Each options contract covers 100 shares.
+OPTION_MULTIPLIER = 100
+
+COLUMNS = [
+    'Name',
+    'Underlying',
+    'Is Option',
+    'Date Bought',
+    'Price Bought',
+    'Date Sold',
+    'Price Sold',
+    'Quantity',
+    'Earnings',
+]
+
+# Added by `get(returns=True)` (see `add_returns`). Cost Basis is added to the report first,
+# from each sale's (unrounded) price and quantity.
+RETURN_COLUMNS = [
+    'Cost Basis',
+    'Holding Days',
+    'Return',
+    'Annualized Return',
+]
+
+# Compounding the return of a shorter hold over a year blows it up into meaningless numbers
+# (e.g. 2% over a day is ~1,377x), so these aren't annualized.
+MIN_ANNUALIZED_DAYS = 30
 
 
 class Stock(NamedTuple):
@@ -35,31 +77,134 @@ class Trade(NamedTuple):
     price: float
 
 
+class InstrumentInfo(NamedTuple):
+    # Ticker for stocks, and OCC symbol for options.
+    name: str
+    underlying: str
+    is_option: bool
+
+
 class Sale(NamedTuple):
     name: str
     bought: Trade
     sold: Trade
     quantity: float
     earnings: float
+    underlying: str
+    is_option: bool
+    instrument_id: int
 
 
 def get(
     from_date: Optional[Union[datetime.date, str]] = None,
     to_date: Optional[Union[datetime.date, str]] = None,
-) -> pd.DataFrame:
+    sync: bool = True,
+    backend: str = 'pandas',
+    returns: bool = False,
+) -> Union[pd.DataFrame, 'pl.DataFrame']:
     """
     :param from_date: YYYY-MM-DD format
     :param to_date: YYYY-MM-DD format
+    :param sync: if False, only what's already in the database is used (e.g. when it's kept
+        up-to-date by `robinhood sync --watch`), so this never waits on the API. If
+        `robinhood serve` is running, this is answered from its memory instead.
+    :param backend: either `pandas` or `polars` (see `robinhood.logic.dataframe.backends`).
+    :param returns: whether to add `RETURN_COLUMNS`, so that trades can be compared by how
+        well they used their capital (see `add_returns`).
+    :raises: ValueError
     """
-    if isinstance(from_date, str):
-        from_date = datetime.datetime.strptime(from_date, '%Y-%m-%d').date()
-    if isinstance(to_date, str):
-        to_date = datetime.datetime.strptime(to_date, '%Y-%m-%d').date()
+    # NOTE: This imports us, so it can't be imported at the top.
+    from . import backends
+
+    backends.check(backend)
+    with metrics.timer('report_seconds', report='trades'):
+        df = None
+        if not sync:
+            try:
+                df = service.get_trades(from_date, to_date, cost_basis=returns)
+            except OSError:
+                # It isn't running, so we'll have to replay the database ourselves.
+                pass
+
+            # It's running an older version, which doesn't know about cost bases.
+            if df is not None and returns and 'Cost Basis' not in df:
+                df = None
+
+        if df is None:
+            sales = _get_trades(
+                from_date=_parse_date(from_date),
+                to_date=_parse_date(to_date),
+                sync=sync,
+            )
+            if backend == 'polars':
+                df = backends.from_sales(sales, cost_basis=returns)
+                return backends.add_returns(df) if returns else df
+
+            df = to_dataframe(sales, cost_basis=returns)
+
+        if returns:
+            df = add_returns(df)
+
+        return backends.convert(df, backend)
+
 
+def iter_chunks(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    chunksize: int = 10000,
+    sync: bool = True,
+    backend: str = 'pandas',
+    returns: bool = False,
+) -> Iterator[Union[pd.DataFrame, 'pl.DataFrame']]:
+    """
+    Like `get`, but yields the report in DataFrames of (at most) `chunksize` rows. Since the
+    trade history is streamed through, memory usage is bounded by `chunksize` (and the
+    positions held at any point in time), rather than the length of the history.
+
+    :raises: ValueError
+    """
+    from . import backends
+
+    backends.check(backend)
+    sales = _get_trades(
+        from_date=_parse_date(from_date),
+        to_date=_parse_date(to_date),
+        sync=sync,
+    )
+    while True:
+        chunk = list(itertools.islice(sales, chunksize))
+        if not chunk:
+            return
+
+        if backend == 'polars':
+            df = backends.from_sales(chunk, cost_basis=returns)
+            yield backends.add_returns(df) if returns else df
+        else:
+            df = to_dataframe(chunk, cost_basis=returns)
+            yield add_returns(df) if returns else df
+
+
+def _parse_date(value: Optional[Union[datetime.date, str]]) -> Optional[datetime.date]:
+    """
+    :param value: YYYY-MM-DD format
+    """
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+    return value
+
+
+def to_dataframe(sales: Iterable[Sale], cost_basis: bool = False) -> pd.DataFrame:
+    """
+    :param cost_basis: whether to add what was paid for what was sold (unrounded, for
+        `add_returns`).
+    """
     data: List[List[Any]] = []
-    for sale in _get_trades(from_date=from_date, to_date=to_date):
-        data.append([
+    for sale in sales:
+        row = [
             sale.name,
+            sale.underlying,
+            sale.is_option,
             sale.bought.date,
             round(sale.bought.price, 2),
             sale.sold.date,
@@ -67,137 +212,366 @@ def get(
             # assumes we don't have partial purchases (though supported)
             int(sale.quantity),
             round(sale.earnings, 2),
-        ])
-
-    return pd.DataFrame(
-        data,
-        columns=[
-            'Name',
-            'Date Bought',
-            'Price Bought',
-            'Date Sold',
-            'Price Sold',
-            'Quantity',
-            'Earnings',
-        ],
+        ]
+        if cost_basis:
+            row.append(_get_cost_basis(sale))
+
+        data.append(row)
+
+    return pd.DataFrame(data, columns=COLUMNS + ['Cost Basis'] if cost_basis else COLUMNS)
+
+
+def add_returns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computed over whole columns (rather than sale by sale), so this stays cheap for millions
+    of sales.
+
+    :param df: the trades report, with its cost basis (see `to_dataframe`).
+    :returns: a copy of it, with:
+        Cost Basis          what was paid for what was sold (including the options multiplier)
+        Holding Days        days between buying and selling it
+        Return              earnings, as a fraction of the cost basis (NaN if nothing was paid)
+        Annualized Return   the return, compounded over a year (NaN if it was held for less
+                            than `MIN_ANNUALIZED_DAYS`)
+    :raises: ValueError
+    """
+    # NOTE: The report's prices are rounded (and its quantities truncated), so this can't be
+    # worked out from them.
+    if 'Cost Basis' not in df:
+        raise ValueError('Cost basis is missing: use `to_dataframe(sales, cost_basis=True)`.')
+
+    cost_basis = df['Cost Basis'].to_numpy(dtype=np.float64)
+    days = _get_days(df['Date Sold']) - _get_days(df['Date Bought'])
+
+    with np.errstate(all='ignore'):
+        returns = np.where(
+            cost_basis > 0,
+            df['Earnings'].to_numpy(dtype=np.float64) / cost_basis,
+            np.nan,
+        )
+        annualized = np.where(
+            days >= MIN_ANNUALIZED_DAYS,
+            np.power(1 + returns, 365 / days) - 1,
+            np.nan,
+        )
+
+    return df.assign(**{
+        'Cost Basis': cost_basis.round(2),
+        'Holding Days': days,
+        'Return': returns,
+        'Annualized Return': annualized,
+    })
+
+
+def get_returns_by_underlying(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Options count towards their underlying, at the value of the shares they cover.
+
+    :param df: the trades report, with returns (see `get`).
+    :returns: indexed by Underlying, in order of the capital put in:
+        Cost Basis                  total paid for what was sold
+        Earnings                    total realized
+        Return                      total earnings over total cost basis, i.e. weighted by
+                                    capital
+        Holding Days                average time held, weighted by capital
+        Annualized Return (simple)  earnings per dollar-day of capital held, over a year
+                                    (without compounding, unlike each trade's)
+    :raises: ValueError
+    """
+    if 'Holding Days' not in df:
+        df = add_returns(df)
+
+    cost_basis = df['Cost Basis'].to_numpy(dtype=np.float64)
+    totals = pd.DataFrame(
+        {
+            'Cost Basis': cost_basis,
+            'Earnings': df['Earnings'].to_numpy(dtype=np.float64),
+            'Capital Days': cost_basis * df['Holding Days'].to_numpy(dtype=np.float64),
+
+            # Like `add_returns`, same-day trades count as a day.
+            'Capital Held': cost_basis * np.maximum(df['Holding Days'].to_numpy(), 1),
+        },
+        index=df['Underlying'],
+    ).groupby(level=0).sum()
+
+    invested = totals['Cost Basis'].where(totals['Cost Basis'] > 0)
+    output = pd.DataFrame(
+        {
+            'Cost Basis': totals['Cost Basis'].round(2),
+            'Earnings': totals['Earnings'].round(2),
+            'Return': totals['Earnings'] / invested,
+            'Holding Days': totals['Capital Days'] / invested,
+            'Annualized Return (simple)': (
+                totals['Earnings'] / totals['Capital Held'].where(invested.notna()) * 365
+            ),
+        },
     )
+    output.index.name = 'Underlying'
+
+    return output.sort_values('Cost Basis', ascending=False)
+
+
+def _get_cost_basis(sale: Sale) -> float:
+    return (
+        sale.bought.price
+        * sale.quantity
+        * (OPTION_MULTIPLIER if sale.is_option else 1)
+    )
+
+
+def _get_days(dates: pd.Series) -> np.ndarray:
+    """
+    :returns: days since the epoch.
+    """
+    return pd.to_datetime(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
 
 
 def _get_trades(
     from_date: Optional[datetime.date] = None,
     to_date: Optional[datetime.date] = None,
+    sync: bool = True,
+) -> Iterator[Sale]:
+    return _replay(_get_events(to_date, sync=sync), from_date=from_date)
+
+
+def _replay(
+    events: Iterable[Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade]],
+    from_date: Optional[datetime.date] = None,
+    portfolio: Optional['Portfolio'] = None,
 ) -> Iterator[Sale]:
-    portfolio = Portfolio()
-    for event in _get_events(to_date):
-        if isinstance(event, StockTrade):
-            if event.side == Side.BUY:
-                portfolio.buy(event)
+    """
+    :param events: in chronological order
+    :param from_date: only sales on (or after) this date will be returned
+    :param portfolio: if provided, its state will be updated through the replay.
+    """
+    if not portfolio:
+        portfolio = Portfolio()
+
+    num_events = 0
+    for event in events:
+        num_events += 1
+        yield from _filter_sales(_apply_event(portfolio, event), from_date)
+
+    metrics.increment('events_replayed_total', num_events)
+    metrics.increment('lots_matched_total', portfolio.lots_matched)
+    metrics.set_max('peak_lots_held', portfolio.peak_lots_held)
+
+
+def _apply_event(
+    portfolio: 'Portfolio',
+    event: Union[OptionExpiration, OptionStrategy, OptionTrade, StockSplit, StockTrade],
+) -> List[Sale]:
+    """
+    :param event: options trades can either be replayed as strategies, or individual legs.
+    :returns: sales resulting from this event.
+    """
+    if isinstance(event, StockTrade):
+        if event.side == Side.BUY:
+            portfolio.buy(event)
+            return []
+
+        return list(portfolio.sell(event))
+
+    if isinstance(event, StockSplit):
+        portfolio.apply_split(event)
+        return []
+
+    if isinstance(event, OptionStrategy):
+        sales: List[Sale] = []
+        for leg in event.legs:
+            if leg.side == Side.BUY:
+                portfolio.buy_option(leg)
             else:
-                yield from filter(
-                    lambda sale: sale.sold.date >= from_date,
-                    portfolio.sell(event),
-                )
-        elif isinstance(event, StockSplit):
-            portfolio.apply_split(event)
-        elif isinstance(event, OptionStrategy):
-            for leg in event.legs:
-                if leg.side == Side.BUY:
-                    portfolio.buy_option(leg)
-                else:
-                    yield from filter(
-                        lambda sale: sale.sold.date >= from_date,
-                        portfolio.sell_option(leg),
-                    )
-        elif isinstance(event, OptionExpiration):
-            trade = OptionTrade(
-                uuid='does-not-matter',
-                option_id=event.option.id,
-                side=Side.SELL,
-                date=event.option.expiration_date,
-                price=0,
-                quantity=event.quantity,
-            )
-            trade.option = event.option
+                sales.extend(portfolio.sell_option(leg))
 
-            yield from filter(
-                lambda sale: sale.sold.date >= from_date,
-                portfolio.sell_option(trade),
-            )
+        return sales
+
+    if isinstance(event, OptionTrade):
+        if event.side == Side.BUY:
+            portfolio.buy_option(event)
+            return []
+
+        return list(portfolio.sell_option(event))
+
+    if isinstance(event, OptionExpiration):
+        trade = OptionTrade(
+            uuid='does-not-matter',
+            option_id=event.option.id,
+            side=Side.SELL,
+            date=event.option.expiration_date,
+            price=0,
+            quantity=event.quantity,
+        )
+        trade.option = event.option
+
+        return list(portfolio.sell_option(trade))
+
+    return []
+
+
+def _filter_sales(sales: Iterable[Sale], from_date: Optional[datetime.date]) -> Iterator[Sale]:
+    if not from_date:
+        return iter(sales)
+
+    return filter(lambda sale: sale.sold.date >= from_date, sales)
 
 
 def _get_events(
     to_date: Optional[datetime.date] = None,
-) -> Iterator[Union[OptionStrategy, StockSplit, StockTrade]]:
-    stock_trades = {
-        item.date: item
-        for item in get_stock_orders(
-            to_date=to_date,
-            most_recent_first=False,
-        )
-    }
-    stock_splits = {
-        item.date: item
-        for item in StockSplitDBLogic().get()
-    }
-    options_trades = {
-        item.date: item
-        for item in get_options_orders(to_date=to_date)
-    }
-    options_expirations = {
-        item.option.expiration_date: item
-        for item in get_options_expirations(to_date=to_date)
+    sync: bool = True,
+) -> Iterator[Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade]]:
+    """
+    :param sync: whether to fetch new data from the API first.
+    :returns: every event, in chronological order. These are streamed from the database, so
+        memory usage doesn't grow with the length of the trade history.
+    """
+    # First, make sure your data is up-to-date.
+    if sync:
+        sync_all(to_date)
+
+    # NOTE: When events happen at the same time, they're ordered by their position here.
+    streams = {
+        'option_expiration': sorted(
+            get_options_expirations(to_date=to_date),
+            key=_get_event_date,
+        ),
+        'option_strategy': iter_options_orders(to_date=to_date),
+        'stock_split': StockSplitDBLogic().get(),
+        'stock_trade': iter_stock_orders(to_date=to_date, most_recent_first=False),
     }
+    if metrics.is_enabled():
+        streams = {name: _count_events(name, items) for name, items in streams.items()}
 
-    events = sorted(
-        {
-            **options_expirations,
-            **options_trades,
-            **stock_splits,
-            **stock_trades,
-        }.items(),
-    )
-    for event in map(lambda x: x[1], events):
+    yield from heapq.merge(*streams.values(), key=_get_event_date)
+
+
+def _get_event_date(
+    event: Union[OptionExpiration, OptionStrategy, StockSplit, StockTrade],
+) -> datetime.datetime:
+    if isinstance(event, OptionExpiration):
+        return event.option.expiration_date
+
+    return event.date
+
+
+def _count_events(name: str, events: Iterable[Any]) -> Iterator[Any]:
+    count = 0
+    for event in events:
+        count += 1
         yield event
 
+    metrics.increment('events_loaded_total', count, type=name)
+
 
 class Portfolio:
     def __init__(self) -> None:
-        self.instruments: DefaultDict[Deque[List[Stock]]] = defaultdict(
-            lambda: deque([]),
-        )
+        # Instruments are keyed by their (interned) IDs, rather than names.
+        self.instruments: DefaultDict[int, Deque[Stock]] = defaultdict(deque)
+        self.info: Dict[int, InstrumentInfo] = {}
+
+        # These are cheap to keep track of, and useful to understand performance.
+        self.lots_held = 0
+        self.peak_lots_held = 0
+        self.lots_matched = 0
+
+    def get_stock_ids(self, ticker: str) -> List[int]:
+        return [
+            instrument_id
+            for instrument_id, info in self.info.items()
+            if info.name == ticker and not info.is_option
+        ]
 
     def buy(self, trade: StockTrade) -> None:
-        self.instruments[trade.name].append(
-            Stock(
-                date=trade.date.date(), price=trade.price,
-                quantity=trade.quantity,
-            ),
-        )
+        self._add_lot(self._register_stock(trade), trade.date, trade.price, trade.quantity)
 
     def buy_option(self, trade: OptionTrade) -> None:
-        self.instruments[trade.option.serialized_name].append(
-            Stock(
-                date=trade.date.date(), price=trade.price,
-                quantity=trade.quantity,
-            ),
+        self._add_lot(
+            self._register_option(trade.option),
+            trade.date,
+            trade.price,
+            trade.quantity,
         )
 
     def sell(self, trade: StockTrade) -> Iterator[Sale]:
-        quantity = trade.quantity
+        return self._sell(
+            self._register_stock(trade),
+            trade.date,
+            trade.price,
+            trade.quantity,
+        )
+
+    def sell_option(self, trade: OptionTrade) -> Iterator[Sale]:
+        return self._sell(
+            self._register_option(trade.option),
+            trade.date,
+            trade.price,
+            trade.quantity,
+            multiplier=OPTION_MULTIPLIER,
+        )
+
+    def _register_stock(self, trade: StockTrade) -> int:
+        if trade.instrument_id not in self.info:
+            self.info[trade.instrument_id] = InstrumentInfo(
+                name=trade.name,
+                underlying=trade.name,
+                is_option=False,
+            )
+
+        return trade.instrument_id
+
+    def _register_option(self, option: Option) -> int:
+        if option.instrument_id not in self.info:
+            self.info[option.instrument_id] = InstrumentInfo(
+                name=option.serialized_name,
+                underlying=option.name,
+                is_option=True,
+            )
+
+        return option.instrument_id
+
+    def _add_lot(
+        self,
+        instrument_id: int,
+        date: datetime.datetime,
+        price: float,
+        quantity: float,
+    ) -> None:
+        self.instruments[instrument_id].append(
+            Stock(date=date.date(), price=price, quantity=quantity),
+        )
+
+        self.lots_held += 1
+        if self.lots_held > self.peak_lots_held:
+            self.peak_lots_held = self.lots_held
+
+    def _sell(
+        self,
+        instrument_id: int,
+        date: datetime.datetime,
+        price: float,
+        quantity: float,
+        multiplier: int = 1,
+    ) -> Iterator[Sale]:
+        info = self.info[instrument_id]
+        lots = self.instruments[instrument_id]
         while quantity:
             try:
                 # Assumes FIFO
-                item = self.instruments[trade.name].popleft()
+                item = lots.popleft()
             except IndexError:
                 # Assumes no selling of items you don't have.
                 raise IndexError(
-                    f'Attempting to sell {quantity} more {trade.name} than you own.',
+                    f'Attempting to sell {quantity} more {info.name} than you own. '
+                    'This is usually caused by a missing stock split: '
+                    'try `python -m robinhood.logic.stock_split detect`.',
                 )
 
+            self.lots_matched += 1
             if item.quantity <= quantity:
                 quantity_sold = item.quantity
+                self.lots_held -= 1
             else:
-                self.instruments[trade.name].appendleft(
+                lots.appendleft(
                     Stock(
                         date=item.date, price=item.price,
                         quantity=item.quantity - quantity,
@@ -206,46 +580,30 @@ class Portfolio:
                 quantity_sold = quantity
 
             quantity -= quantity_sold
-            earnings = quantity_sold * (trade.price - item.price)
+            earnings = quantity_sold * (price - item.price) * multiplier
             yield Sale(
-                name=trade.name,
+                name=info.name,
                 bought=Trade(date=item.date, price=item.price),
-                sold=Trade(date=trade.date.date(), price=trade.price),
+                sold=Trade(date=date.date(), price=price),
                 quantity=quantity_sold,
                 earnings=earnings,
-            )
-
-    def sell_option(self, trade: OptionTrade) -> Iterator[Sale]:
-        for sale in self.sell(
-            StockTrade(
-                id=0,
-                uuid='does-not-matter',
-                name=trade.option.serialized_name,
-                side=trade.side,
-                date=trade.date,
-                price=trade.price,
-                quantity=trade.quantity,
-            ),
-        ):
-            yield Sale(
-                name=sale.name,
-                bought=sale.bought,
-                sold=sale.sold,
-                quantity=sale.quantity,
-                earnings=sale.earnings * 100,
+                underlying=info.underlying,
+                is_option=info.is_option,
+                instrument_id=instrument_id,
             )
 
     def apply_split(self, info: StockSplit) -> None:
         if info.from_amount < info.to_amount:
             # TODO: handle non-standard numbers (2 to 3)
-            self.instruments[info.name] = deque([
-                Stock(
-                    date=stock.date,
-                    price=stock.price / info.to_amount,
-                    quantity=stock.quantity * info.to_amount,
-                )
-                for stock in self.instruments[info.name]
-            ])
+            for instrument_id in self.get_stock_ids(info.name):
+                self.instruments[instrument_id] = deque([
+                    Stock(
+                        date=stock.date,
+                        price=stock.price / info.to_amount,
+                        quantity=stock.quantity * info.to_amount,
+                    )
+                    for stock in self.instruments[instrument_id]
+                ])
         else:
             # TODO: handle stock joins
             raise NotImplementedError
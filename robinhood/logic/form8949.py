@@ -0,0 +1,149 @@
+"""
+Exports realized sales as IRS Form 8949-style CSVs, one per tax year and holding term:
+
+    <directory>/2020-short.csv
+    <directory>/2020-long.csv
+    ...
+
+Sales are streamed from the portfolio replay straight to disk, so memory usage doesn't grow
+with the length of the trade history.
+
+Usage: python -m robinhood.logic.form8949 DIRECTORY [--from-date YYYY-MM-DD] [--to-date ...]
+"""
+import argparse
+import csv
+import datetime
+import os
+from functools import lru_cache
+from typing import Any
+from typing import Dict
+from typing import IO
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .. import metrics
+from .dataframe.trades import _get_trades
+from .dataframe.trades import _parse_date
+from .dataframe.trades import OPTION_MULTIPLIER
+from .dataframe.trades import Sale
+from .rollup import is_long_term
+
+
+HEADER = (
+    'Description',
+    'Date Acquired',
+    'Date Sold',
+    'Proceeds',
+    'Cost Basis',
+    'Code',
+    'Adjustment',
+    'Gain or Loss',
+)
+
+# Large writes are much faster than many small ones.
+BUFFER_SIZE = 1 << 20
+
+
+def export(
+    directory: str,
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    sync: bool = True,
+) -> Dict[Tuple[int, str], int]:
+    """
+    :param from_date: YYYY-MM-DD format. Only sales on (or after) this date are exported.
+    :param to_date: YYYY-MM-DD format
+    :param sync: whether to fetch new data from the API first.
+    :returns: (year, term) => number of rows written
+    """
+    with metrics.timer('report_seconds', report='form8949'):
+        return write_sales(
+            _get_trades(
+                from_date=_parse_date(from_date),
+                to_date=_parse_date(to_date),
+                sync=sync,
+            ),
+            directory,
+        )
+
+
+def write_sales(sales: Iterable[Sale], directory: str) -> Dict[Tuple[int, str], int]:
+    """
+    :returns: (year, term) => number of rows written
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    files: Dict[Tuple[int, str], IO[str]] = {}
+    writers: Dict[Tuple[int, str], Any] = {}
+    counts: Dict[Tuple[int, str], int] = {}
+    try:
+        for sale in sales:
+            term = 'long' if is_long_term(sale.bought.date, sale.sold.date) else 'short'
+            key = (sale.sold.date.year, term)
+
+            writer = writers.get(key)
+            if not writer:
+                f = files[key] = open(
+                    os.path.join(directory, f'{key[0]}-{term}.csv'),
+                    'w',
+                    newline='',
+                    buffering=BUFFER_SIZE,
+                )
+                writer = writers[key] = csv.writer(f)
+                writer.writerow(HEADER)
+                counts[key] = 0
+
+            writer.writerow(to_row(sale))
+            counts[key] += 1
+    finally:
+        for f in files.values():
+            f.close()
+
+    return counts
+
+
+def to_row(sale: Sale) -> Tuple[str, ...]:
+    multiplier = OPTION_MULTIPLIER if sale.is_option else 1
+    proceeds = sale.sold.price * sale.quantity * multiplier
+    cost_basis = sale.bought.price * sale.quantity * multiplier
+
+    return (
+        f'{sale.quantity:g} {"contracts" if sale.is_option else "sh"} {sale.name}',
+        _format_date(sale.bought.date),
+        _format_date(sale.sold.date),
+        f'{proceeds:.2f}',
+        f'{cost_basis:.2f}',
+
+        # We don't track wash sales (or any other adjustments) yet.
+        '',
+        '0.00',
+
+        f'{sale.earnings:.2f}',
+    )
+
+
+# Trades cluster on relatively few dates, and `strftime` is surprisingly slow.
+@lru_cache(maxsize=4096)
+def _format_date(value: datetime.date) -> str:
+    return value.strftime('%m/%d/%Y')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--from-date', help='YYYY-MM-DD')
+    parser.add_argument('--to-date', help='YYYY-MM-DD')
+    args = parser.parse_args()
+
+    from .. import database
+    database.session.setup()
+
+    counts = export(args.directory, from_date=args.from_date, to_date=args.to_date)
+    for (year, term), count in sorted(counts.items()):
+        print(f'{year} {term:<6} {count:>8} sales')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""
+Daily price history for the tickers we hold, so that open positions can be valued on any
+date without a network call per ticker per day.
+
+Prices are fetched in batches through the client, and kept in a compact column-wise store:
+for each ticker, a sorted array of dates and a parallel array of closing prices. Lookups are
+binary searches over those arrays. The store is persisted to `prices.npz` (configurable
+through the `ROBINHOOD_PRICES` environment variable; an empty string keeps it in memory).
+
+NOTE: Like the API's, historical prices are split-adjusted.
+"""
+import datetime
+import os
+import time
+from functools import lru_cache
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from .. import metrics
+from ..client import get_client
+from ..util import get_json
+from ..util import get_path_to
+
+
+# The API accepts a limited number of symbols per request.
+BATCH_SIZE = 50
+
+# The longest span the API supports, for daily intervals.
+HISTORICALS_SPAN = '5year'
+
+# How long (in seconds) the latest quote is good for.
+QUOTE_TTL = 60
+
+
+class PriceHistory:
+    def __init__(self) -> None:
+        # ticker => sorted dates (as ordinals), and their closing prices
+        self.dates: Dict[str, np.ndarray] = {}
+        self.prices: Dict[str, np.ndarray] = {}
+
+        # ticker => the last date (as an ordinal) we've asked the API for. This can be later
+        # than the last price we have, e.g. for delisted stocks.
+        self.fetched_through: Dict[str, int] = {}
+
+    def add(
+        self,
+        ticker: str,
+        dates: Iterable[datetime.date],
+        prices: Iterable[float],
+    ) -> None:
+        new_dates = np.fromiter((date.toordinal() for date in dates), dtype=np.int32)
+        new_prices = np.fromiter(prices, dtype=np.float64)
+        if ticker in self.dates:
+            # Newer values win, since `np.unique` keeps the first occurrence.
+            new_dates = np.concatenate([new_dates, self.dates[ticker]])
+            new_prices = np.concatenate([new_prices, self.prices[ticker]])
+
+        self.dates[ticker], indices = np.unique(new_dates, return_index=True)
+        self.prices[ticker] = new_prices[indices]
+
+    def get(self, ticker: str, date: datetime.date) -> Optional[float]:
+        """
+        :returns: the closing price on `date`, or the last trading day before it.
+        """
+        dates = self.dates.get(ticker)
+        if dates is None:
+            return None
+
+        index = np.searchsorted(dates, date.toordinal(), side='right') - 1
+        if index < 0:
+            return None
+
+        return float(self.prices[ticker][index])
+
+    def get_range(
+        self,
+        ticker: str,
+        from_date: datetime.date,
+        to_date: datetime.date,
+    ) -> List[Tuple[datetime.date, float]]:
+        """
+        :returns: (date, price) for every trading day between the two dates (inclusive).
+        """
+        dates = self.dates.get(ticker)
+        if dates is None:
+            return []
+
+        start = np.searchsorted(dates, from_date.toordinal(), side='left')
+        end = np.searchsorted(dates, to_date.toordinal(), side='right')
+
+        return [
+            (datetime.date.fromordinal(int(date)), float(price))
+            for date, price in zip(dates[start:end], self.prices[ticker][start:end])
+        ]
+
+    def is_covered(self, ticker: str, date: datetime.date) -> bool:
+        return self.fetched_through.get(ticker, 0) >= date.toordinal()
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        for ticker in self.dates:
+            arrays[f'{ticker}/dates'] = self.dates[ticker]
+            arrays[f'{ticker}/prices'] = self.prices[ticker]
+
+        tickers = sorted(self.fetched_through)
+        arrays['fetched_through/tickers'] = np.array(tickers, dtype=str)
+        arrays['fetched_through/dates'] = np.array(
+            [self.fetched_through[ticker] for ticker in tickers],
+            dtype=np.int32,
+        )
+
+        # Write to a temporary file first, so that we never leave a truncated store behind.
+        with open(f'{path}.tmp', 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PriceHistory':
+        history = cls()
+        try:
+            data = np.load(path)
+        except FileNotFoundError:
+            return history
+
+        with data:
+            for key in data.files:
+                ticker, column = key.rsplit('/', 1)
+                if ticker == 'fetched_through':
+                    continue
+
+                getattr(history, column)[ticker] = data[key]
+
+            history.fetched_through = dict(
+                zip(
+                    data['fetched_through/tickers'].tolist(),
+                    data['fetched_through/dates'].tolist(),
+                ),
+            )
+
+        return history
+
+
+class QuoteCache:
+    """The latest quote for each ticker, which is only good for `ttl` seconds."""
+
+    def __init__(self, ttl: float = QUOTE_TTL) -> None:
+        self.ttl = ttl
+
+        # ticker => (price, time fetched)
+        self.quotes: Dict[str, Tuple[float, float]] = {}
+
+    def get(self, ticker: str) -> Optional[float]:
+        try:
+            price, fetched_at = self.quotes[ticker]
+        except KeyError:
+            return None
+
+        if time.monotonic() - fetched_at > self.ttl:
+            return None
+
+        return price
+
+    def set(self, ticker: str, price: float) -> None:
+        self.quotes[ticker] = (price, time.monotonic())
+
+
+def get_prices(
+    tickers: Iterable[str],
+    date: Optional[datetime.date] = None,
+    sync: bool = True,
+) -> Dict[str, Optional[float]]:
+    """
+    :param date: defaults to today, in which case the latest quotes are used.
+    :param sync: if False, only prices we already have are used. For today, that's a cached
+        quote (however old), or the last closing price in the store.
+    :returns: ticker => price (None if unknown)
+    """
+    tickers = sorted(set(tickers))
+    history = get_price_history()
+    if not date or date >= datetime.date.today():
+        if sync:
+            return get_latest_quotes(tickers)
+
+        today = datetime.date.today()
+        cache = get_quote_cache()
+        return {
+            ticker: (
+                cache.quotes[ticker][0]
+                if ticker in cache.quotes
+                else history.get(ticker, today)
+            )
+            for ticker in tickers
+        }
+
+    missing = [ticker for ticker in tickers if not history.is_covered(ticker, date)]
+    if missing and sync:
+        sync_historicals(missing)
+
+    return {ticker: history.get(ticker, date) for ticker in tickers}
+
+
+def get_latest_quotes(tickers: Iterable[str]) -> Dict[str, Optional[float]]:
+    cache = get_quote_cache()
+
+    output = {ticker: cache.get(ticker) for ticker in tickers}
+    missing = [ticker for ticker, price in output.items() if price is None]
+    metrics.increment('quote_cache_hits_total', len(output) - len(missing))
+    metrics.increment('quote_cache_misses_total', len(missing))
+
+    for batch in _batch(missing):
+        for item in _get_quotes(batch):
+            # NOTE: Some quotes (e.g. for halted stocks) don't have a last trade price.
+            price = item.get('last_trade_price') or item.get('previous_close')
+            if price is not None:
+                cache.set(item['symbol'], float(price))
+                output[item['symbol']] = float(price)
+
+    return output
+
+
+def sync_historicals(tickers: Iterable[str]) -> None:
+    """
+    Fetches daily closing prices for these tickers, and saves them to the price store.
+    """
+    import pyrh.urls
+
+    history = get_price_history()
+    today = datetime.date.today().toordinal()
+    client = get_client()
+    for batch in _batch(list(tickers)):
+        data = get_json(
+            client,
+            pyrh.urls.HISTORICALS,
+            params={
+                'symbols': ','.join(batch),
+                'interval': 'day',
+                'span': HISTORICALS_SPAN,
+                'bounds': 'regular',
+            },
+        )
+        for item in data['results'] or []:
+            if not item:
+                continue
+
+            points = item['historicals']
+            history.add(
+                item['symbol'],
+                (_parse_date(point['begins_at']) for point in points),
+                (float(point['close_price']) for point in points),
+            )
+
+        for ticker in batch:
+            history.fetched_through[ticker] = today
+
+    path = _get_path()
+    if path:
+        history.save(path)
+
+
+def _get_quotes(tickers: List[str]) -> List[Dict[str, Any]]:
+    import pyrh.urls
+
+    data = get_json(get_client(), pyrh.urls.QUOTES, params={'symbols': ','.join(tickers)})
+    return [item for item in data['results'] if item]
+
+
+@lru_cache(maxsize=1)
+def get_price_history() -> PriceHistory:
+    path = _get_path()
+    if not path:
+        return PriceHistory()
+
+    return PriceHistory.load(path)
+
+
+@lru_cache(maxsize=1)
+def get_quote_cache() -> QuoteCache:
+    return QuoteCache()
+
+
+def _get_path() -> str:
+    return os.environ.get('ROBINHOOD_PRICES', get_path_to('prices.npz'))
+
+
+def _batch(tickers: List[str]) -> Iterable[List[str]]:
+    for index in range(0, len(tickers), BATCH_SIZE):
+        yield tickers[index:index + BATCH_SIZE]
+
+
+def _parse_date(value: str) -> datetime.date:
+    # e.g. 2020-11-20T00:00:00Z
+    return datetime.date.fromisoformat(value[:10])
@@ -0,0 +1,178 @@
+"""
+Rebuilds the database from the raw payload archive, without a network connection.
+
+Usage: python -m robinhood.logic.replay [--archive PATH] [--force]
+
+The archive only has what was fetched after archiving was turned on, so this refuses to run
+unless it has every trade that's already in the database. Otherwise, the rest would be lost.
+If the replay fails, the database (and its closed years) are put back the way they were.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import Dict
+from typing import Generator
+from typing import Optional
+from typing import Set
+
+from .. import cold_storage
+from .. import database
+from ..archive import Archive
+from ..archive import get_archive
+from ..client import use_client
+from ..models.option import OptionExpirationEvent
+from ..models.option import OptionStrategy
+from ..models.option import OptionStrategyLegs
+from ..models.option import OptionTrade
+from ..models.rollup import PnlRollup
+from ..models.rollup import RealizedSale
+from ..models.rollup import RollupState
+from ..models.stock import StockTrade
+from .trades import sync_all
+
+
+# These are derived entirely from the archived orders. Instruments are left alone, since
+# they're a cache of API lookups (which are archived too, if we need them again), and stock
+# splits are curated by hand. The rollup is derived from trades, so it's rebuilt too.
+REPLAYED_MODELS = (
+    PnlRollup,
+    RealizedSale,
+    RollupState,
+    OptionExpirationEvent,
+    OptionStrategyLegs,
+    OptionStrategy,
+    OptionTrade,
+    StockTrade,
+)
+
+# Each of these rows is made from an archived item, with the same ID.
+ARCHIVED_MODELS = (
+    OptionExpirationEvent,
+    OptionStrategy,
+    StockTrade,
+)
+
+
+def rebuild_database(archive: Optional[Archive] = None, force: bool = False) -> None:
+    """
+    :param force: rebuild even if the archive doesn't have everything that's in the database.
+        Whatever it's missing is lost.
+    :raises: ValueError if archiving is disabled (and no archive was provided), or if the
+        archive is missing rows from the database.
+    :raises: BlockingIOError if another process is syncing.
+    """
+    if not archive:
+        archive = get_archive()
+        if not archive:
+            raise ValueError('Archiving is disabled, so there is nothing to replay from.')
+
+    database.session.setup()
+    with database.lock('sync', blocking=False):
+        if not force:
+            missing = get_missing(archive)
+            if missing:
+                raise ValueError(
+                    'The archive is missing {} rows that are in the database ({}).'.format(
+                        sum(len(uuids) for uuids in missing.values()),
+                        ', '.join(
+                            f'{len(uuids)} from {table}'
+                            for table, uuids in sorted(missing.items())
+                        ),
+                    ),
+                )
+
+        # Otherwise, trades from closed years would be synced (and kept) twice.
+        with _restore_on_failure(), cold_storage.set_aside():
+            with database.session.connect(readonly=False) as session:
+                for model in REPLAYED_MODELS:
+                    session.query(model).delete()
+
+            with use_client(archive.get_client()):
+                sync_all()
+
+
+def get_missing(archive: Archive) -> Dict[str, Set[str]]:
+    """
+    :returns: table => UUIDs of rows in the database (including closed years) that aren't
+        in the archive. Only tables with missing rows are included.
+    """
+    archived = _get_archived_ids(archive)
+
+    output = {}
+    for model in ARCHIVED_MODELS:
+        missing = {uuid for uuid, in database.session.query(model.uuid)} - archived
+        if missing:
+            output[model.__tablename__] = missing
+
+    return output
+
+
+@contextmanager
+def _restore_on_failure() -> Generator[None, None, None]:
+    """
+    Keeps a copy of the working database, to put back if the replay fails part of the way.
+    """
+    path = f'{database.ENGINE_URI}.replay'
+    source = sqlite3.connect(database.ENGINE_URI)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+    try:
+        yield
+    except BaseException:
+        database.session.remove()
+        database.session.get_bind().dispose()
+        os.replace(path, database.ENGINE_URI)
+        raise
+
+    os.remove(path)
+
+
+def _get_archived_ids(archive: Archive) -> Set[str]:
+    output = set()
+    for record in archive.iter_records():
+        for item in record['payload'].get('results', []):
+            output.add(item['id'])
+
+            # Stock received through options events is a trade of its own.
+            output.update(
+                component['id']
+                for component in item.get('equity_components') or []
+            )
+
+    return output
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--archive',
+        help='Path to the archive directory. Defaults to the configured archive.',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rebuild even if the archive is missing trades, which are then lost.',
+    )
+    args = parser.parse_args()
+
+    try:
+        rebuild_database(Archive(args.archive) if args.archive else None, force=args.force)
+    except BlockingIOError:
+        print('ERROR: Stop `robinhood sync --watch` first.', file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
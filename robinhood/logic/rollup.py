@@ -0,0 +1,315 @@
+"""
+Keeps realized sales (and a pre-aggregated rollup of them) in the database, so that P&L
+dashboards don't need to replay (and re-group) the entire trade history.
+
+Since FIFO matching is independent for each instrument, only instruments that have changed
+since the last update (new trades, splits or expirations) need to be replayed. These are read
+from the change log (see `robinhood.logic.change_log`), so backdated changes are picked up
+too. Their old sales are subtracted from the rollup, and their new sales added.
+"""
+import datetime
+import heapq
+from collections import defaultdict
+from typing import DefaultDict
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from . import change_log
+from .. import database
+from .. import metrics
+from ..models.instrument import Instrument
+from ..models.option import Option
+from ..models.option import OptionTrade
+from ..models.rollup import PnlRollup
+from ..models.rollup import RealizedSale
+from ..models.rollup import RollupState
+from ..models.stock import StockSplit
+from ..models.stock import StockTrade
+from .database.common import MAX_VARIABLES
+from .database.option_trade import OptionTradeDBLogic
+from .database.stock_split import StockSplitDBLogic
+from .dataframe.trades import _apply_event
+from .dataframe.trades import _get_event_date
+from .dataframe.trades import Portfolio
+from .dataframe.trades import Sale
+from .trades import get_options_expirations
+from .trades import OptionExpiration
+
+
+# Changes to these tables affect realized sales.
+CHANGE_LOG_TABLES = (
+    'option',
+    'option_expiration_event',
+    'option_trade',
+    'stock_split',
+    'stock_trade',
+)
+
+# (month, is_option, is_long_term, underlying)
+RollupKey = Tuple[datetime.date, bool, bool, str]
+
+
+class RollupDelta:
+    def __init__(self) -> None:
+        self.earnings = 0.0
+        self.count = 0
+        self.volume = 0.0
+
+    def add(self, earnings: float, volume: float, sign: int = 1) -> None:
+        self.earnings += sign * earnings
+        self.count += sign
+        self.volume += sign * volume
+
+
+def update() -> int:
+    """
+    Recomputes realized sales for instruments that have changed since the last update, and
+    applies the difference to the rollup.
+
+    :returns: number of instruments recomputed.
+    """
+    state = database.session.query(RollupState).one_or_none()
+    sequence = change_log.get_sequence()
+    now = datetime.datetime.now()
+
+    if not state:
+        instrument_ids = None
+        state = RollupState(change_log_seq=sequence, updated_at=now)
+        database.session.add(state)
+    else:
+        instrument_ids = _get_dirty_instruments(state, sequence)
+
+    count = recompute(instrument_ids)
+    state.change_log_seq = sequence
+    state.updated_at = now
+
+    database.session.commit()
+    metrics.increment('rollup_instruments_recomputed_total', count)
+    return count
+
+
+def is_long_term(
+    date_bought: Union[datetime.date, datetime.datetime],
+    date_sold: Union[datetime.date, datetime.datetime],
+) -> bool:
+    """
+    For taxes, positions are long-term if they're held for more than a year, i.e. sold after
+    the anniversary of the day they were bought.
+    """
+    return _get_date(date_bought) < get_long_term_cutoff(date_sold)
+
+
+def get_long_term_cutoff(date_sold: Union[datetime.date, datetime.datetime]) -> datetime.date:
+    """
+    :returns: the day that positions sold on `date_sold` need to have been bought before, to
+        be long-term (see `is_long_term`).
+    """
+    date = _get_date(date_sold)
+    try:
+        return date.replace(year=date.year - 1)
+    except ValueError:
+        # Sold on Feb 29th: positions bought on Feb 28th (or before) a year ago have had their
+        # anniversary, while those bought on Mar 1st haven't.
+        return datetime.date(date.year - 1, 3, 1)
+
+
+def _get_date(value: Union[datetime.date, datetime.datetime]) -> datetime.date:
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def rebuild() -> int:
+    """
+    Recomputes everything from scratch.
+
+    :returns: number of instruments recomputed.
+    """
+    database.session.query(RollupState).delete()
+    database.session.query(RealizedSale).delete()
+    database.session.query(PnlRollup).delete()
+
+    return update()
+
+
+def recompute(instrument_ids: Optional[Set[int]] = None) -> int:
+    """
+    :param instrument_ids: if not provided, all instruments are recomputed.
+    :returns: number of instruments recomputed.
+    """
+    if instrument_ids is not None and not instrument_ids:
+        return 0
+
+    deltas: DefaultDict[RollupKey, RollupDelta] = defaultdict(RollupDelta)
+    instruments = _get_instruments(instrument_ids)
+
+    # First, take out the old sales.
+    for chunk in _get_chunks(instrument_ids):
+        query = database.session.query(RealizedSale)
+        if chunk is not None:
+            query = query.filter(RealizedSale.instrument_id.in_(chunk))
+
+        for sale in query:
+            instrument = instruments[sale.instrument_id]
+            deltas[_get_key(sale.date_bought, sale.date_sold, instrument)].add(
+                sale.earnings,
+                sale.quantity,
+                sign=-1,
+            )
+
+        query.delete(synchronize_session=False)
+
+    # Then, replay these instruments from the start.
+    sales = []
+    for sale in _replay(instrument_ids, instruments):
+        instrument = instruments[sale.instrument_id]
+        deltas[_get_key(sale.bought.date, sale.sold.date, instrument)].add(
+            sale.earnings,
+            sale.quantity,
+        )
+        sales.append({
+            'instrument_id': sale.instrument_id,
+            'date_bought': sale.bought.date,
+            'price_bought': sale.bought.price,
+            'date_sold': sale.sold.date,
+            'price_sold': sale.sold.price,
+            'quantity': sale.quantity,
+            'earnings': sale.earnings,
+        })
+
+    database.session.bulk_insert_mappings(RealizedSale, sales)
+    _apply_deltas(deltas)
+
+    return len(instruments)
+
+
+def _get_dirty_instruments(state: RollupState, sequence: int) -> Set[int]:
+    return change_log.get_changed_instruments(
+        state.change_log_seq,
+        sequence,
+        tables=CHANGE_LOG_TABLES,
+    )
+
+
+def _replay(
+    instrument_ids: Optional[Set[int]],
+    instruments: Dict[int, Instrument],
+) -> Iterator[Sale]:
+    """
+    :returns: realized sales for these instruments (or all, if not provided).
+    """
+    stocks = {
+        instrument.name
+        for instrument in instruments.values()
+        if not instrument.is_option
+    }
+
+    stock_trades: List[StockTrade] = []
+    option_trades: List[OptionTrade] = []
+    expirations: List[OptionExpiration] = []
+    for chunk in _get_chunks(instrument_ids):
+        query = database.session.query(StockTrade)
+        if chunk is not None:
+            query = query.filter(StockTrade.instrument_id.in_(chunk))
+        stock_trades.extend(query)
+
+        query = (
+            database.session.query(OptionTrade)
+            .join(Option, OptionTrade.option_id == Option.id)
+        )
+        if chunk is not None:
+            query = query.filter(Option.instrument_id.in_(chunk))
+        option_trades.extend(OptionTradeDBLogic().hydrate(*query))
+        expirations.extend(get_options_expirations(instrument_ids=chunk))
+
+    splits = [item for item in StockSplitDBLogic().get() if item.name in stocks]
+
+    # NOTE: When events happen at the same time, they're ordered by their position here
+    # (the same as `dataframe.trades._get_events`).
+    events: Iterable[Union[OptionExpiration, OptionTrade, StockSplit, StockTrade]] = (
+        heapq.merge(
+            sorted(expirations, key=_get_event_date),
+            sorted(option_trades, key=lambda x: (x.date, x.id)),
+            splits,
+            sorted(stock_trades, key=lambda x: x.date),
+            key=_get_event_date,
+        )
+    )
+
+    portfolio = Portfolio()
+    for event in events:
+        yield from _apply_event(portfolio, event)
+
+
+def _apply_deltas(deltas: Dict[RollupKey, RollupDelta]) -> None:
+    if not deltas:
+        return
+
+    # The rollup is small (a few rows per month), so it's simpler to load it all.
+    rows = {
+        (row.month, row.is_option, row.is_long_term, row.underlying): row
+        for row in database.session.query(PnlRollup)
+    }
+    for key, delta in deltas.items():
+        row = rows.get(key)
+        if not row:
+            row = PnlRollup(
+                month=key[0],
+                is_option=key[1],
+                is_long_term=key[2],
+                underlying=key[3],
+                earnings=0,
+                count=0,
+                volume=0,
+            )
+            database.session.add(row)
+
+        row.earnings += delta.earnings
+        row.count += delta.count
+        row.volume += delta.volume
+
+        if not row.count:
+            database.session.delete(row)
+
+
+def _get_key(
+    date_bought: datetime.date,
+    date_sold: datetime.date,
+    instrument: Instrument,
+) -> RollupKey:
+    return (
+        date_sold.replace(day=1),
+        instrument.is_option,
+        is_long_term(date_bought, date_sold),
+        instrument.underlying,
+    )
+
+
+def _get_instruments(instrument_ids: Optional[Set[int]]) -> Dict[int, Instrument]:
+    output = {}
+    for chunk in _get_chunks(instrument_ids):
+        query = database.session.query(Instrument)
+        if chunk is not None:
+            query = query.filter(Instrument.id.in_(chunk))
+
+        output.update({item.id: item for item in query})
+
+    return output
+
+
+def _get_chunks(instrument_ids: Optional[Set[int]]) -> Iterator[Optional[List[int]]]:
+    """
+    :returns: batches of IDs, for `IN` clauses. If no IDs are provided, this returns a
+        single `None` (meaning everything).
+    """
+    if instrument_ids is None:
+        yield None
+        return
+
+    ids = sorted(instrument_ids)
+    for index in range(0, len(ids), MAX_VARIABLES):
+        yield ids[index:index + MAX_VARIABLES]
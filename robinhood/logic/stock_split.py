@@ -1,8 +1,23 @@
+import argparse
+import csv
+import datetime
+import json
 from collections import namedtuple
+from typing import Any
+from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert
 
 from .. import database
+from ..models import Side
+from ..models.stock import StockSplit
+from ..models.stock import StockTrade
+from .database.common import MAX_VARIABLES
 from .database.stock_split import StockSplitDBLogic
+from .trades import iter_stock_orders
 
 
 Split = namedtuple(
@@ -16,29 +31,185 @@ Split = namedtuple(
 )
 
 
-def process_splits(splits: List[Split]) -> None:
-    logic = StockSplitDBLogic()
+def process_splits(splits: Iterable[Split]) -> int:
+    """
+    Splits that we already know about (by name and date) are ignored.
+
+    :returns: number of splits added.
+    """
+    values = [
+        {
+            **split._asdict(),
+            'date': _to_datetime(split.date),
+        }
+        for split in splits
+    ]
+
+    count = 0
+    batch_size = MAX_VARIABLES // len(Split._fields)
+    for index in range(0, len(values), batch_size):
+        result = database.session.execute(
+            insert(StockSplit)
+            .values(values[index:index + batch_size])
+            .on_conflict_do_nothing(index_elements=['name', 'date']),
+        )
+        count += result.rowcount
+
+    database.session.commit()
+    return count
+
+
+def import_splits(path: str) -> int:
+    """
+    Bulk imports corporate actions from a local feed.
+
+    :param path: either a CSV file (with a header of `name,from_amount,to_amount,date`), or a
+        JSON file with a list of objects with those keys. Dates are in YYYY-MM-DD format.
+    :returns: number of splits added.
+    """
+    return process_splits(load_splits(path))
+
+
+def load_splits(path: str) -> List[Split]:
+    with open(path) as f:
+        if path.endswith('.json'):
+            rows: Iterable[Dict[str, Any]] = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    return [
+        Split(
+            name=row['name'],
+            from_amount=int(row['from_amount']),
+            to_amount=int(row['to_amount']),
+            date=datetime.datetime.strptime(str(row['date'])[:10], '%Y-%m-%d').date(),
+        )
+        for row in rows
+    ]
+
+
+def detect_splits(
+    trades: Optional[Iterable[StockTrade]] = None,
+    tolerance: float = 0.1,
+) -> List[Split]:
+    """
+    Proposes stock splits that are missing from the database, by looking for consecutive
+    trades of the same stock where the price drops by (almost exactly) an integer multiple.
+    These usually show up as "selling more than you own" when replaying the portfolio.
+
+    NOTE: These are only suggestions, since a stock can legitimately lose half its value.
+    Those that coincide with selling more than we'd otherwise hold are far more likely to be
+    genuine, so they're listed first.
+
+    :param trades: in chronological order. Defaults to the entire trade history.
+    :param tolerance: how far off (as a ratio) from an integer the price change can be.
+    """
+    if trades is None:
+        trades = iter_stock_orders(most_recent_first=False)
+
+    known: Dict[str, List[StockSplit]] = {}
+    for item in StockSplitDBLogic().get():
+        known.setdefault(item.name, []).append(item)
+
+    # ticker => previous trade, and quantity held (as per the trades, and known splits)
+    previous: Dict[str, StockTrade] = {}
+    quantities: Dict[str, float] = {}
 
-    # Perform DB query everytime for now, because we don't expect to get much.
+    # (is confirmed by quantity, split)
+    candidates: List[Any] = []
+    for trade in trades:
+        last = previous.get(trade.name)
+        previous[trade.name] = trade
+
+        quantity = quantities.get(trade.name, 0)
+        if last:
+            factor = _get_split_factor(known.get(trade.name, []), last.date, trade.date)
+            quantity *= factor
+
+            ratio = last.price / factor / trade.price
+            multiple = round(ratio)
+            if (
+                multiple >= 2
+                and abs(ratio - multiple) / multiple <= tolerance
+                and last.date.date() != trade.date.date()
+            ):
+                split = Split(
+                    name=trade.name,
+                    from_amount=1,
+                    to_amount=multiple,
+                    date=trade.date.date(),
+                )
+
+                oversold = trade.side == Side.SELL and trade.quantity > quantity
+                candidates.append((oversold, split))
+                quantity *= multiple
+
+        quantities[trade.name] = quantity + (
+            trade.quantity if trade.side == Side.BUY else -trade.quantity
+        )
+
+    return [split for _, split in sorted(candidates, key=lambda x: not x[0])]
+
+
+def _get_split_factor(
+    splits: List[StockSplit],
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> float:
+    """
+    :returns: how much known splits between these times multiply the number of shares by.
+    """
+    factor = 1.0
     for split in splits:
-        should_process = True
-        items = logic.get(name=split.name)
-        if items:
-            for item in items:
-                # We make the (safe) assumption that (name, date) uniquely identifies
-                # a stock split.
-                if item.date == split.date:
-                    should_process = False
-                    break
+        if start < split.date <= end:
+            factor *= split.to_amount / split.from_amount
 
-        if not should_process:
-            continue
+    return factor
 
-        logic.create(**split._asdict())
 
-    database.session.commit()
+def _to_datetime(value: datetime.date) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Manages known stock splits.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_import = subparsers.add_parser(
+        'import',
+        help='Imports splits from a CSV or JSON file.',
+    )
+    parser_import.add_argument('path')
+
+    parser_detect = subparsers.add_parser(
+        'detect',
+        help='Proposes splits missing from the database, based on trade history.',
+    )
+    parser_detect.add_argument(
+        '--save',
+        action='store_true',
+        help='Add the proposed splits to the database.',
+    )
+    args = parser.parse_args()
+
+    database.session.setup()
+    if args.command == 'import':
+        print(f'Added {import_splits(args.path)} split(s).')
+        return
+
+    splits = detect_splits()
+    for split in splits:
+        print(
+            f'{split.date.isoformat()}  {split.name:<6} '
+            f'{split.from_amount}:{split.to_amount}',
+        )
+
+    if args.save:
+        print(f'Added {process_splits(splits)} split(s).')
 
 
 if __name__ == '__main__':
-    # TODO: make interactive
-    pass
+    main()
@@ -1,22 +1,42 @@
 import datetime
 from typing import Any
-from typing import Dict
 from typing import Iterator
 from typing import List
 from typing import NamedTuple
 from typing import Optional
 
+from sqlalchemy.orm import Query
+
 from .. import database
 from ..client import get_client
 from ..models.option import Option
+from ..models.option import OptionExpirationEvent
 from ..models.option import OptionStrategy
 from ..models.stock import StockTrade
+from ..payloads import OptionEvent
+from ..payloads import OptionOrder
+from ..payloads import StockOrder
 from ..util import get_paginated_results
-from .database.option import OptionDBLogic
+from .database.common import MAX_VARIABLES
+from .database.option_expiration import OptionExpirationDBLogic
 from .database.option_trade import OptionStrategyDBLogic
 from .database.stock_trade import StockTradeDBLogic
-from pyrh.urls import OPTIONS_BASE
-from pyrh.urls import ORDERS_BASE
+
+
+def sync_all(to_date: Optional[datetime.date] = None) -> None:
+    """
+    Brings everything that reports depend on up-to-date with the API. This holds the
+    database's sync lock, so it waits for any other process that is syncing (e.g.
+    `robinhood sync --watch`) to finish first.
+
+    :param to_date: if our latest trades are on or after this date, skip syncing them.
+    """
+    with database.lock():
+        sync_stock_orders(to_date)
+        sync_options_orders(to_date)
+        sync_options_expirations()
+
+        database.session.commit()
 
 
 def get_stock_orders(
@@ -33,9 +53,61 @@ def get_stock_orders(
     if not to_date:
         to_date = datetime.date.today()
 
+    # First, make sure your data is up-to-date.
+    sync_stock_orders(to_date)
+
+    # Then, get results.
+    return _get_stock_orders_query(ticker, from_date, to_date, most_recent_first).all()
+
+
+def iter_stock_orders(
+    ticker: Optional[str] = None,
+    from_date: Optional[datetime.date] = None,
+    to_date: Optional[datetime.date] = None,
+    most_recent_first: bool = True,
+    chunksize: int = 1000,
+) -> Iterator[StockTrade]:
+    """
+    Like `get_stock_orders`, but streams results from the database (in batches of
+    `chunksize`), rather than loading them all into memory. This does not sync.
+    """
+    if not to_date:
+        to_date = datetime.date.today()
+
+    return iter(
+        _get_stock_orders_query(ticker, from_date, to_date, most_recent_first)
+        .yield_per(chunksize),
+    )
+
+
+def _get_stock_orders_query(
+    ticker: Optional[str],
+    from_date: Optional[datetime.date],
+    to_date: Optional[datetime.date],
+    most_recent_first: bool,
+) -> Query:
     logic = StockTradeDBLogic()
+    query = (
+        logic.filter_between_dates(from_date, to_date)
+        .order_by(logic.MODEL.date.desc() if most_recent_first else logic.MODEL.date.asc())
+    )
+    if ticker:
+        query = query.filter(StockTrade.name == ticker)
 
-    # First, make sure your data is up-to-date.
+    return query
+
+
+def sync_stock_orders(to_date: Optional[datetime.date] = None) -> None:
+    """
+    Fetches stock orders (and stock received through options events) that are newer than
+    what we already know about.
+
+    :param to_date: if our latest trade is on or after this date, skip syncing.
+    """
+    if not to_date:
+        to_date = datetime.date.today()
+
+    logic = StockTradeDBLogic()
     last_known_trade_date = logic.get_latest_date()
     if not last_known_trade_date or last_known_trade_date.date() < to_date:
         parameters = {}
@@ -43,55 +115,31 @@ def get_stock_orders(
             # Smaller pages, since we only need to get the diff.
             parameters['page_size'] = 10
 
-        for order in _get_raw_stock_orders(params=parameters):
-            state = order['state']
-            if state != 'filled':
+        for order in _fetch_stock_orders(params=parameters):
+            if order.state != 'filled':
                 # Ignore cancelled orders
                 continue
 
-            item = logic.create_from_raw_payload(order)
+            item = logic.create_from_order(order)
             if last_known_trade_date and item.date < last_known_trade_date:
                 break
 
         for event in filter(
-            lambda x: x['type'] != 'expiration',
-            _get_options_events(params=parameters),
+            lambda x: x.type != 'expiration',
+            _fetch_options_events(params=parameters),
         ):
-            date_string = event['updated_at']
-            for trade in event['equity_components']:
-                trade.update({
-                    'last_transaction_at': date_string,
-                    'average_price': trade['price'],
-                    'cumulative_quantity': trade['quantity'],
-                })
-
-                logic.create_from_raw_payload(trade)
-
-            if (
-                last_known_trade_date
-                and datetime.datetime.strptime(
-                    date_string.rstrip('Z').split('.')[0],
-                    '%Y-%m-%dT%H:%M:%S',
-                ) < last_known_trade_date
-            ):
+            for trade in event.equity_components:
+                logic.create_from_order(trade)
+
+            if last_known_trade_date and event.updated_at < last_known_trade_date:
                 break
 
     database.session.commit()
 
-    # Then, get results.
-    query = (
-        logic.filter_between_dates(from_date, to_date)
-        .order_by(logic.MODEL.date.desc() if most_recent_first else logic.MODEL.date.asc())
-    )
-    if ticker:
-        query = query.filter(StockTrade.name == ticker)
-
-    return query.all()
-
 
-def _get_raw_stock_orders(**kwargs: Any) -> Iterator[Dict[str, Any]]:
+def _fetch_stock_orders(**kwargs: Any) -> Iterator[StockOrder]:
     """
-    :returns: a list of trades in the following format
+    :returns: trades, decoded from pages in the following format
     {
         "id": "<UUID4>",
         "ref_id": "<UUID4>",
@@ -147,7 +195,14 @@ def _get_raw_stock_orders(**kwargs: Any) -> Iterator[Dict[str, Any]]:
 
     We assume that it comes ordered by time (since that's how the web does it).
     """
-    yield from get_paginated_results(get_client(), ORDERS_BASE, **kwargs)
+    from pyrh.urls import ORDERS_BASE
+
+    yield from get_paginated_results(
+        get_client(),
+        ORDERS_BASE,
+        decoder=StockOrder.decode,
+        **kwargs
+    )
 
 
 def get_options_orders(
@@ -158,9 +213,56 @@ def get_options_orders(
     if not to_date:
         to_date = datetime.date.today()
 
+    # First, make sure your data is up-to-date.
+    sync_options_orders(to_date)
+
+    # Then, get results.
     logic = OptionStrategyDBLogic()
+    query = logic.filter_between_dates(from_date, to_date)
+    if ticker:
+        query = query.filter(OptionStrategy.name == ticker)
 
-    # First, make sure your data is up-to-date.
+    return logic.hydrate(*query.all())
+
+
+def iter_options_orders(
+    ticker: Optional[str] = None,
+    from_date: Optional[datetime.date] = None,
+    to_date: Optional[datetime.date] = None,
+    chunksize: int = MAX_VARIABLES,
+) -> Iterator[OptionStrategy]:
+    """
+    Like `get_options_orders`, but streams (hydrated) results from the database in
+    chronological order, in batches of `chunksize`. This does not sync.
+    """
+    if not to_date:
+        to_date = datetime.date.today()
+
+    logic = OptionStrategyDBLogic()
+    query = logic.filter_between_dates(from_date, to_date).order_by(logic.MODEL.date.asc())
+    if ticker:
+        query = query.filter(OptionStrategy.name == ticker)
+
+    batch: List[OptionStrategy] = []
+    for item in query.yield_per(chunksize):
+        batch.append(item)
+        if len(batch) == chunksize:
+            yield from logic.hydrate(*batch)
+            batch = []
+
+    yield from logic.hydrate(*batch)
+
+
+def sync_options_orders(to_date: Optional[datetime.date] = None) -> None:
+    """
+    Fetches options orders that are newer than what we already know about.
+
+    :param to_date: if our latest trade is on or after this date, skip syncing.
+    """
+    if not to_date:
+        to_date = datetime.date.today()
+
+    logic = OptionStrategyDBLogic()
     last_known_trade_date = logic.get_latest_date()
     if not last_known_trade_date or last_known_trade_date.date() < to_date:
         parameters = {}
@@ -168,26 +270,18 @@ def get_options_orders(
             # Smaller pages, since we only need to get the diff.
             parameters['page_size'] = 10
 
-        for order in _get_raw_options_orders():
-            state = order['state']
-            if state != 'filled':
+        for order in _fetch_options_orders():
+            if order.state != 'filled':
                 continue
 
-            item = logic.create_from_raw_payload(order)
+            item = logic.create_from_order(order)
             if last_known_trade_date and item.date < last_known_trade_date:
                 break
 
-    # Then, get results.
-    query = logic.filter_between_dates(from_date, to_date)
-    if ticker:
-        query = query.filter(OptionStrategy.name == ticker)
-
-    return logic.hydrate(*query.all())
-
 
-def _get_raw_options_orders(**kwargs: Any) -> Iterator[Dict[str, Any]]:
+def _fetch_options_orders(**kwargs: Any) -> Iterator[OptionOrder]:
     """
-    :returns: a list of trades in the following format
+    :returns: trades, decoded from pages in the following format
     {
         "cancel_url": null,
         "canceled_quantity": "0.00000",
@@ -232,9 +326,16 @@ def _get_raw_options_orders(**kwargs: Any) -> Iterator[Dict[str, Any]]:
         "stop_price": null
     }
     """
+    from pyrh.urls import OPTIONS_BASE
+
     # NOTE: This is BIZARRE. The trailing slash is necessary, otherwise it won't be able to find
     # the URL.
-    return get_paginated_results(get_client(), OPTIONS_BASE / 'orders/', **kwargs)
+    return get_paginated_results(
+        get_client(),
+        OPTIONS_BASE / 'orders/',
+        decoder=OptionOrder.decode,
+        **kwargs
+    )
 
 
 class OptionExpiration(NamedTuple):
@@ -244,28 +345,50 @@ class OptionExpiration(NamedTuple):
 
 def get_options_expirations(
     to_date: Optional[datetime.date] = None,
+    instrument_ids: Optional[List[int]] = None,
 ) -> Iterator[OptionExpiration]:
     """
-    :returns: (option, quantity)
+    :param instrument_ids: if provided, only includes options on these instruments (at most
+        MAX_VARIABLES of them).
+    :returns: (option, quantity), ordered by expiration date. This does not sync.
     """
+    query = (
+        database.session.query(OptionExpirationEvent, Option)
+        .join(Option, OptionExpirationEvent.option_id == Option.id)
+        .order_by(Option.expiration_date.asc(), OptionExpirationEvent.id.asc())
+    )
     if to_date:
-        to_date = to_date.strftime('%Y-%m-%d')
+        query = query.filter(OptionExpirationEvent.date <= to_date)
+    if instrument_ids is not None:
+        query = query.filter(Option.instrument_id.in_(instrument_ids))
+
+    for event, option in query:
+        yield OptionExpiration(option=option, quantity=event.quantity)
 
-    logic = OptionDBLogic()
-    for event in filter(
-        lambda x: x['type'] == 'expiration',
-        _get_options_events(),
-    ):
-        if to_date and to_date < event['event_date']:
-            continue
 
-        yield OptionExpiration(
-            option=logic.get_from_instrument_url(event['option']),
-            quantity=float(event['quantity']),
-        )
+def sync_options_expirations() -> None:
+    """
+    Fetches options expirations that are newer than what we already know about.
+    """
+    logic = OptionExpirationDBLogic()
+    last_update = logic.get_latest_update()
+
+    parameters = {}
+    if last_update:
+        # Smaller pages, since we only need to get the diff.
+        parameters['page_size'] = 10
 
+    for event in _fetch_options_events(params=parameters):
+        if last_update and event.updated_at < last_update:
+            break
 
-def _get_options_events(**kwargs) -> Iterator[Dict[str, Any]]:
+        if event.type == 'expiration':
+            logic.create_from_event(event)
+
+    database.session.commit()
+
+
+def _fetch_options_events(**kwargs: Any) -> Iterator[OptionEvent]:
     """
     :returns: events when an option has expired.
         when an option has expired in the money, it must be converted into stock inventory.
@@ -299,4 +422,11 @@ def _get_options_events(**kwargs) -> Iterator[Dict[str, Any]]:
         "updated_at": "2018-09-10T08:10:05.478568Z"
     }
     """
-    yield from get_paginated_results(get_client(), OPTIONS_BASE / 'events/', **kwargs)
+    from pyrh.urls import OPTIONS_BASE
+
+    yield from get_paginated_results(
+        get_client(),
+        OPTIONS_BASE / 'events/',
+        decoder=OptionEvent.decode,
+        **kwargs
+    )
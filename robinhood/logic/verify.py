@@ -0,0 +1,375 @@
+"""
+Checks that the database matches the API, one month at a time, and repairs only the months
+that don't.
+
+The incremental sync stops paging as soon as it sees something older than what we already
+have, so orders that are updated late (e.g. filled days after they were placed) can be
+missed. Rather than re-downloading everything, we compare a digest of each month (the number
+of rows, and a hash of their UUIDs and update times) with one computed from the API's
+listing of everything updated since, in large pages. Only the months that differ are then
+downloaded again, and repaired.
+"""
+import datetime
+import hashlib
+from collections import defaultdict
+from typing import Any
+from typing import DefaultDict
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from sqlalchemy.sql.expression import func
+
+from . import rollup
+from .. import cold_storage
+from .. import database
+from .. import metrics
+from ..models.option import Option
+from ..models.option import OptionExpirationEvent
+from ..models.option import OptionStrategy
+from ..models.option import OptionStrategyLegs
+from ..models.option import OptionTrade
+from ..models.rollup import RollupState
+from ..models.stock import StockTrade
+from ..payloads import OptionEvent
+from ..payloads import OptionOrder
+from ..payloads import StockOrder
+from .database.common import MAX_VARIABLES
+from .database.option_expiration import OptionExpirationDBLogic
+from .database.option_trade import OptionStrategyDBLogic
+from .database.stock_trade import StockTradeDBLogic
+from .trades import _fetch_options_events
+from .trades import _fetch_options_orders
+from .trades import _fetch_stock_orders
+
+
+# Listings are fetched in far larger pages than the default of 100, so that verification only
+# takes a handful of requests.
+LISTING_PAGE_SIZE = 1000
+
+# table => when each row was last updated (as per the API).
+TIMESTAMPS = {
+    'stock_trade': StockTrade.updated_at,
+
+    # Strategies are dated by when they were last updated.
+    'option_strategy': OptionStrategy.date,
+
+    'option_expiration_event': OptionExpirationEvent.updated_at,
+}
+
+# table => how to re-create a row from what the API returns.
+CREATORS = {
+    'stock_trade': lambda item: StockTradeDBLogic().create_from_order(item),
+    'option_strategy': lambda item: OptionStrategyDBLogic().create_from_order(item),
+    'option_expiration_event': lambda item: OptionExpirationDBLogic().create_from_event(item),
+}
+
+Item = Union[StockOrder, OptionOrder, OptionEvent]
+
+
+class Digest(NamedTuple):
+    count: int
+    hash: str
+
+
+class Mismatch(NamedTuple):
+    table: str
+    month: datetime.date
+    local: Digest
+    remote: Digest
+
+
+def verify(
+    from_date: Optional[datetime.date] = None,
+    repair: bool = True,
+) -> List[Mismatch]:
+    """
+    :param from_date: defaults to the start of our trade history (in the working database).
+        Verification always runs up to the current month, since updated orders move to later
+        months.
+    :param repair: whether to fix the months that don't match, using the API's listing.
+    :returns: months (per table) that didn't match.
+    """
+    if not from_date:
+        from_date = _get_earliest_date()
+        if not from_date:
+            # There's nothing to verify: this is a job for a regular sync.
+            return []
+
+    # Closed years can't be changed (see `robinhood.cold_storage`), so they're left alone.
+    hot_start = cold_storage.get_hot_start()
+    if hot_start and from_date < hot_start:
+        from_date = hot_start
+
+    from_date = from_date.replace(day=1)
+    with database.lock():
+        local = _group_by_month(_get_local_rows(from_date))
+        remote = _group_by_month(
+            {
+                table: {uuid: item.updated_at for uuid, item in rows.items()}
+                for table, rows in _get_remote_rows(from_date).items()
+            },
+        )
+
+        output: List[Mismatch] = []
+        for month in _get_months(from_date):
+            for table in TIMESTAMPS:
+                local_digest = get_digest(local[table][month].items())
+                remote_digest = get_digest(remote[table][month].items())
+                if local_digest != remote_digest:
+                    output.append(
+                        Mismatch(
+                            table=table,
+                            month=month,
+                            local=local_digest,
+                            remote=remote_digest,
+                        ),
+                    )
+                    metrics.increment('verify_mismatches_total', table=table)
+
+        instrument_ids: Set[int] = set()
+        if repair:
+            for month in sorted({item.month for item in output}):
+                items = _get_remote_rows(month, _get_next_month(month))
+                for item in output:
+                    if item.month == month:
+                        instrument_ids |= _repair(
+                            item.table,
+                            local[item.table][month],
+                            items[item.table],
+                        )
+
+        # Realized sales for the instruments we've touched are out of date now (unless the
+        # rollup hasn't been built yet).
+        if instrument_ids and database.session.query(RollupState).count():
+            rollup.recompute(instrument_ids)
+
+        database.session.commit()
+
+    return output
+
+
+def get_digest(rows: Iterable[Tuple[str, datetime.datetime]]) -> Digest:
+    """
+    :param rows: (uuid, updated_at), in any order.
+    """
+    count = 0
+    sha = hashlib.sha256()
+    for uuid, updated_at in sorted(rows, key=lambda row: (row[1], row[0])):
+        count += 1
+        sha.update(f'{uuid}|{_truncate(updated_at).isoformat()}\n'.encode())
+
+    return Digest(count=count, hash=sha.hexdigest())
+
+
+def _get_local_rows(from_date: datetime.date) -> Dict[str, Dict[str, datetime.datetime]]:
+    """
+    :returns: table => uuid => updated_at
+    """
+    return {
+        table: dict(
+            database.session.query(column.class_.uuid, column)
+            .filter(column >= from_date),
+        )
+        for table, column in TIMESTAMPS.items()
+    }
+
+
+def _get_remote_rows(
+    from_date: datetime.date,
+    to_date: Optional[datetime.date] = None,
+) -> Dict[str, Dict[str, Item]]:
+    """
+    :param to_date: exclusive. If not provided, this includes everything up to now.
+    :returns: table => uuid => decoded payload, for everything updated in this range.
+    """
+    params: Dict[str, Any] = {
+        'updated_at[gte]': f'{from_date.isoformat()}T00:00:00Z',
+        'page_size': LISTING_PAGE_SIZE,
+    }
+    if to_date:
+        params['updated_at[lt]'] = f'{to_date.isoformat()}T00:00:00Z'
+
+    output: Dict[str, Dict[str, Item]] = {table: {} for table in TIMESTAMPS}
+    for order in _fetch_stock_orders(params=params):
+        if order.state == 'filled':
+            output['stock_trade'][order.id] = order
+
+    for option_order in _fetch_options_orders(params=params):
+        if option_order.state == 'filled':
+            output['option_strategy'][option_order.id] = option_order
+
+    for event in _fetch_options_events(params=params):
+        if event.type == 'expiration':
+            output['option_expiration_event'][event.id] = event
+            continue
+
+        for order in event.equity_components:
+            output['stock_trade'][order.id] = order
+
+    return output
+
+
+def _repair(
+    table: str,
+    local: Dict[str, datetime.datetime],
+    remote: Dict[str, Item],
+) -> Set[int]:
+    """
+    Rows that have changed are deleted, and re-created from the API's payload.
+
+    :param local: uuid => updated_at, for what we have in this month.
+    :param remote: uuid => decoded payload, for what the API has in this month.
+    :returns: instrument IDs affected.
+    """
+    model = TIMESTAMPS[table].class_
+
+    # Rows can move between months, as they get updated. Those that moved here are
+    # replaced, and those that moved away will be re-created when we get to their month.
+    existing = _get_ids(model, remote)
+    stale = {
+        uuid
+        for uuid, item in remote.items()
+        if uuid not in local or _truncate(local[uuid]) != _truncate(item.updated_at)
+    }
+    stale.update(uuid for uuid in local if uuid not in remote)
+
+    ids = [existing[uuid] for uuid in stale if uuid in existing]
+    ids.extend(_get_ids(model, [uuid for uuid in stale if uuid not in existing]).values())
+
+    instrument_ids = _get_instrument_ids(table, ids)
+    _delete(table, ids)
+
+    create = CREATORS[table]
+    created = [create(item) for uuid, item in remote.items() if uuid in stale]
+
+    # New rows only get their IDs once they're flushed.
+    database.session.flush()
+    instrument_ids |= _get_instrument_ids(table, [item.id for item in created])
+
+    metrics.increment('verify_rows_repaired_total', len(stale), table=table)
+    return instrument_ids
+
+
+def _get_ids(model: database.Base, uuids: Iterable[str]) -> Dict[str, int]:
+    """
+    :returns: uuid => id, for those that exist.
+    """
+    uuids = list(uuids)
+    output = {}
+    for index in range(0, len(uuids), MAX_VARIABLES):
+        output.update({
+            row.uuid: row.id
+            for row in (
+                database.session.query(model.uuid, model.id)
+                .filter(model.uuid.in_(uuids[index:index + MAX_VARIABLES]))
+            )
+        })
+
+    return output
+
+
+def _get_instrument_ids(table: str, ids: List[int]) -> Set[int]:
+    output = set()
+    for chunk in _get_chunks(ids):
+        if table == 'stock_trade':
+            query = (
+                database.session.query(StockTrade.instrument_id)
+                .filter(StockTrade.id.in_(chunk))
+            )
+        elif table == 'option_strategy':
+            query = (
+                database.session.query(Option.instrument_id)
+                .join(OptionTrade, OptionTrade.option_id == Option.id)
+                .join(OptionStrategyLegs, OptionStrategyLegs.trade_id == OptionTrade.id)
+                .filter(OptionStrategyLegs.strategy_id.in_(chunk))
+            )
+        else:
+            query = (
+                database.session.query(Option.instrument_id)
+                .join(OptionExpirationEvent, OptionExpirationEvent.option_id == Option.id)
+                .filter(OptionExpirationEvent.id.in_(chunk))
+            )
+
+        output.update(row.instrument_id for row in query)
+
+    return output
+
+
+def _delete(table: str, ids: List[int]) -> None:
+    model = TIMESTAMPS[table].class_
+    for chunk in _get_chunks(ids):
+        if table == 'option_strategy':
+            legs = database.session.query(OptionStrategyLegs).filter(
+                OptionStrategyLegs.strategy_id.in_(chunk),
+            )
+            trade_ids = [leg.trade_id for leg in legs]
+            legs.delete(synchronize_session=False)
+            database.session.query(OptionTrade).filter(
+                OptionTrade.id.in_(trade_ids),
+            ).delete(synchronize_session=False)
+
+        database.session.query(model).filter(
+            model.id.in_(chunk),
+        ).delete(synchronize_session=False)
+
+    # Otherwise, the session would hand us the deleted rows when we re-create them.
+    database.session.expire_all()
+
+
+def _get_chunks(ids: List[int]) -> Iterator[List[int]]:
+    for index in range(0, len(ids), MAX_VARIABLES):
+        yield ids[index:index + MAX_VARIABLES]
+
+
+def _get_earliest_date() -> Optional[datetime.date]:
+    dates = [
+        database.session.query(func.min(column)).scalar()
+        for column in (StockTrade.date, *TIMESTAMPS.values())
+    ]
+    dates = [date for date in dates if date]
+    if not dates:
+        return None
+
+    return min(dates).date()
+
+
+def _group_by_month(
+    rows: Dict[str, Dict[str, datetime.datetime]],
+) -> Dict[str, DefaultDict[datetime.date, Dict[str, datetime.datetime]]]:
+    """
+    :param rows: table => uuid => updated_at
+    :returns: table => month => uuid => updated_at
+    """
+    output = {}
+    for table, items in rows.items():
+        months: DefaultDict[datetime.date, Dict[str, datetime.datetime]] = defaultdict(dict)
+        for uuid, updated_at in items.items():
+            months[updated_at.date().replace(day=1)][uuid] = updated_at
+
+        output[table] = months
+
+    return output
+
+
+def _get_months(from_date: datetime.date) -> Iterator[datetime.date]:
+    month = from_date.replace(day=1)
+    today = datetime.date.today()
+    while month <= today:
+        yield month
+        month = _get_next_month(month)
+
+
+def _get_next_month(month: datetime.date) -> datetime.date:
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _truncate(value: datetime.datetime) -> datetime.datetime:
+    # Rows synced before we kept microseconds would otherwise never match.
+    return value.replace(microsecond=0)
@@ -0,0 +1,209 @@
+"""
+Lightweight instrumentation, to figure out which stage of a sync (or report) is slow.
+
+This is disabled by default, in which case every call returns immediately. To turn it on:
+
+    from robinhood import metrics
+    metrics.enable()
+
+    ...     # sync, build reports, etc.
+
+    print(metrics.to_prometheus())
+
+Alternatively, set the `ROBINHOOD_METRICS` environment variable to a non-empty value.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextlib import nullcontext
+from typing import Any
+from typing import ContextManager
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Tuple
+
+
+# Upper bounds (in seconds), in the style of Prometheus' default buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_enabled = bool(os.environ.get('ROBINHOOD_METRICS'))
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Labels], float] = {}
+_gauges: Dict[Tuple[str, Labels], float] = {}
+_histograms: Dict[Tuple[str, Labels], 'Histogram'] = {}
+
+# Shared, so that disabled timers don't allocate anything.
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def increment(name: str, value: float = 1, **labels: Any) -> None:
+    if not _enabled:
+        return
+
+    key = (name, _get_labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_max(name: str, value: float, **labels: Any) -> None:
+    """Records the highest value seen, e.g. for peak memory usage."""
+    if not _enabled:
+        return
+
+    key = (name, _get_labels(labels))
+    with _lock:
+        _gauges[key] = max(_gauges.get(key, value), value)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    if not _enabled:
+        return
+
+    key = (name, _get_labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if not histogram:
+            histogram = _histograms[key] = Histogram()
+
+        histogram.observe(value)
+
+
+def timer(name: str, **labels: Any) -> ContextManager[None]:
+    """Records how long the block takes (in seconds), in a histogram."""
+    if not _enabled:
+        return _NULL_CONTEXT
+
+    return _timer(name, **labels)
+
+
+@contextmanager
+def _timer(name: str, **labels: Any) -> Generator[None, None, None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def to_dict() -> Dict[str, List[Dict[str, Any]]]:
+    with _lock:
+        return {
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_gauges.items())
+            ],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'buckets': dict(zip(map(str, BUCKETS), histogram.counts)),
+                    'sum': histogram.sum,
+                    'count': histogram.count,
+                }
+                for (name, labels), histogram in sorted(
+                    _histograms.items(),
+                    key=lambda x: x[0],
+                )
+            ],
+        }
+
+
+def to_json() -> str:
+    return json.dumps(to_dict(), indent=2)
+
+
+def to_prometheus() -> str:
+    """
+    :returns: metrics in Prometheus' text exposition format.
+    """
+    lines = []
+    data = to_dict()
+    for kind, entries in (('counter', data['counters']), ('gauge', data['gauges'])):
+        for name in sorted({entry['name'] for entry in entries}):
+            lines.append(f'# TYPE robinhood_{name} {kind}')
+            for entry in entries:
+                if entry['name'] == name:
+                    lines.append(
+                        f'robinhood_{name}{_format_labels(entry["labels"])} {entry["value"]}',
+                    )
+
+    for name in sorted({entry['name'] for entry in data['histograms']}):
+        lines.append(f'# TYPE robinhood_{name} histogram')
+        for entry in data['histograms']:
+            if entry['name'] != name:
+                continue
+
+            cumulative = 0
+            for bound, count in entry['buckets'].items():
+                cumulative += count
+                labels = {**entry['labels'], 'le': '+Inf' if bound == 'inf' else bound}
+                lines.append(f'robinhood_{name}_bucket{_format_labels(labels)} {cumulative}')
+
+            labels = _format_labels(entry['labels'])
+            lines.append(f'robinhood_{name}_sum{labels} {entry["sum"]}')
+            lines.append(f'robinhood_{name}_count{labels} {entry["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path: str) -> None:
+    """Writes metrics to `path`, in Prometheus' format if it ends with `.prom`, else JSON."""
+    with open(path, 'w') as f:
+        f.write(to_prometheus() if path.endswith('.prom') else to_json())
+
+
+def _get_labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+    ) + '}'
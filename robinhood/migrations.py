@@ -0,0 +1,125 @@
+"""
+Data migrations, for when the models change in ways that existing rows need to be updated.
+These are run by `database.session.setup()` when the schema version changes, after new
+tables, columns and indexes have been created. Rows that would keep new (unique) indexes from
+being created are dealt with beforehand, by `prepare`.
+"""
+from typing import Optional
+
+from . import database
+
+
+def prepare(from_version: Optional[int]) -> None:
+    """
+    :param from_version: None, if the database predates versioning (or is brand new).
+    """
+    if from_version is None or from_version < 2:
+        _remove_duplicate_splits()
+
+
+def migrate(from_version: Optional[int]) -> None:
+    """
+    :param from_version: None, if the database predates versioning (or is brand new).
+    """
+    if from_version is None or from_version < 3:
+        _intern_instruments()
+
+    if from_version is None or from_version < 7:
+        _create_change_log_triggers()
+        _reset_rollup_state()
+
+    if from_version is None or from_version < 8:
+        _clear_rollup()
+
+
+def _remove_duplicate_splits() -> None:
+    """
+    Splits used to be saved again whenever they were processed (since dates were compared
+    with datetimes), so they need to be unique before they can be indexed as such.
+    """
+    from sqlalchemy import text
+
+    with database.session.get_bind().begin() as connection:
+        connection.execute(
+            text(
+                'DELETE FROM stock_split WHERE id NOT IN '
+                '(SELECT min(id) FROM stock_split GROUP BY name, date)',
+            ),
+        )
+
+
+def _intern_instruments() -> None:
+    """Fills in OCC symbols and instrument IDs, for rows saved before they existed."""
+    from .logic.database.instrument import InstrumentDBLogic
+    from .models.option import get_occ_symbol
+    from .models.option import Option
+    from .models.stock import StockTrade
+
+    logic = InstrumentDBLogic()
+    for option in database.session.query(Option).filter(Option.instrument_id.is_(None)):
+        option.symbol = get_occ_symbol(
+            option.name,
+            option.type,
+            option.expiration_date,
+            option.strike_price,
+        )
+        option.instrument_id = logic.get_id(option.symbol, option.name, is_option=True)
+
+    names = [
+        row.name
+        for row in (
+            database.session.query(StockTrade.name)
+            .filter(StockTrade.instrument_id.is_(None))
+            .distinct()
+        )
+    ]
+    for name in names:
+        (
+            database.session.query(StockTrade)
+            .filter(StockTrade.name == name, StockTrade.instrument_id.is_(None))
+            .update(
+                {StockTrade.instrument_id: logic.get_id(name, name, is_option=False)},
+                synchronize_session=False,
+            )
+        )
+
+    database.session.commit()
+
+
+def _create_change_log_triggers() -> None:
+    from sqlalchemy import text
+
+    from .models.change_log import TRIGGERS
+
+    with database.session.get_bind().begin() as connection:
+        for trigger in TRIGGERS.values():
+            connection.execute(text(trigger))
+
+
+def _reset_rollup_state() -> None:
+    """
+    The rollup used to keep track of the highest IDs it had applied (in columns that can't be
+    dropped in place). Since there's no change log from before now, it's rebuilt on its next
+    update.
+    """
+    from .models.rollup import RollupState
+
+    table = RollupState.__table__
+    table.drop(bind=database.session.get_bind(), checkfirst=True)
+    table.create(bind=database.session.get_bind())
+
+
+def _clear_rollup() -> None:
+    """
+    Sales used to be long-term in the rollup once they'd been held for 365 days, rather than
+    past the anniversary of their purchase. Since the rollup can't tell which of its sales
+    that changes, it's rebuilt on its next update.
+    """
+    from .models.rollup import PnlRollup
+    from .models.rollup import RealizedSale
+    from .models.rollup import RollupState
+
+    for model in (PnlRollup, RealizedSale, RollupState):
+        database.session.query(model).delete()
+
+    database.session.commit()
@@ -0,0 +1,89 @@
+from typing import Dict
+
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from ..database import Base
+
+
+class ChangeLog(Base):
+    """
+    Every insert, update and delete on the tables that reports are derived from, as written by
+    SQLite triggers (see `TRIGGERS`). Derived data (e.g. the rollup) keeps track of the last
+    `id` it has applied, and only needs to look at what came after it.
+    """
+    # AUTOINCREMENT, so that IDs are never reused (even if the latest rows are deleted).
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+
+    # The instrument that the row affects, if any (e.g. strategies span several).
+    instrument_id = Column(Integer)
+    date = Column(DateTime)
+
+    # insert, update or delete
+    op = Column(String, nullable=False)
+
+
+# table => (instrument ID, date) expressions, in terms of `{row}` (NEW or OLD).
+TRACKED_TABLES = {
+    'option': ('{row}.instrument_id', '{row}.expiration_date'),
+    'option_expiration_event': (
+        '(SELECT instrument_id FROM option WHERE id = {row}.option_id)',
+        '{row}.date',
+    ),
+    'option_strategy': ('NULL', '{row}.date'),
+    'option_trade': (
+        '(SELECT instrument_id FROM option WHERE id = {row}.option_id)',
+        '{row}.date',
+    ),
+    'stock_split': (
+        '(SELECT id FROM instrument WHERE name = {row}.name AND NOT is_option)',
+        '{row}.date',
+    ),
+    'stock_trade': ('{row}.instrument_id', '{row}.date'),
+}
+
+
+def _get_triggers() -> Dict[str, str]:
+    output = {}
+    for table, (instrument_id, date) in TRACKED_TABLES.items():
+        for op, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            statements = [
+                _get_insert(table, op, row, instrument_id, date),
+            ]
+            if op == 'update':
+                # If a row moves to another instrument, the old one has changed too.
+                statements.append(
+                    _get_insert(table, op, 'OLD', instrument_id, date) + (
+                        f' WHERE {instrument_id.format(row="OLD")} '
+                        f'IS NOT {instrument_id.format(row="NEW")}'
+                    ),
+                )
+
+            # NOTE: Triggers are named with their schema, since the tables they're on may be
+            # shadowed by temporary views (see `robinhood.cold_storage`).
+            name = f'change_log_{table}_{op}'
+            body = ''.join(f'    {statement};\n' for statement in statements)
+            output[name] = (
+                f'CREATE TRIGGER IF NOT EXISTS main.{name} '
+                f'AFTER {op.upper()} ON {table}\n'
+                f'BEGIN\n{body}END'
+            )
+
+    return output
+
+
+def _get_insert(table: str, op: str, row: str, instrument_id: str, date: str) -> str:
+    return (
+        'INSERT INTO change_log (table_name, row_id, instrument_id, date, op) '
+        f"SELECT '{table}', {row}.id, {instrument_id.format(row=row)}, "
+        f"{date.format(row=row)}, '{op}'"
+    )
+
+
+# name => statement
+TRIGGERS = _get_triggers()
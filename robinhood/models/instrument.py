@@ -0,0 +1,15 @@
+from sqlalchemy import Boolean
+from sqlalchemy import Column
+from sqlalchemy import String
+
+from ..database import Base
+
+
+class Instrument(Base):
+    """
+    Interns every instrument we've traded (stocks by ticker, and options by OCC symbol) as a
+    small integer, so that replaying trades doesn't need to build (and hash) strings.
+    """
+    name = Column(String, nullable=False, unique=True)
+    underlying = Column(String, nullable=False)
+    is_option = Column(Boolean, nullable=False)
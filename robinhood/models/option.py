@@ -1,3 +1,4 @@
+import datetime
 from enum import Enum
 
 from sqlalchemy import Column
@@ -33,17 +34,35 @@ class Option(Base):
     expiration_date = Column(DateTime, nullable=False)
     strike_price = Column(Float, nullable=False)
 
+    # These are derived from the above, and filled in when the option is first saved.
+    symbol = Column(String, index=True)
+    instrument_id = Column(Integer, ForeignKey('instrument.id'))
+
     @property
-    def serialized_name(self):
-        # https://en.wikipedia.org/wiki/Option_naming_convention
-        return '{ticker}{expiration_date}{type}{price}'.format(
-            ticker=self.name,
-            expiration_date=self.expiration_date.strftime('%y%m%d'),
-            type='C' if self.type == OptionType.CALL else 'P',
-            price='{:09.3f}'.format(self.strike_price).replace('.', ''),
+    def serialized_name(self) -> str:
+        return self.symbol or get_occ_symbol(
+            self.name,
+            self.type,
+            self.expiration_date,
+            self.strike_price,
         )
 
 
+def get_occ_symbol(
+    ticker: str,
+    type: OptionType,
+    expiration_date: datetime.date,
+    strike_price: float,
+) -> str:
+    # https://en.wikipedia.org/wiki/Option_naming_convention
+    return '{ticker}{expiration_date}{type}{price}'.format(
+        ticker=ticker,
+        expiration_date=expiration_date.strftime('%y%m%d'),
+        type='C' if type == OptionType.CALL else 'P',
+        price='{:09.3f}'.format(strike_price).replace('.', ''),
+    )
+
+
 class OptionTrade(Base):
     """Represents one leg in an Options trade."""
     uuid = Column(String, nullable=False, unique=True)
@@ -81,3 +100,18 @@ class OptionStrategyLegs(Base):
         ), nullable=False,
     )
     trade_id = Column(Integer, ForeignKey('option_trade.id'), nullable=False)
+
+
+class OptionExpirationEvent(Base):
+    """
+    Options that expired (rather than being sold, or exercised). These come from the options
+    events feed, and are kept so that reports don't need to fetch it every time.
+    """
+    uuid = Column(String, nullable=False, unique=True)
+
+    option_id = Column(Integer, ForeignKey('option.id'), nullable=False)
+    date = Column(DateTime, nullable=False)
+    quantity = Column(Float, nullable=False)
+
+    # When the event was last updated, which is how the feed is ordered.
+    updated_at = Column(DateTime, nullable=False)
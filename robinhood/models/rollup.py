@@ -0,0 +1,59 @@
+from sqlalchemy import Boolean
+from sqlalchemy import Column
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from ..database import Base
+
+
+class RealizedSale(Base):
+    """
+    The output of replaying the portfolio: one row per lot (or part of a lot) sold. These are
+    derived from trades, and recomputed (per instrument) when they change.
+    """
+    instrument_id = Column(Integer, ForeignKey('instrument.id'), nullable=False, index=True)
+    date_bought = Column(Date, nullable=False)
+    price_bought = Column(Float, nullable=False)
+    date_sold = Column(Date, nullable=False)
+    price_sold = Column(Float, nullable=False)
+    quantity = Column(Float, nullable=False)
+    earnings = Column(Float, nullable=False)
+
+
+class PnlRollup(Base):
+    """
+    Realized sales, pre-aggregated for the P&L dashboards. There's one row for every
+    combination of the following, for which there are sales.
+    """
+    month = Column(Date, nullable=False, doc='The first day of the month the sales were in.')
+    is_option = Column(Boolean, nullable=False)
+    is_long_term = Column(Boolean, nullable=False)
+    underlying = Column(String, nullable=False)
+
+    earnings = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    volume = Column(Float, nullable=False, doc='Number of shares (or contracts) sold.')
+
+    __table_args__ = (
+        Index(
+            'ix_pnl_rollup_key',
+            'month', 'is_option', 'is_long_term', 'underlying',
+            unique=True,
+        ),
+    )
+
+
+class RollupState(Base):
+    """
+    How far the rollup has gotten. Changes after this point in the change log haven't been
+    applied yet. There's (at most) one row in this table.
+    """
+    # NOTE: This is nullable so that it can be added to existing tables, before they're
+    # rebuilt (see `migrations._reset_rollup_state`).
+    change_log_seq = Column(Integer)
+    updated_at = Column(DateTime, nullable=False)
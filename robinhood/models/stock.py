@@ -1,6 +1,8 @@
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import Float
+from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 
@@ -35,12 +37,26 @@ class StockTrade(Base):
     price = Column(Float, nullable=False)
     quantity = Column(Float, nullable=False)
 
+    # Filled in when the trade is first saved.
+    instrument_id = Column(Integer, ForeignKey('instrument.id'))
+
+    # When the order was last updated (which isn't necessarily when it was filled). Trades
+    # saved before this existed don't have it, until `robinhood verify` repairs them.
+    updated_at = Column(DateTime, index=True)
+
 
 class StockSplit(Base):
     """
     This is updated manually, since at the time, I can't find an easy source for such data
     (also, it's like super rare for my use cases).
     """
+    # We make the (safe) assumption that (name, date) uniquely identifies a stock split.
+    # NOTE: This is a unique index (rather than a constraint), so that it can be added to
+    # existing databases.
+    __table_args__ = (
+        Index('ix_stock_split_name_date', 'name', 'date', unique=True),
+    )
+
     name = Column(String, nullable=False)
     date = Column(DateTime, nullable=False)
     from_amount = Column(Integer, nullable=False)
@@ -0,0 +1,168 @@
+import operator
+import re
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+from .util import split_api_url
+
+
+API_BASE = 'https://api.robinhood.com'
+
+# e.g. `updated_at[gte]`
+FILTER_REGEX = re.compile(r'^(\w+)\[(gt|gte|lt|lte)\]$')
+OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+# How the API sorts each paginated feed (most recent first).
+FEED_SORT_KEYS = {
+    'orders': 'created_at',
+    'options/orders': 'created_at',
+    'options/events': 'updated_at',
+}
+
+
+class OfflineClient:
+    """
+    Serves API responses from memory, with the same pagination semantics as the real API.
+    This has just enough of the `pyrh.Robinhood` interface for our ETL logic to work, so it
+    can stand in for it when replaying archived payloads (or generated ones).
+    """
+    # Responses served from here are already archived (or synthetic), so they shouldn't be
+    # recorded again.
+    offline = True
+
+    def __init__(
+        self,
+        feeds: Optional[Dict[str, Iterable[Dict[str, Any]]]] = None,
+        instruments: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None,
+        page_size: int = 100,
+        base_url: str = API_BASE,
+        historicals: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        :param feeds: maps feed name (e.g. `options/orders`) to its results.
+        :param instruments: maps instrument feed (e.g. `instruments`) to their payloads,
+            keyed by UUID.
+        :param historicals: maps ticker to its daily prices (in chronological order), in the
+            same format as `quotes/historicals`. The latest one also serves as its quote.
+        """
+        self.feeds: Dict[str, List[Dict[str, Any]]] = {}
+        for name, results in (feeds or {}).items():
+            self.set_feed(name, results)
+
+        self.instruments = instruments or {}
+        self.historicals = historicals or {}
+        self.page_size = page_size
+        self.base_url = base_url.rstrip('/')
+
+    def set_feed(self, name: str, results: Iterable[Dict[str, Any]]) -> None:
+        key = FEED_SORT_KEYS.get(name)
+        results = list(results)
+        if key:
+            results.sort(key=lambda x: x.get(key) or '', reverse=True)
+
+        self.feeds[name] = results
+
+    def get(self, url: Any, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        feed, uuid = split_api_url(url)
+        if uuid:
+            try:
+                return self.instruments[feed][uuid]
+            except KeyError:
+                raise LookupError(f'No offline data for {url}.')
+
+        if feed == 'user':
+            return {}
+
+        query = dict(parse_qsl(urlparse(str(url)).query))
+        query.update(params or {})
+
+        if feed in ('quotes', 'quotes/historicals'):
+            return self.get_quotes(feed, query)
+
+        if feed not in self.feeds:
+            raise LookupError(f'No offline data for {url}.')
+
+        return self.get_page(feed, query)
+
+    def get_page(self, feed: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        results = _filter_results(self.feeds[feed], query)
+        offset = int(query.get('cursor', 0))
+        page_size = int(query.get('page_size', self.page_size))
+
+        next_url = None
+        if offset + page_size < len(results):
+            next_url = '{}/{}/?{}'.format(
+                self.base_url,
+                feed,
+                urlencode({**query, 'cursor': offset + page_size}),
+            )
+
+        return {
+            'previous': None,
+            'next': next_url,
+            'results': results[offset:offset + page_size],
+        }
+
+    def get_quotes(self, feed: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        results: List[Optional[Dict[str, Any]]] = []
+        for symbol in query.get('symbols', '').split(','):
+            historicals = self.historicals.get(symbol)
+            if not historicals:
+                # This is what the API does for unknown symbols.
+                results.append(None)
+            elif feed == 'quotes':
+                results.append({
+                    'symbol': symbol,
+                    'last_trade_price': historicals[-1]['close_price'],
+                    'previous_close': historicals[-1]['open_price'],
+                    'updated_at': historicals[-1]['begins_at'],
+                })
+            else:
+                results.append({
+                    'symbol': symbol,
+                    'interval': query.get('interval', 'day'),
+                    'span': query.get('span', 'year'),
+                    'bounds': query.get('bounds', 'regular'),
+                    'historicals': historicals,
+                })
+
+        return {'results': results}
+
+
+def _filter_results(
+    results: List[Dict[str, Any]],
+    query: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Supports the API's range filters on timestamps, e.g. `updated_at[gte]=2020-01-01T00:00:00Z`
+    (as well as `[gt]`, `[lt]` and `[lte]`).
+    """
+    filters = []
+    for key, value in query.items():
+        match = FILTER_REGEX.match(key)
+        if match:
+            # Timestamps are compared to the second, since their precision varies.
+            filters.append((match.group(1), OPERATORS[match.group(2)], str(value)[:19]))
+
+    if not filters:
+        return results
+
+    return [
+        item
+        for item in results
+        if all(
+            item.get(field) and compare(item[field][:19], value)
+            for field, compare, value in filters
+        )
+    ]
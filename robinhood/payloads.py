@@ -0,0 +1,154 @@
+"""
+Typed versions of the API payloads we consume, which only declare the fields we use.
+
+API pages are decoded into these as they're fetched (see `util.get_paginated_results`), so
+that numbers and timestamps are only parsed once, and the rest of the payload (there's a
+lot of it) is dropped early. The raw payloads are still what's archived.
+"""
+import datetime
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from .timestamps import parse_timestamp
+
+
+class StockOrder(NamedTuple):
+    id: str
+    state: str
+    side: str
+    instrument: str
+
+    # These are only set once the order has (at least partially) been filled.
+    price: Optional[float]
+    quantity: Optional[float]
+    date: Optional[datetime.datetime]
+
+    updated_at: datetime.datetime
+
+    @classmethod
+    def decode(cls, payload: Dict[str, Any]) -> 'StockOrder':
+        return cls(
+            id=payload['id'],
+            state=payload['state'],
+            side=payload['side'],
+            instrument=payload['instrument'],
+            price=_to_float(payload['average_price']),
+            quantity=_to_float(payload['cumulative_quantity']),
+            date=_to_timestamp(payload['last_transaction_at']),
+            updated_at=parse_timestamp(payload['updated_at']),
+        )
+
+
+class OptionLeg(NamedTuple):
+    id: str
+    option: str
+    side: str
+
+    # Summarized from its executions, with `price` being the average price.
+    #
+    # NOTE: It looks like Robinhood supports "Good till Cancelled" options orders, so
+    # technically, you could have a leg that executes over multiple days. This would result in
+    # multiple `OptionTrade` items created, which I'm not sure what to do with currently.
+    #
+    # Therefore, I'm just going to assume this feature is disabled (I don't currently use it
+    # anyway), to simplify our data model. As such, we'll just take the first date of
+    # execution.
+    date: Optional[datetime.datetime]
+    price: float
+    quantity: float
+
+    @classmethod
+    def decode(cls, payload: Dict[str, Any]) -> 'OptionLeg':
+        executions = payload['executions']
+        return cls(
+            id=payload['id'],
+            option=payload['option'],
+            side=payload['side'],
+            date=parse_timestamp(executions[0]['timestamp']) if executions else None,
+            price=(
+                sum(float(item['price']) for item in executions) / len(executions)
+                if executions
+                else 0.0
+            ),
+            quantity=sum(float(item['quantity']) for item in executions),
+        )
+
+
+class OptionOrder(NamedTuple):
+    id: str
+    state: str
+    chain_symbol: str
+    opening_strategy: Optional[str]
+    closing_strategy: Optional[str]
+    legs: List[OptionLeg]
+    updated_at: datetime.datetime
+
+    @classmethod
+    def decode(cls, payload: Dict[str, Any]) -> 'OptionOrder':
+        return cls(
+            id=payload['id'],
+            state=payload['state'],
+            chain_symbol=payload['chain_symbol'],
+            opening_strategy=payload['opening_strategy'],
+            closing_strategy=payload['closing_strategy'],
+            legs=[OptionLeg.decode(leg) for leg in payload['legs']],
+            updated_at=parse_timestamp(payload['updated_at']),
+        )
+
+
+class OptionEvent(NamedTuple):
+    id: str
+
+    # e.g. `expiration`, `exercise` or `assignment`
+    type: str
+    option: str
+    quantity: float
+    event_date: datetime.date
+
+    # Stock received (or delivered) through exercising options. These are dated by when the
+    # event was last updated.
+    equity_components: List[StockOrder]
+
+    updated_at: datetime.datetime
+
+    @classmethod
+    def decode(cls, payload: Dict[str, Any]) -> 'OptionEvent':
+        updated_at = parse_timestamp(payload['updated_at'])
+        return cls(
+            id=payload['id'],
+            type=payload['type'],
+            option=payload['option'],
+            quantity=float(payload['quantity']),
+            event_date=datetime.date.fromisoformat(payload['event_date']),
+            equity_components=[
+                StockOrder(
+                    id=item['id'],
+                    state='filled',
+                    side=item['side'],
+                    instrument=item['instrument'],
+                    price=float(item['price']),
+                    quantity=float(item['quantity']),
+                    date=updated_at,
+                    updated_at=updated_at,
+                )
+                for item in payload['equity_components']
+            ],
+            updated_at=updated_at,
+        )
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+
+    return float(value)
+
+
+def _to_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+
+    return parse_timestamp(value)
@@ -0,0 +1,246 @@
+"""
+Records every SQL statement executed against an engine, to find slow queries and N+1
+patterns (e.g. the same lookup being run once per row).
+
+Usage:
+
+    from robinhood import database
+
+    with database.profile_queries() as profiler:
+        with profiler.operation('sync'):
+            sync_stock_orders()
+
+    print(profiler.report())
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any
+from typing import DefaultDict
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# The same statement executed more than this many times within an operation is suspicious.
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+# Outside of any named operation.
+NO_OPERATION = '<none>'
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class StatementStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class NPlusOne(NamedTuple):
+    operation: str
+    statement: str
+
+    # The most times this statement ran within a single invocation of the operation.
+    count: int
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        n_plus_one_threshold: int = DEFAULT_N_PLUS_ONE_THRESHOLD,
+        slow_query_seconds: float = 0.1,
+    ) -> None:
+        """
+        :param slow_query_seconds: statements slower than this are kept in `slow_queries`.
+        """
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_query_seconds = slow_query_seconds
+
+        # normalized statement => stats
+        self.statements: DefaultDict[str, StatementStats] = defaultdict(StatementStats)
+
+        # operation => normalized statement => count
+        self.operations: DefaultDict[str, DefaultDict[str, int]] = defaultdict(
+            lambda: defaultdict(int),
+        )
+
+        # operation => normalized statement => max count within a single invocation
+        self.peak_counts: DefaultDict[str, DefaultDict[str, int]] = defaultdict(
+            lambda: defaultdict(int),
+        )
+
+        self.slow_queries: List[Dict[str, Any]] = []
+
+        self._engine: Optional[Engine] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engine = engine
+
+    def detach(self) -> None:
+        if not self._engine:
+            return
+
+        event.remove(self._engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self._engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engine = None
+
+    @contextmanager
+    def operation(self, name: str) -> Generator[None, None, None]:
+        """Groups statements into a logical operation, for N+1 detection and budgets."""
+        stack = self._get_stack()
+        stack.append((name, defaultdict(int)))
+        try:
+            yield
+        finally:
+            _, counts = stack.pop()
+            with self._lock:
+                peaks = self.peak_counts[name]
+                for statement, count in counts.items():
+                    peaks[statement] = max(peaks[statement], count)
+
+    def query_count(self, operation: Optional[str] = None) -> int:
+        if operation:
+            return sum(self.operations[operation].values())
+
+        return sum(stats.count for stats in self.statements.values())
+
+    def assert_max_queries(self, operation: str, budget: int) -> None:
+        """
+        :raises: QueryBudgetExceeded
+        """
+        count = self.query_count(operation)
+        if count > budget:
+            raise QueryBudgetExceeded(
+                f'{operation} ran {count} queries (budget: {budget}).',
+            )
+
+    def find_n_plus_one(self) -> List[NPlusOne]:
+        return sorted(
+            (
+                NPlusOne(operation=operation, statement=statement, count=count)
+                for operation, counts in self.peak_counts.items()
+                for statement, count in counts.items()
+                if count > self.n_plus_one_threshold
+            ),
+            key=lambda x: x.count,
+            reverse=True,
+        )
+
+    def report(self, limit: int = 20) -> str:
+        lines = [
+            f'{self.query_count()} queries, '
+            f'{sum(stats.total_seconds for stats in self.statements.values()):.3f}s total',
+            '',
+            f'{"count":>8} {"total (ms)":>12} {"mean (ms)":>10} {"max (ms)":>10}  statement',
+        ]
+        ranked = sorted(
+            self.statements.items(),
+            key=lambda x: x[1].total_seconds,
+            reverse=True,
+        )
+        for statement, stats in ranked[:limit]:
+            lines.append(
+                f'{stats.count:>8} {stats.total_seconds * 1000:>12.2f} '
+                f'{stats.total_seconds / stats.count * 1000:>10.3f} '
+                f'{stats.max_seconds * 1000:>10.3f}  {_truncate(statement)}',
+            )
+
+        suspects = self.find_n_plus_one()
+        if suspects:
+            lines.extend(['', 'Possible N+1 queries:'])
+            for suspect in suspects:
+                lines.append(
+                    f'{suspect.count:>8}x in {suspect.operation}: {_truncate(suspect.statement)}',
+                )
+
+        if self.slow_queries:
+            lines.extend(['', f'Slow queries (> {self.slow_query_seconds * 1000:.0f} ms):'])
+            for query in sorted(self.slow_queries, key=lambda x: -x['seconds'])[:limit]:
+                lines.append(f'{query["seconds"] * 1000:>12.2f}  {_truncate(query["statement"])}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path: str, limit: int = 20) -> None:
+        with open(path, 'w') as f:
+            f.write(self.report(limit=limit))
+
+    def _get_stack(self) -> List[Any]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+
+        return self._local.stack
+
+    def _before_cursor_execute(
+        self,
+        connection: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        connection.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self,
+        connection: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        seconds = time.perf_counter() - connection.info['query_start_time'].pop()
+        normalized = normalize(statement)
+
+        stack = self._get_stack()
+        operation = stack[-1][0] if stack else NO_OPERATION
+        if stack:
+            stack[-1][1][normalized] += 1
+
+        with self._lock:
+            self.statements[normalized].add(seconds)
+            self.operations[operation][normalized] += 1
+            if seconds > self.slow_query_seconds:
+                self.slow_queries.append({
+                    'statement': statement,
+                    'parameters': parameters,
+                    'seconds': seconds,
+                })
+
+
+def normalize(statement: str) -> str:
+    """Collapses statements that only differ in their literals, or length of IN clauses."""
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?...)', statement)
+    statement = re.sub(r'IN \(\[POSTCOMPILE_\w+\]\)', 'IN (?...)', statement)
+
+    return ' '.join(statement.split())
+
+
+def _truncate(statement: str, length: int = 120) -> str:
+    if len(statement) <= length:
+        return statement
+
+    return statement[:length - 3] + '...'
@@ -0,0 +1,464 @@
+"""
+A read-only HTTP API, so that dashboards can be fed from the same reports as the notebooks:
+
+    $ robinhood report-server [--host 127.0.0.1] [--port 8080]
+
+    GET /trades?from_date=2020-01-01&to_date=2020-12-31&ticker=AAPL
+    GET /rollup?by=Month,Type&from_date=2020-01-01&ticker=AAPL
+    GET /positions?date=2020-12-31&ticker=AAPL
+
+Responses are JSON (a list of rows) by default, or an Arrow IPC stream with `?format=arrow`
+(or `Accept: application/vnd.apache.arrow.stream`), if pyarrow is installed.
+
+Reports only read what's already in the database (as if called with `sync=False`), so this
+is meant to run alongside `robinhood sync --watch`. Every response carries an ETag derived
+from the data version: the latest row in each table, and when the rollup and prices were last
+updated. Until that changes, clients sending `If-None-Match` get `304 Not Modified`, and
+everyone else gets the response we computed last time.
+
+Connections are handled on an asyncio loop, while reports are computed on a pool of threads.
+Each thread has its own database session (and connection), so slow reports don't hold up
+the rest.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from . import metrics
+from . import service
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# How long (in seconds) a data version is trusted for, before we check the database again.
+# This bounds how many queries a burst of dashboard refreshes causes.
+VERSION_TTL = 1.0
+
+# Number of responses to keep, for clients that don't send `If-None-Match`.
+CACHE_SIZE = 64
+
+MAX_WORKERS = 4
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+# When prices were last saved, as of the last time we checked.
+_prices_updated_at: Optional[float] = None
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Response(NamedTuple):
+    status: HTTPStatus
+    headers: Dict[str, str]
+    body: bytes = b''
+
+
+def get_trades(
+    from_date: Optional[datetime.date] = None,
+    to_date: Optional[datetime.date] = None,
+    ticker: Optional[str] = None,
+) -> 'pd.DataFrame':
+    from .logic.dataframe import trades
+
+    df = trades.get(from_date=from_date, to_date=to_date, sync=False)
+    if ticker:
+        df = df[df['Underlying'] == ticker].reset_index(drop=True)
+
+    return df
+
+
+def get_rollup(
+    from_date: Optional[datetime.date] = None,
+    to_date: Optional[datetime.date] = None,
+    ticker: Optional[str] = None,
+    by: Tuple[str, ...] = ('Month', 'Type', 'Term', 'Underlying'),
+) -> 'pd.DataFrame':
+    from .logic.dataframe import rollup
+
+    # NOTE: The sync daemon keeps the rollup up-to-date, and we don't want to write to the
+    # database from here.
+    df = rollup.get(
+        from_date=from_date,
+        to_date=to_date,
+        by=by,
+        underlying=ticker,
+        sync=False,
+        refresh=False,
+    )
+    return df.reset_index() if by else df
+
+
+def get_positions(
+    date: Optional[datetime.date] = None,
+    ticker: Optional[str] = None,
+) -> 'pd.DataFrame':
+    from .logic.dataframe import positions
+
+    df = positions.get(date, sync=False)
+    if ticker:
+        df = df[df['Underlying'] == ticker].reset_index(drop=True)
+
+    return df
+
+
+def _parse_dimensions(value: str) -> Tuple[str, ...]:
+    from .logic.dataframe.rollup import DIMENSIONS
+
+    output = tuple(name for name in value.split(',') if name)
+    unknown = [name for name in output if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f'Unknown dimensions: {", ".join(unknown)}')
+
+    return output
+
+
+# path => (report, {parameter: parser})
+REPORTS: Dict[str, Tuple[Callable[..., 'pd.DataFrame'], Dict[str, Callable[[str], Any]]]] = {
+    '/trades': (
+        get_trades,
+        {
+            'from_date': datetime.date.fromisoformat,
+            'to_date': datetime.date.fromisoformat,
+            'ticker': str,
+        },
+    ),
+    '/rollup': (
+        get_rollup,
+        {
+            'from_date': datetime.date.fromisoformat,
+            'to_date': datetime.date.fromisoformat,
+            'ticker': str,
+            'by': _parse_dimensions,
+        },
+    ),
+    '/positions': (
+        get_positions,
+        {
+            'date': datetime.date.fromisoformat,
+            'ticker': str,
+        },
+    ),
+}
+
+
+def get_data_version() -> str:
+    """
+    :returns: a digest that changes whenever the reports could.
+    """
+    from . import database
+    from .logic.change_log import get_sequence
+    from .logic.prices import _get_path
+    from .logic.prices import get_price_history
+    from .models.rollup import RollupState
+
+    try:
+        sequence = get_sequence()
+        rollup_updated_at = database.session.query(RollupState.updated_at).scalar()
+    finally:
+        database.session.remove()
+
+    global _prices_updated_at
+    prices_updated_at = _get_mtime(_get_path())
+    if prices_updated_at != _prices_updated_at:
+        # Prices are saved by the sync daemon, so the copy we've loaded is out of date.
+        get_price_history.cache_clear()
+        _prices_updated_at = prices_updated_at
+
+    return hashlib.sha256(
+        json.dumps([
+            sequence,
+            str(rollup_updated_at),
+            prices_updated_at,
+
+            # Reports default to today, so they can change without the data changing.
+            datetime.date.today().isoformat(),
+        ]).encode(),
+    ).hexdigest()[:16]
+
+
+def _get_mtime(path: str) -> Optional[float]:
+    if not path:
+        return None
+
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class ReportServer:
+    def __init__(self, max_workers: int = MAX_WORKERS, cache_size: int = CACHE_SIZE) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='report',
+        )
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[Tuple[Any, ...], bytes]' = OrderedDict()
+
+        # Work that's in progress, so that concurrent requests for the same thing wait on it,
+        # rather than doing it again.
+        self.pending: Dict[Tuple[Any, ...], 'asyncio.Future[Any]'] = {}
+
+        self.version: Optional[str] = None
+        self.version_checked_at = 0.0
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    return
+
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    writer.write(_serialize(_get_error(HTTPStatus.BAD_REQUEST, 'Bad request.')))
+                    return
+
+                response = await self.respond(method, target, headers)
+                keep_alive = (
+                    version == 'HTTP/1.1'
+                    and headers.get('connection', '').lower() != 'close'
+                )
+                writer.write(_serialize(response, keep_alive=keep_alive, head=method == 'HEAD'))
+                await writer.drain()
+
+                if not keep_alive:
+                    return
+
+        except (ConnectionError, ValueError):
+            # The client went away (or sent a line that's too long).
+            pass
+
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Response:
+        try:
+            response = await self._respond(method, target, headers)
+        except HTTPError as e:
+            response = _get_error(e.status, e.message)
+        except Exception:
+            traceback.print_exc()
+            response = _get_error(HTTPStatus.INTERNAL_SERVER_ERROR, 'Internal server error.')
+
+        metrics.increment('report_server_responses_total', status=response.status.value)
+        return response
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str]) -> Response:
+        if method not in ('GET', 'HEAD'):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'This API is read-only.')
+
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        if path not in REPORTS:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'Unknown report: {url.path}')
+
+        report, parsers = REPORTS[path]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        format = _get_format(params.pop('format', None), headers.get('accept', ''))
+        kwargs = _parse_params(params, parsers)
+
+        etag = f'"{await self.get_version()}-{format}"'
+        if etag in _parse_etags(headers.get('if-none-match', '')):
+            return Response(HTTPStatus.NOT_MODIFIED, {'ETag': etag})
+
+        key = (etag, path, tuple(sorted(kwargs.items())))
+        body = self.cache.get(key)
+        if body is None:
+            body = await self._run_once(key, _render, report, kwargs, format)
+            self.cache[key] = body
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+            metrics.increment('report_server_cache_hits_total')
+
+        return Response(
+            HTTPStatus.OK,
+            {
+                'Content-Type': CONTENT_TYPES[format],
+                'ETag': etag,
+
+                # Clients can keep responses, but should check whether they're still valid.
+                'Cache-Control': 'no-cache',
+            },
+            body,
+        )
+
+    async def get_version(self) -> str:
+        now = asyncio.get_running_loop().time()
+        if self.version is None or now - self.version_checked_at > VERSION_TTL:
+            self.version = await self._run_once(('version',), get_data_version)
+            self.version_checked_at = now
+
+        return self.version
+
+    def _run_once(
+        self,
+        key: Tuple[Any, ...],
+        func: Callable[..., Any],
+        *args: Any
+    ) -> Awaitable[Any]:
+        """
+        Runs `func` on the thread pool, unless it's already running for `key`.
+        """
+        future = self.pending.get(key)
+        if not future:
+            future = self.pending[key] = asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                func,
+                *args,
+            )
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+
+        # Other requests might be waiting on this too, so it shouldn't be cancelled just
+        # because this client went away.
+        return asyncio.shield(future)
+
+
+def _render(
+    report: Callable[..., 'pd.DataFrame'],
+    kwargs: Dict[str, Any],
+    format: str,
+) -> bytes:
+    from . import database
+
+    try:
+        with metrics.timer('report_server_render_seconds', report=report.__name__):
+            df = report(**kwargs)
+            if format == 'arrow':
+                return service.encode_frame(df, 'arrow')
+
+            return _to_json(df)
+    finally:
+        database.session.remove()
+
+
+def _to_json(df: 'pd.DataFrame') -> bytes:
+    df = df.copy()
+    for column in df.columns:
+        if len(df) and isinstance(df[column].iloc[0], datetime.date):
+            df[column] = df[column].map(lambda value: value.isoformat())
+
+    return df.to_json(orient='records').encode()
+
+
+def _get_format(value: Optional[str], accept: str) -> str:
+    if not value:
+        value = 'arrow' if CONTENT_TYPES['arrow'] in accept else 'json'
+
+    if value not in CONTENT_TYPES:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f'Unknown format: {value}')
+    if value == 'arrow' and not service._has_arrow():
+        raise HTTPError(HTTPStatus.NOT_ACCEPTABLE, 'pyarrow is not installed.')
+
+    return value
+
+
+def _parse_params(
+    params: Dict[str, str],
+    parsers: Dict[str, Callable[[str], Any]],
+) -> Dict[str, Any]:
+    output = {}
+    for key, value in params.items():
+        if key not in parsers:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'Unknown parameter: {key}')
+
+        try:
+            output[key] = parsers[key](value)
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'Invalid {key}: {e}')
+
+    return output
+
+
+def _parse_etags(value: str) -> Set[str]:
+    return {
+        # Weak validators are good enough for us.
+        tag.strip().replace('W/', '', 1)
+        for tag in value.split(',')
+        if tag.strip()
+    }
+
+
+def _get_error(status: HTTPStatus, message: str) -> Response:
+    return Response(
+        status,
+        {'Content-Type': CONTENT_TYPES['json']},
+        json.dumps({'error': message}).encode(),
+    )
+
+
+def _serialize(response: Response, keep_alive: bool = False, head: bool = False) -> bytes:
+    headers = {
+        **response.headers,
+        'Connection': 'keep-alive' if keep_alive else 'close',
+    }
+    if response.status != HTTPStatus.NOT_MODIFIED:
+        headers['Content-Length'] = str(len(response.body))
+
+    lines = [f'HTTP/1.1 {response.status.value} {response.status.phrase}']
+    lines.extend(f'{key}: {value}' for key, value in headers.items())
+    output = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    if not head and response.status != HTTPStatus.NOT_MODIFIED:
+        output += response.body
+
+    return output
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080, max_workers: int = MAX_WORKERS) -> None:
+    """
+    Runs until interrupted.
+    """
+    asyncio.run(_serve(ReportServer(max_workers=max_workers), host, port))
+
+
+async def _serve(server: ReportServer, host: str, port: int) -> None:
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f'Serving reports on http://{host}:{port}')
+
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.executor.shutdown(wait=False)
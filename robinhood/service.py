@@ -0,0 +1,581 @@
+"""
+A long-lived process that keeps the portfolio replayed in memory, so that notebooks (and the
+CLI) don't each pay for importing SQLAlchemy, hydrating every trade and replaying the entire
+history before they can answer anything.
+
+    $ robinhood serve
+
+Reports in `robinhood.logic.dataframe` use it when it's running, and they're called with
+`sync=False`. Otherwise, they fall back to replaying the database themselves. It can also be
+queried directly, without importing any of the report builders:
+
+    from robinhood import service
+    df = service.get_trades(from_date='2020-01-01')
+
+Rows are applied as the sync (e.g. `robinhood sync --watch`) inserts them, as read from the
+change log (see `robinhood.logic.change_log`). As long as they're newer than everything we've
+replayed so far, they're replayed on top of the resident portfolio; otherwise (e.g. a
+backdated split, or a row repaired by `robinhood verify`), the portfolio is replayed from
+scratch.
+
+The protocol is a JSON request (one line), answered by a JSON header (one line) and a body of
+`length` bytes: either an Arrow IPC stream (if pyarrow is installed on both ends), or JSON.
+"""
+import bisect
+import datetime
+import heapq
+import json
+import os
+import socket
+import socketserver
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+
+from . import metrics
+from .util import get_path_to
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .logic.dataframe.trades import Sale
+
+
+# Clients wait this long (in seconds) for an answer. The first query after the service starts
+# (or after a backdated change) waits on a full replay, which is still faster than doing it
+# ourselves.
+TIMEOUT = 120
+
+# How often (in seconds) the service checks for new rows while it's idle, so that it's
+# already up-to-date when the next query comes in.
+REFRESH_INTERVAL = 5
+
+# Columns of `get_lots`.
+LOT_COLUMNS = [
+    'Instrument ID',
+    'Name',
+    'Underlying',
+    'Is Option',
+    'Date Bought',
+    'Price Bought',
+    'Quantity',
+]
+
+
+class ServiceError(Exception):
+    pass
+
+
+def get_socket_path() -> str:
+    """
+    Defaults to a socket next to the database.
+    """
+    return os.environ.get('ROBINHOOD_SOCKET') or (
+        (os.environ.get('ROBINHOOD_DATABASE') or get_path_to('database.sqlite3')) + '.sock'
+    )
+
+
+def get_trades(
+    from_date: Optional[Union[datetime.date, str]] = None,
+    to_date: Optional[Union[datetime.date, str]] = None,
+    path: Optional[str] = None,
+    cost_basis: bool = False,
+) -> 'pd.DataFrame':
+    """
+    The same as `robinhood.logic.dataframe.trades.get(sync=False)`.
+
+    :param from_date: YYYY-MM-DD format
+    :param to_date: YYYY-MM-DD format
+    :param cost_basis: see `robinhood.logic.dataframe.trades.to_dataframe`.
+    :raises: OSError, if the service isn't running.
+    :raises: ServiceError
+    """
+    return query(
+        'trades',
+        path=path,
+        from_date=_format_date(from_date),
+        to_date=_format_date(to_date),
+        cost_basis=cost_basis,
+    )
+
+
+def get_lots(path: Optional[str] = None) -> 'pd.DataFrame':
+    """
+    :returns: every lot that's currently held (i.e. as of the latest trade), in `LOT_COLUMNS`.
+    :raises: OSError, if the service isn't running.
+    :raises: ServiceError
+    """
+    return query('lots', path=path)
+
+
+def get_status(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    :returns: `version` (which changes whenever the resident portfolio does), and the number
+        of `sales` and `lots` held.
+    :raises: OSError, if the service isn't running.
+    """
+    with _connect(path) as connection:
+        header, _ = _request(connection, {'query': 'status'})
+
+    return header
+
+
+def query(name: str, path: Optional[str] = None, **kwargs: Any) -> 'pd.DataFrame':
+    with metrics.timer('service_query_seconds', query=name):
+        with _connect(path) as connection:
+            header, body = _request(
+                connection,
+                {
+                    'query': name,
+                    'format': 'arrow' if _has_arrow() else 'json',
+                    **kwargs,
+                },
+            )
+
+        return decode_frame(body, header['format'])
+
+
+class ResidentPortfolio:
+    """
+    The portfolio, replayed through every event in the database, and the sales that came out
+    of it (in the same order as `dataframe.trades.get`).
+    """
+    def __init__(self) -> None:
+        from .logic.dataframe.trades import Portfolio
+
+        self.portfolio = Portfolio()
+        self.sales: List['Sale'] = []
+
+        # For each sale, the date of the event that caused it (which is what reports filter
+        # on), and whether it was an expiration.
+        self.dates: List[datetime.datetime] = []
+        self.is_expiration: List[bool] = []
+
+        # The last change (in the change log) that's been replayed.
+        self.sequence: Optional[int] = None
+        self.last_event_date: Optional[datetime.datetime] = None
+
+        # Bumped every time the above changes.
+        self.version = 0
+
+        self._frames: Dict[Tuple[Any, ...], 'pd.DataFrame'] = {}
+
+    def refresh(self) -> bool:
+        """
+        Applies whatever has been added to the database since the last refresh.
+
+        :returns: whether anything changed.
+        """
+        from . import database
+        from .logic.dataframe.trades import _get_event_date
+
+        try:
+            sequence = _get_sequence()
+            if sequence == self.sequence:
+                return False
+
+            if self.sequence is None:
+                self.rebuild(sequence)
+                return True
+
+            events = _get_events_since(self.sequence, sequence)
+            if events is None or (
+                events
+                and self.last_event_date
+                and _get_event_date(events[0]) <= self.last_event_date
+            ):
+                # These need to be replayed in between (or instead of) ones we've already
+                # applied.
+                self.rebuild(sequence)
+                return True
+
+            for event in events:
+                self._apply(event)
+
+            self.sequence = sequence
+            self._on_change()
+            metrics.increment('service_events_applied_total', len(events))
+            return True
+        finally:
+            # Nothing we keep refers to ORM objects, and this makes sure that we see what
+            # other processes commit next time.
+            database.session.remove()
+
+    def rebuild(self, sequence: Optional[int] = None) -> None:
+        from .logic.dataframe.trades import _get_events
+        from .logic.dataframe.trades import Portfolio
+
+        if sequence is None:
+            sequence = _get_sequence()
+
+        with metrics.timer('service_rebuild_seconds'):
+            self.portfolio = Portfolio()
+            self.sales = []
+            self.dates = []
+            self.is_expiration = []
+            self.last_event_date = None
+
+            # NOTE: Reports don't include today's trades, unless they're explicitly asked
+            # for. We keep everything, and filter when we're queried.
+            for event in _get_events(datetime.date.max, sync=False):
+                self._apply(event)
+
+        self.sequence = sequence
+        self._on_change()
+        metrics.increment('service_rebuilds_total')
+
+    def get_trades(
+        self,
+        from_date: Optional[datetime.date] = None,
+        to_date: Optional[datetime.date] = None,
+        cost_basis: bool = False,
+    ) -> 'pd.DataFrame':
+        """
+        Filtered the same way as `dataframe.trades.get`: only events before `to_date` (or
+        today) are replayed, though expirations aren't limited unless `to_date` is provided.
+        """
+        key = ('trades', from_date, to_date, cost_basis)
+        if key not in self._frames:
+            from .logic.dataframe.trades import to_dataframe
+
+            end = datetime.datetime.combine(to_date or datetime.date.today(), datetime.time())
+            stop = bisect.bisect_left(self.dates, end)
+            sales = self.sales[:stop]
+            if not to_date:
+                sales.extend(
+                    sale
+                    for sale, is_expiration in zip(self.sales[stop:], self.is_expiration[stop:])
+                    if is_expiration
+                )
+            if from_date:
+                sales = [sale for sale in sales if sale.sold.date >= from_date]
+
+            self._frames[key] = to_dataframe(sales, cost_basis=cost_basis)
+
+        return self._frames[key]
+
+    def get_lots(self) -> 'pd.DataFrame':
+        key = ('lots',)
+        if key not in self._frames:
+            import pandas as pd
+
+            rows = []
+            for instrument_id, lots in self.portfolio.instruments.items():
+                info = self.portfolio.info[instrument_id]
+                rows.extend(
+                    [
+                        instrument_id,
+                        info.name,
+                        info.underlying,
+                        info.is_option,
+                        lot.date,
+                        lot.price,
+                        lot.quantity,
+                    ]
+                    for lot in lots
+                )
+
+            self._frames[key] = pd.DataFrame(rows, columns=LOT_COLUMNS)
+
+        return self._frames[key]
+
+    def _apply(self, event: Any) -> None:
+        from .logic.dataframe.trades import _apply_event
+        from .logic.dataframe.trades import _get_event_date
+        from .logic.trades import OptionExpiration
+
+        date = _get_event_date(event)
+        is_expiration = isinstance(event, OptionExpiration)
+        for sale in _apply_event(self.portfolio, event):
+            self.sales.append(sale)
+            self.dates.append(date)
+            self.is_expiration.append(is_expiration)
+
+        self.last_event_date = date
+
+    def _on_change(self) -> None:
+        self.version += 1
+        self._frames = {}
+
+
+class Server(socketserver.UnixStreamServer):
+    def __init__(self, path: str, state: ResidentPortfolio) -> None:
+        self.state = state
+        self.last_refresh = time.monotonic()
+        super().__init__(path, Handler)
+
+        # Only we should be able to see our trades.
+        os.chmod(path, 0o600)
+
+    def service_actions(self) -> None:
+        if time.monotonic() - self.last_refresh >= REFRESH_INTERVAL:
+            self.refresh()
+
+    def refresh(self) -> None:
+        self.state.refresh()
+        self.last_refresh = time.monotonic()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    server: Server
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+
+            # Queries are answered as of the latest sync, rather than the last time we
+            # happened to check.
+            self.server.refresh()
+            header, body = self.answer(request)
+        except Exception as e:
+            header, body = {'error': f'{type(e).__name__}: {e}'}, b''
+
+        header['length'] = len(body)
+        self.wfile.write(json.dumps(header).encode() + b'\n' + body)
+
+    def answer(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        state = self.server.state
+        header: Dict[str, Any] = {'version': state.version}
+
+        name = request.get('query')
+        if name == 'status':
+            header.update(sales=len(state.sales), lots=state.portfolio.lots_held)
+            return header, b''
+
+        if name == 'trades':
+            df = state.get_trades(
+                from_date=_parse_date(request.get('from_date')),
+                to_date=_parse_date(request.get('to_date')),
+                cost_basis=bool(request.get('cost_basis')),
+            )
+        elif name == 'lots':
+            df = state.get_lots()
+        else:
+            raise ValueError(f'Unknown query: {name}')
+
+        header['format'] = request.get('format', 'json')
+        if header['format'] == 'arrow' and not _has_arrow():
+            header['format'] = 'json'
+
+        with metrics.timer('service_encode_seconds', format=header['format']):
+            return header, encode_frame(df, header['format'])
+
+
+def serve(path: Optional[str] = None) -> None:
+    """
+    Runs until interrupted. Only one service can run (per database) at a time.
+
+    :raises: BlockingIOError, if another one is running.
+    """
+    from . import database
+
+    path = path or get_socket_path()
+    with database.lock('service', blocking=False):
+        # Since we hold the lock, this is left over from a service that didn't exit cleanly.
+        if os.path.exists(path):
+            os.unlink(path)
+
+        state = ResidentPortfolio()
+        state.refresh()
+
+        with Server(path, state) as server:
+            try:
+                server.serve_forever(poll_interval=1)
+            finally:
+                os.unlink(path)
+
+
+def encode_frame(df: 'pd.DataFrame', format: str) -> bytes:
+    if format == 'arrow':
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return sink.getvalue().to_pybytes()
+
+    return json.dumps(
+        {
+            'columns': list(df.columns),
+            'dates': [
+                column
+                for column in df.columns
+                if len(df) and isinstance(df[column].iloc[0], datetime.date)
+            ],
+            'data': df.values.tolist(),
+        },
+        default=_to_json,
+    ).encode()
+
+
+def decode_frame(body: bytes, format: str) -> 'pd.DataFrame':
+    if format == 'arrow':
+        import pyarrow as pa
+
+        return pa.ipc.open_stream(body).read_all().to_pandas()
+
+    import pandas as pd
+
+    data = json.loads(body)
+    df = pd.DataFrame(data['data'], columns=data['columns'])
+    for column in data['dates']:
+        df[column] = df[column].map(datetime.date.fromisoformat)
+
+    return df
+
+
+def _connect(path: Optional[str]) -> socket.socket:
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(TIMEOUT)
+    try:
+        connection.connect(path or get_socket_path())
+    except OSError:
+        connection.close()
+        raise
+
+    return connection
+
+
+def _request(
+    connection: socket.socket,
+    request: Dict[str, Any],
+) -> Tuple[Dict[str, Any], bytes]:
+    connection.sendall(json.dumps(request).encode() + b'\n')
+
+    with connection.makefile('rb') as f:
+        header = json.loads(f.readline() or b'null')
+        if not header:
+            raise ServiceError('The service closed the connection without answering.')
+        if 'error' in header:
+            raise ServiceError(header['error'])
+
+        body = f.read(header['length'])
+
+    return header, body
+
+
+def _get_sequence() -> int:
+    from .logic.change_log import get_sequence
+
+    return get_sequence()
+
+
+def _get_events_since(since: int, until: int) -> Optional[List[Any]]:
+    """
+    :returns: events inserted after change `since` (up to `until`), in the same order as
+        `dataframe.trades._get_events`. None, if rows were updated or deleted instead.
+    """
+    from . import database
+    from .logic.change_log import iter_changes
+    from .logic.database.common import MAX_VARIABLES
+    from .logic.database.option_trade import OptionStrategyDBLogic
+    from .logic.dataframe.trades import _get_event_date
+    from .logic.trades import OptionExpiration
+    from .models.option import Option
+    from .models.option import OptionExpirationEvent
+    from .models.option import OptionStrategy
+    from .models.stock import StockSplit
+    from .models.stock import StockTrade
+
+    ids: Dict[str, List[int]] = {
+        model.__tablename__: []
+        for model in (OptionExpirationEvent, OptionStrategy, StockSplit, StockTrade)
+    }
+    for batch in iter_changes(since, until):
+        for change in batch:
+            if change.op != 'insert':
+                # Rows that we've already replayed might have changed.
+                return None
+
+            # New options (and their trades) are replayed through strategies and expirations.
+            if change.table_name in ids:
+                ids[change.table_name].append(change.row_id)
+
+    def get_chunks(model: Any) -> Iterator[List[int]]:
+        values = ids[model.__tablename__]
+        for index in range(0, len(values), MAX_VARIABLES):
+            yield values[index:index + MAX_VARIABLES]
+
+    expirations = sorted(
+        (
+            OptionExpiration(option=option, quantity=event.quantity)
+            for chunk in get_chunks(OptionExpirationEvent)
+            for event, option in (
+                database.session.query(OptionExpirationEvent, Option)
+                .join(Option, OptionExpirationEvent.option_id == Option.id)
+                .filter(OptionExpirationEvent.id.in_(chunk))
+                .order_by(OptionExpirationEvent.id.asc())
+            )
+        ),
+        key=lambda item: item.option.expiration_date,
+    )
+    strategies = sorted(
+        OptionStrategyDBLogic().hydrate(
+            *(
+                strategy
+                for chunk in get_chunks(OptionStrategy)
+                for strategy in (
+                    database.session.query(OptionStrategy)
+                    .filter(OptionStrategy.id.in_(chunk))
+                    .order_by(OptionStrategy.id.asc())
+                )
+            ),
+        ),
+        key=_get_event_date,
+    )
+    splits = sorted(
+        (
+            split
+            for chunk in get_chunks(StockSplit)
+            for split in database.session.query(StockSplit).filter(StockSplit.id.in_(chunk))
+        ),
+        key=lambda item: (item.date, item.id),
+    )
+    trades = sorted(
+        (
+            trade
+            for chunk in get_chunks(StockTrade)
+            for trade in database.session.query(StockTrade).filter(StockTrade.id.in_(chunk))
+        ),
+        key=lambda item: (item.date, item.id),
+    )
+
+    return list(heapq.merge(expirations, strategies, splits, trades, key=_get_event_date))
+
+
+def _has_arrow() -> bool:
+    try:
+        import pyarrow     # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def _format_date(value: Optional[Union[datetime.date, str]]) -> Optional[str]:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    return value
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime.date]:
+    if not value:
+        return None
+
+    return datetime.date.fromisoformat(value)
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    # numpy scalars
+    return value.item()
@@ -0,0 +1,604 @@
+"""
+Generates realistic (but fake) trade histories, in the same shape as the Robinhood API's raw
+payloads. This lets us exercise (and benchmark) the whole pipeline at scales that we don't
+have real data for, without a network connection.
+"""
+import datetime
+import heapq
+import itertools
+import math
+import random
+import uuid
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from .logic.stock_split import Split
+from .offline import API_BASE
+from .offline import OfflineClient
+
+
+TICKER_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Trading hours (14:30 to 21:00 UTC), in seconds.
+MARKET_OPEN = datetime.timedelta(hours=14, minutes=30)
+SECONDS_PER_TRADING_DAY = int(6.5 * 60 * 60)
+
+SPLIT_RATIOS = (2, 3, 4, 5, 10)
+
+
+class SyntheticHistory(NamedTuple):
+    stock_orders: List[Dict[str, Any]]
+    options_orders: List[Dict[str, Any]]
+    options_events: List[Dict[str, Any]]
+
+    # Maps instrument feed (e.g. `options/instruments`) to payloads, keyed by UUID.
+    instruments: Dict[str, Dict[str, Dict[str, Any]]]
+    splits: List[Split]
+
+    # Maps ticker to its (split-adjusted) daily prices, in the format of
+    # `quotes/historicals`. There are only entries for days that the price moved.
+    historicals: Dict[str, List[Dict[str, Any]]]
+
+    def get_client(self, page_size: int = 100) -> OfflineClient:
+        return OfflineClient(
+            feeds={
+                'orders': self.stock_orders,
+                'options/orders': self.options_orders,
+                'options/events': self.options_events,
+            },
+            instruments=self.instruments,
+            page_size=page_size,
+            historicals=self.historicals,
+        )
+
+
+class _Ticker:
+    def __init__(self, uuid: str, symbol: str, price: float) -> None:
+        self.uuid = uuid
+        self.symbol = symbol
+        self.price = price
+        self.quantity = 0.0
+
+        # (date, price) whenever the price moves, before adjusting for splits.
+        self.prices: List[Tuple[datetime.date, float]] = []
+
+    @property
+    def url(self) -> str:
+        return f'{API_BASE}/instruments/{self.uuid}/'
+
+
+class _Option:
+    def __init__(
+        self,
+        uuid: str,
+        ticker: _Ticker,
+        type: str,
+        strike_price: float,
+        expiration_date: datetime.date,
+        quantity: float,
+        premium: float,
+    ) -> None:
+        self.uuid = uuid
+        self.ticker = ticker
+        self.type = type
+        self.strike_price = strike_price
+        self.expiration_date = expiration_date
+        self.quantity = quantity
+        self.premium = premium
+
+        # Set when the option is sold, or expires.
+        self.closed = False
+
+    @property
+    def url(self) -> str:
+        return f'{API_BASE}/options/instruments/{self.uuid}/'
+
+
+def generate(
+    num_orders: int = 1000,
+    seed: int = 0,
+    start_date: datetime.date = datetime.date(2012, 1, 3),
+    end_date: Optional[datetime.date] = None,
+    options_ratio: float = 0.3,
+    cancel_ratio: float = 0.03,
+    split_ratio: float = 0.001,
+) -> SyntheticHistory:
+    """
+    :param num_orders: number of orders (stock and options, including cancelled ones) to
+        generate. Options events and splits come on top of this.
+    :param options_ratio: proportion of orders that are for options.
+    :param cancel_ratio: proportion of stock orders that are cancelled.
+    :param split_ratio: probability that a held stock splits after an order.
+    """
+    return _Generator(
+        random.Random(seed),
+        start_date,
+        end_date or start_date + datetime.timedelta(days=365 * 10),
+        options_ratio=options_ratio,
+        cancel_ratio=cancel_ratio,
+        split_ratio=split_ratio,
+    ).run(num_orders)
+
+
+class _Generator:
+    def __init__(
+        self,
+        rng: random.Random,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        options_ratio: float,
+        cancel_ratio: float,
+        split_ratio: float,
+    ) -> None:
+        self.rng = rng
+        self.options_ratio = options_ratio
+        self.cancel_ratio = cancel_ratio
+        self.split_ratio = split_ratio
+
+        self.days = [
+            start_date + datetime.timedelta(days=offset)
+            for offset in range((end_date - start_date).days + 1)
+            if (start_date + datetime.timedelta(days=offset)).weekday() < 5
+        ]
+        self.account = f'{API_BASE}/accounts/5RY82436/'
+
+        self.tickers: List[_Ticker] = []
+        self.pending_splits: List[Split] = []
+        self.split_dates: Set[datetime.date] = set()
+
+        # Options are removed from these lazily (when they're closed), so that bookkeeping
+        # doesn't grow with the number of open contracts.
+        self.open_options: List[_Option] = []
+        self.expirations: List[Tuple[datetime.date, int, _Option]] = []
+        self.counter = itertools.count()
+
+        # After-hours timestamps, for events that happen outside of trading.
+        self.after_hours_counter = 0
+
+        self.history = SyntheticHistory(
+            stock_orders=[],
+            options_orders=[],
+            options_events=[],
+            instruments={'instruments': {}, 'options/instruments': {}},
+            splits=[],
+            historicals={},
+        )
+
+        # The day we're currently generating orders for.
+        self.date = start_date
+
+    def run(self, num_orders: int) -> SyntheticHistory:
+        # Roughly, people trade more of the same stocks as they trade more.
+        for _ in range(max(5, int(math.sqrt(num_orders)))):
+            self._add_ticker()
+
+        # Spread orders evenly through trading hours, so that no two happen at the same time.
+        total_seconds = len(self.days) * SECONDS_PER_TRADING_DAY
+        stride = max(1, total_seconds // max(1, num_orders))
+        for index in range(num_orders):
+            offset = min(
+                index * stride + self.rng.randrange(stride),
+                total_seconds - 1,
+            )
+            day, seconds = divmod(offset, SECONDS_PER_TRADING_DAY)
+            timestamp = (
+                datetime.datetime.combine(self.days[day], datetime.time())
+                + MARKET_OPEN
+                + datetime.timedelta(seconds=seconds, microseconds=self.rng.randrange(10 ** 6))
+            )
+
+            self.date = timestamp.date()
+            self._settle(timestamp)
+            if self.rng.random() < self.options_ratio:
+                self._add_options_order(timestamp)
+            else:
+                self._add_stock_order(timestamp)
+
+            if self.rng.random() < self.split_ratio:
+                self._schedule_split(timestamp)
+
+        self._settle(datetime.datetime.combine(self.days[-1], datetime.time.max))
+        self._add_historicals()
+        return self.history
+
+    def _uuid(self) -> str:
+        # Derived from our seed, so that generated histories are reproducible.
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _add_ticker(self) -> _Ticker:
+        while True:
+            symbol = ''.join(
+                self.rng.choice(TICKER_LETTERS)
+                for _ in range(self.rng.randint(2, 4))
+            )
+            if symbol not in {ticker.symbol for ticker in self.tickers}:
+                break
+
+        ticker = _Ticker(self._uuid(), symbol, price=self.rng.uniform(5, 500))
+        self.tickers.append(ticker)
+        self.history.instruments['instruments'][ticker.uuid] = {
+            'id': ticker.uuid,
+            'url': ticker.url,
+            'symbol': symbol,
+            'simple_name': f'{symbol} Inc',
+            'name': f'{symbol} Incorporated Common Stock',
+            'tradeable': True,
+            'type': 'stock',
+        }
+
+        return ticker
+
+    def _pick_ticker(self) -> _Ticker:
+        ticker = self.rng.choice(self.tickers)
+
+        # Geometric brownian motion, more or less. We only move prices when we look at them,
+        # which is good enough for our purposes.
+        ticker.price = max(1.0, ticker.price * math.exp(self.rng.gauss(0, 0.02)))
+        ticker.prices.append((self.date, ticker.price))
+
+        return ticker
+
+    def _add_stock_order(self, timestamp: datetime.datetime) -> None:
+        ticker = self._pick_ticker()
+        if ticker.quantity >= 1 and self.rng.random() < 0.45:
+            side = 'sell'
+            quantity = float(self.rng.randint(1, int(ticker.quantity)))
+        else:
+            side = 'buy'
+            quantity = float(self.rng.randint(1, 100))
+
+        state = 'filled'
+        if self.rng.random() < self.cancel_ratio:
+            state = 'cancelled'
+
+        # Partial fills show up as multiple executions, at slightly different prices.
+        executions = []
+        if state == 'filled':
+            remaining = quantity
+            num_executions = self.rng.choice((1, 1, 1, 2, 3))
+            for index in range(num_executions):
+                filled = remaining
+                if index < num_executions - 1 and remaining > 1:
+                    filled = float(self.rng.randint(1, int(remaining) - 1 or 1))
+
+                executions.append({
+                    'price': _format(ticker.price * self.rng.uniform(0.999, 1.001), 8),
+                    'quantity': _format(filled, 8),
+                    'settlement_date': (timestamp.date() + datetime.timedelta(days=2)).isoformat(),
+                    'timestamp': _timestamp(timestamp),
+                    'id': self._uuid(),
+                })
+
+                remaining -= filled
+                if not remaining:
+                    break
+
+            if side == 'buy':
+                ticker.quantity += quantity
+            else:
+                ticker.quantity -= quantity
+
+        filled_quantity = sum(float(execution['quantity']) for execution in executions)
+        average_price = (
+            sum(
+                float(execution['price']) * float(execution['quantity'])
+                for execution in executions
+            ) / filled_quantity
+            if filled_quantity else None
+        )
+
+        order_id = self._uuid()
+        created_at = timestamp - datetime.timedelta(seconds=self.rng.randint(0, 5))
+        self.history.stock_orders.append({
+            'id': order_id,
+            'ref_id': self._uuid(),
+            'url': f'{API_BASE}/orders/{order_id}/',
+            'account': self.account,
+            'position': f'{self.account.replace("accounts", "positions")}{ticker.uuid}/',
+            'cancel': None,
+            'instrument': ticker.url,
+            'cumulative_quantity': _format(filled_quantity, 8),
+            'average_price': _format(average_price, 8) if average_price else None,
+            'fees': '0.00',
+            'state': state,
+            'type': 'limit',
+            'side': side,
+            'time_in_force': 'gfd',
+            'trigger': 'immediate',
+            'price': _format(ticker.price, 8),
+            'stop_price': None,
+            'quantity': _format(quantity, 8),
+            'reject_reason': None,
+            'created_at': _timestamp(created_at),
+            'updated_at': _timestamp(timestamp + datetime.timedelta(milliseconds=500)),
+            'last_transaction_at': _timestamp(timestamp),
+            'executions': executions,
+            'extended_hours': False,
+            'override_dtbp_checks': False,
+            'override_day_trade_checks': False,
+            'response_category': None,
+            'stop_triggered_at': None,
+            'last_trail_price': None,
+            'last_trail_price_updated_at': None,
+            'dollar_based_amount': None,
+            'total_notional': _money(ticker.price * quantity),
+            'executed_notional': _money((average_price or 0) * filled_quantity),
+            'investment_schedule_id': None,
+        })
+
+    def _add_options_order(self, timestamp: datetime.datetime) -> None:
+        option = self._pick_open_option(timestamp.date())
+        if option and self.rng.random() < 0.5:
+            option.closed = True
+            price = max(0.01, _intrinsic_value(option) + self.rng.uniform(0, 1))
+            self._append_options_order(
+                option,
+                timestamp,
+                side='sell',
+                price=price,
+                closing_strategy=f'long_{option.type}',
+            )
+            return
+
+        ticker = self._pick_ticker()
+        option_type = self.rng.choice(('call', 'put'))
+        expiration_date = _next_friday(
+            timestamp.date() + datetime.timedelta(days=self.rng.randint(1, 60)),
+        )
+        option = _Option(
+            self._uuid(),
+            ticker,
+            type=option_type,
+            strike_price=round(ticker.price * self.rng.uniform(0.8, 1.2), 1),
+            expiration_date=expiration_date,
+            quantity=float(self.rng.randint(1, 5)),
+            premium=0,
+        )
+        option.premium = max(0.05, _intrinsic_value(option) + self.rng.uniform(0.1, 3))
+
+        self.history.instruments['options/instruments'][option.uuid] = {
+            'id': option.uuid,
+            'url': option.url,
+            'chain_id': self._uuid(),
+            'chain_symbol': ticker.symbol,
+            'type': option_type,
+            'expiration_date': expiration_date.isoformat(),
+            'strike_price': _format(option.strike_price, 4),
+            'state': 'active',
+            'tradability': 'tradable',
+        }
+
+        self.open_options.append(option)
+        heapq.heappush(self.expirations, (expiration_date, next(self.counter), option))
+        self._append_options_order(
+            option,
+            timestamp,
+            side='buy',
+            price=option.premium,
+            opening_strategy=f'long_{option_type}',
+        )
+
+    def _pick_open_option(self, date: datetime.date) -> Optional[_Option]:
+        while self.open_options:
+            index = self.rng.randrange(len(self.open_options))
+            option = self.open_options[index]
+            if not option.closed and option.expiration_date > date:
+                return option
+
+            # Swap and pop, since order doesn't matter.
+            self.open_options[index] = self.open_options[-1]
+            self.open_options.pop()
+
+        return None
+
+    def _append_options_order(
+        self,
+        option: _Option,
+        timestamp: datetime.datetime,
+        side: str,
+        price: float,
+        opening_strategy: Optional[str] = None,
+        closing_strategy: Optional[str] = None,
+    ) -> None:
+        executions = []
+        remaining = option.quantity
+        while remaining:
+            filled = float(self.rng.randint(1, int(remaining)))
+            executions.append({
+                'id': self._uuid(),
+                'price': _format(price, 8),
+                'quantity': _format(filled, 5),
+                'settlement_date': (timestamp.date() + datetime.timedelta(days=1)).isoformat(),
+                'timestamp': _timestamp(timestamp),
+            })
+            remaining -= filled
+
+        premium = price * option.quantity * 100
+        self.history.options_orders.append({
+            'cancel_url': None,
+            'canceled_quantity': '0.00000',
+            'created_at': _timestamp(timestamp - datetime.timedelta(seconds=1)),
+            'direction': 'debit' if side == 'buy' else 'credit',
+            'id': self._uuid(),
+            'legs': [
+                {
+                    'executions': executions,
+                    'id': self._uuid(),
+                    'option': option.url,
+                    'position_effect': 'open' if side == 'buy' else 'close',
+                    'ratio_quantity': 1,
+                    'side': side,
+                },
+            ],
+            'pending_quantity': '0.00000',
+            'premium': _format(premium, 8),
+            'processed_premium': _format(premium, 17),
+            'price': _format(price, 8),
+            'processed_quantity': _format(option.quantity, 5),
+            'quantity': _format(option.quantity, 5),
+            'ref_id': self._uuid(),
+            'state': 'filled',
+            'time_in_force': 'gfd',
+            'trigger': 'immediate',
+            'type': 'limit',
+            'updated_at': _timestamp(timestamp),
+            'chain_id': self._uuid(),
+            'chain_symbol': option.ticker.symbol,
+            'response_category': None,
+            'opening_strategy': opening_strategy,
+            'closing_strategy': closing_strategy,
+            'stop_price': None,
+        })
+
+    def _schedule_split(self, timestamp: datetime.datetime) -> None:
+        held = [ticker for ticker in self.tickers if ticker.quantity]
+        if not held:
+            return
+
+        # Splits are recorded at midnight, so we schedule them for the weekend to make sure
+        # they don't coincide with any order (or options expiration).
+        date = timestamp.date() + datetime.timedelta(days=5 - timestamp.weekday())
+        if date <= timestamp.date():
+            date += datetime.timedelta(days=7)
+        if date in self.split_dates:
+            return
+
+        self.split_dates.add(date)
+        self.pending_splits.append(
+            Split(
+                name=self.rng.choice(held).symbol,
+                from_amount=1,
+                to_amount=self.rng.choice(SPLIT_RATIOS),
+                date=date,
+            ),
+        )
+
+    def _settle(self, timestamp: datetime.datetime) -> None:
+        """Applies everything that happens outside of orders, up until `timestamp`."""
+        for split in list(self.pending_splits):
+            if datetime.datetime.combine(split.date, datetime.time()) > timestamp:
+                continue
+
+            self.pending_splits.remove(split)
+            self.history.splits.append(split)
+
+            ticker = next(ticker for ticker in self.tickers if ticker.symbol == split.name)
+            ticker.quantity *= split.to_amount
+            ticker.price /= split.to_amount
+
+        while self.expirations and self.expirations[0][0] < timestamp.date():
+            _, _, option = heapq.heappop(self.expirations)
+            if not option.closed:
+                option.closed = True
+                self._expire(option)
+
+    def _expire(self, option: _Option) -> None:
+        self.after_hours_counter += 1
+        updated_at = (
+            datetime.datetime.combine(option.expiration_date, datetime.time(22))
+            + datetime.timedelta(seconds=self.after_hours_counter % (2 * 60 * 60))
+        )
+
+        event: Dict[str, Any] = {
+            'account': self.account,
+            'cash_component': None,
+            'chain_id': self._uuid(),
+            'created_at': _timestamp(updated_at - datetime.timedelta(minutes=5)),
+            'direction': 'debit',
+            'equity_components': [],
+            'event_date': option.expiration_date.isoformat(),
+            'id': self._uuid(),
+            'option': option.url,
+            'position': f'{API_BASE}/options/positions/{self._uuid()}/',
+            'quantity': _format(option.quantity, 4),
+            'source_ref_id': None,
+            'state': 'confirmed',
+            'total_cash_amount': '0.00',
+            'type': 'expiration',
+            'underlying_price': _format(option.ticker.price, 4),
+            'updated_at': _timestamp(updated_at),
+        }
+
+        # In-the-money calls get exercised, which means we're buying the underlying stock.
+        if option.type == 'call' and _intrinsic_value(option) > 0:
+            quantity = option.quantity * 100
+            option.ticker.quantity += quantity
+            event.update({
+                'type': 'exercise',
+                'total_cash_amount': _format(option.strike_price * quantity, 2),
+                'equity_components': [
+                    {
+                        'id': self._uuid(),
+                        'instrument': option.ticker.url,
+                        'price': _format(option.strike_price, 4),
+                        'quantity': _format(quantity, 8),
+                        'side': 'buy',
+                        'symbol': option.ticker.symbol,
+                    },
+                ],
+            })
+
+        self.history.options_events.append(event)
+
+    def _add_historicals(self) -> None:
+        for ticker in self.tickers:
+            splits = sorted(
+                (split.date, split.to_amount / split.from_amount)
+                for split in self.history.splits
+                if split.name == ticker.symbol
+            )
+
+            # The last price of each day is its close.
+            closes = dict(ticker.prices)
+            historicals = []
+            for date in sorted(closes):
+                ratio = 1.0
+                for split_date, split_ratio in splits:
+                    if split_date > date:
+                        ratio *= split_ratio
+
+                price = _format(closes[date] / ratio, 4)
+                historicals.append({
+                    'begins_at': f'{date.isoformat()}T00:00:00Z',
+                    'open_price': price,
+                    'close_price': price,
+                    'high_price': price,
+                    'low_price': price,
+                    'volume': 0,
+                    'session': 'reg',
+                    'interpolated': False,
+                })
+
+            self.history.historicals[ticker.symbol] = historicals
+
+
+def _intrinsic_value(option: _Option) -> float:
+    if option.type == 'call':
+        return max(0.0, option.ticker.price - option.strike_price)
+
+    return max(0.0, option.strike_price - option.ticker.price)
+
+
+def _next_friday(date: datetime.date) -> datetime.date:
+    return date + datetime.timedelta(days=(4 - date.weekday()) % 7)
+
+
+def _timestamp(value: datetime.datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _format(value: float, precision: int) -> str:
+    return f'{value:.{precision}f}'
+
+
+def _money(amount: float) -> Dict[str, str]:
+    return {
+        'amount': _format(amount, 2),
+        'currency_code': 'USD',
+        'currency_id': '1072fc76-1862-41ab-82c2-485837590762',
+    }
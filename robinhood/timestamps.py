@@ -0,0 +1,58 @@
+"""
+Parses the API's ISO 8601 timestamps, e.g. `2020-11-20T15:28:21.157159Z`.
+
+The API isn't consistent about these: the fractional part is sometimes missing (or shorter),
+and some feeds use `+00:00` rather than `Z`. We keep microseconds (otherwise, fills in the
+same second are indistinguishable), and return naive datetimes in UTC, since that's how
+they're stored in the database.
+"""
+import datetime
+import re
+from typing import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Before Python 3.11, `fromisoformat` only accepts fractions of 3 or 6 digits, and no `Z`.
+FRACTION_REGEX = re.compile(r'\.(\d+)')
+
+# e.g. +00:00, -0500
+OFFSET_REGEX = re.compile(r'[+-]\d{2}:?\d{2}$')
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """
+    :raises: ValueError
+    """
+    if value.endswith('Z'):
+        value = value[:-1]
+
+    try:
+        output = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        output = datetime.datetime.fromisoformat(
+            FRACTION_REGEX.sub(lambda match: f'.{match.group(1)[:6]:0<6}', value, count=1),
+        )
+
+    if output.tzinfo:
+        output = output.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return output
+
+
+def parse_timestamps(values: Iterable[str]) -> 'np.ndarray':
+    """
+    Like `parse_timestamp`, but converts a whole column at once.
+
+    :returns: datetime64[us] array
+    """
+    import numpy as np
+
+    values = [value[:-1] if value.endswith('Z') else value for value in values]
+    if any(OFFSET_REGEX.search(value) for value in values):
+        # numpy doesn't support UTC offsets (any more).
+        return np.array([parse_timestamp(value) for value in values], dtype='datetime64[us]')
+
+    return np.array(values, dtype='datetime64[us]')
@@ -1,21 +1,78 @@
+import json
 import os
+import re
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import Generator
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
-from pyrh import Robinhood
+from . import metrics
+
+if TYPE_CHECKING:
+    from pyrh import Robinhood
+
+
+UUID_REGEX = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
 
 
 def get_paginated_results(
-    client: Robinhood,
+    client: 'Robinhood',
     url: str,
+    decoder: Optional[Callable[[Dict[str, Any]], Any]] = None,
     **kwargs: Any
-) -> Generator[Dict[str, Any], None, None]:
-    page = client.get(url, **kwargs)
-    yield from page['results']
-    while page['next']:
-        page = client.get(page['next'])
-        yield from page['results']
+) -> Generator[Any, None, None]:
+    """
+    :param decoder: if provided, results are decoded with this (e.g. `StockOrder.decode`,
+        from `robinhood.payloads`), rather than returned as raw dicts.
+    """
+    feed, _ = split_api_url(url)
+
+    page = get_json(client, url, **kwargs)
+    while True:
+        metrics.increment('pages_fetched_total', feed=feed)
+        if decoder:
+            yield from map(decoder, page['results'])
+        else:
+            yield from page['results']
+
+        if not page['next']:
+            return
+
+        page = get_json(client, page['next'])
+
+
+def get_json(client: 'Robinhood', url: str, **kwargs: Any) -> Dict[str, Any]:
+    """Fetches a single API response, keeping a copy of it in the raw payload archive."""
+    from .archive import record
+
+    feed, _ = split_api_url(url)
+    with metrics.timer('http_request_seconds', feed=feed):
+        data = client.get(url, **kwargs)
+
+    if metrics.is_enabled():
+        # We don't have access to the raw response, so this is an approximation.
+        metrics.increment('response_bytes_total', len(json.dumps(data)), feed=feed)
+
+    record(client, url, data, params=kwargs.get('params'))
+
+    return data
+
+
+def split_api_url(url: Any) -> Tuple[str, Optional[str]]:
+    """
+    :returns: (feed, uuid) for the API URL. For example,
+        https://api.robinhood.com/options/instruments/<UUID4>/ => ('options/instruments', UUID4)
+        https://api.robinhood.com/orders/?cursor=abc => ('orders', None)
+    """
+    parts = urlparse(str(url)).path.strip('/').split('/')
+    if UUID_REGEX.match(parts[-1]):
+        return '/'.join(parts[:-1]), parts[-1]
+
+    return '/'.join(parts), None
 
 
 def get_path_to(path: str) -> str:
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the full pipeline against a synthetic trade history, so that we can tell whether
+changes regress performance at scale.
+
+Usage: python -m scripts.benchmark [--orders N] [--seed N] [--save-baseline] [--baseline PATH]
+
+Each stage is timed separately:
+    ingest      syncing raw payloads into the database
+    events      merging database rows into a single event stream (`_get_events`)
+    portfolio   replaying events through `Portfolio`
+    dataframe   building the report's DataFrame (`trades.to_dataframe`)
+
+Timings and peak memory may regress by `--tolerance`, but the number of SQL queries a stage
+runs must not go up at all. Likely N+1 queries are reported as well. The committed baseline is
+for the default `--orders` and `--seed`: for anything else, save one first.
+
+Regardless of the baseline, each stage also has a query budget (see `QUERY_BUDGETS`), so that
+e.g. a query per order fails the benchmark at any size.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from robinhood.query_profiler import QueryProfiler
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+# stage => (queries per order, plus this many). These are a little above what the stages run
+# now, so raise them when a change needs more queries, rather than just re-saving the baseline.
+QUERY_BUDGETS = {
+    'ingest': (5.5, 500),
+    'events': (0.01, 25),
+    'portfolio': (0, 0),
+    'dataframe': (0, 0),
+}
+
+# Stages that take this little time are too noisy to compare by ratio alone, so they can
+# always get this much slower.
+MIN_SLACK_SECONDS = 0.1
+
+
+class Result(NamedTuple):
+    stage: str
+    seconds: float
+    rows: int
+    peak_rss_mb: float
+    queries: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float('inf')
+
+
+def main() -> int:
+    args = parse_args()
+
+    # These need to be set before any `robinhood` modules are imported.
+    directory = tempfile.mkdtemp(prefix='robinhood-benchmark-')
+    os.environ['ROBINHOOD_DATABASE'] = os.path.join(directory, 'database.sqlite3')
+    os.environ['ROBINHOOD_ARCHIVE'] = ''
+
+    from robinhood import metrics
+    if args.metrics:
+        metrics.enable()
+
+    try:
+        results, over_budget = run(args.orders, args.seed)
+    finally:
+        shutil.rmtree(directory)
+
+    if args.metrics:
+        metrics.dump(args.metrics)
+
+    print_results(results)
+    for message in over_budget:
+        print(f'OVER BUDGET: {message}')
+
+    if over_budget:
+        return 1
+
+    key = f'{args.orders}:{args.seed}'
+    if args.save_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline[key] = {result.stage: result._asdict() for result in results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+        print(f'Saved baseline to {args.baseline}.')
+        return 0
+
+    baseline = load_baseline(args.baseline).get(key)
+    if not baseline:
+        print(
+            f'ERROR: No baseline for {args.orders} orders (seed {args.seed}). '
+            'Run with --save-baseline to create one.',
+        )
+        return 1
+
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print(f'REGRESSION: {message}')
+
+    return 1 if regressions else 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--orders',
+        type=int,
+        default=10 ** 4,
+        help='Number of synthetic orders to generate. Defaults to %(default)s.',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '--baseline',
+        default=DEFAULT_BASELINE,
+        help='Path to baseline file. Defaults to %(default)s.',
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Record these results as the new baseline, rather than comparing against it.',
+    )
+    parser.add_argument(
+        '--metrics',
+        metavar='PATH',
+        help='Also collect instrumentation (see `robinhood.metrics`), and write it to PATH. '
+        'Use a `.prom` extension for Prometheus format, otherwise JSON.',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help='How much slower (as a ratio) a stage can get before failing. '
+        'Defaults to %(default)s.',
+    )
+
+    return parser.parse_args()
+
+
+def run(num_orders: int, seed: int) -> Tuple[List[Result], List[str]]:
+    """
+    :returns: (results, stages that ran more queries than their budget)
+    """
+    from robinhood import database
+    from robinhood import synthetic
+    from robinhood.client import use_client
+    from robinhood.logic.dataframe import trades
+    from robinhood.logic.stock_split import process_splits
+    from robinhood.logic.trades import sync_all
+
+    history = synthetic.generate(num_orders, seed=seed)
+    database.session.setup()
+
+    results = []
+    with database.profile_queries() as profiler, use_client(history.get_client()):
+        def ingest() -> int:
+            process_splits(history.splits)
+            sync_all()
+
+            return len(history.stock_orders) + len(history.options_orders)
+
+        results.append(measure('ingest', ingest, profiler))
+
+        events: List[Any] = []
+
+        def get_events() -> int:
+            events.extend(trades._get_events())
+            return len(events)
+
+        results.append(measure('events', get_events, profiler))
+
+        sales: List[Any] = []
+
+        def replay() -> int:
+            sales.extend(trades._replay(events))
+            return len(sales)
+
+        results.append(measure('portfolio', replay, profiler))
+        results.append(
+            measure('dataframe', lambda: len(trades.to_dataframe(sales)), profiler),
+        )
+
+    for suspect in profiler.find_n_plus_one():
+        print(
+            f'Possible N+1 query ({suspect.count}x in {suspect.operation}): '
+            f'{suspect.statement[:80]}...',
+        )
+
+    return results, check_query_budgets(profiler, num_orders)
+
+
+def check_query_budgets(profiler: 'QueryProfiler', num_orders: int) -> List[str]:
+    from robinhood.query_profiler import QueryBudgetExceeded
+
+    output = []
+    for stage, (per_order, allowance) in QUERY_BUDGETS.items():
+        try:
+            profiler.assert_max_queries(stage, int(per_order * num_orders) + allowance)
+        except QueryBudgetExceeded as e:
+            output.append(str(e))
+
+    return output
+
+
+def measure(stage: str, func: Callable[[], int], profiler: 'QueryProfiler') -> Result:
+    """
+    :param func: returns the number of rows processed.
+    """
+    with profiler.operation(stage):
+        start = time.perf_counter()
+        rows = func()
+        seconds = time.perf_counter() - start
+
+    return Result(
+        stage=stage,
+        seconds=seconds,
+        rows=rows,
+        peak_rss_mb=get_peak_rss_mb(),
+        queries=profiler.query_count(stage),
+    )
+
+
+def get_peak_rss_mb() -> float:
+    # NOTE: This is the high-water mark for the entire process, so it only ever goes up.
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports this in bytes, rather than kilobytes.
+        usage /= 1024
+
+    return usage / 1024
+
+
+def print_results(results: List[Result]) -> None:
+    print(
+        f'{"stage":<12}{"seconds":>10}{"rows":>12}{"rows/sec":>14}{"peak RSS (MB)":>16}'
+        f'{"queries":>10}',
+    )
+    for result in results:
+        print(
+            f'{result.stage:<12}{result.seconds:>10.3f}{result.rows:>12}'
+            f'{result.rows_per_second:>14.0f}{result.peak_rss_mb:>16.1f}{result.queries:>10}',
+        )
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(
+    results: List[Result],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.stage)
+        if not expected:
+            continue
+
+        for metric, actual, limit in _get_limits(result, expected, tolerance):
+            if actual > limit:
+                regressions.append(
+                    f'{result.stage} {metric}: {actual:.3f} '
+                    f'(baseline: {expected[metric]:.3f}, limit: {limit:.3f})',
+                )
+
+    return regressions
+
+
+def _get_limits(
+    result: Result,
+    expected: Dict[str, Any],
+    tolerance: float,
+) -> List[Tuple[str, float, float]]:
+    limits = [
+        (
+            'seconds',
+            result.seconds,
+            max(expected['seconds'] * (1 + tolerance), expected['seconds'] + MIN_SLACK_SECONDS),
+        ),
+        ('peak_rss_mb', result.peak_rss_mb, expected['peak_rss_mb'] * (1 + tolerance)),
+    ]
+
+    # Unlike timings, query counts are deterministic, so there's no need for tolerance.
+    if 'queries' in expected:
+        limits.append(('queries', result.queries, expected['queries']))
+
+    return limits
+
+
+if __name__ == '__main__':
+    sys.exit(main())
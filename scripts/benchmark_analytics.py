@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Compares P&L rollups computed in pandas (from ORM objects, as the notebooks do) with the
+DuckDB layer in `robinhood.logic.analytics`, on a synthetic history of realized sales.
+
+Usage: python -m scripts.benchmark_analytics [--sales N]
+
+This needs `duckdb` and `pyarrow` installed.
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+
+BY = ['Month', 'Type', 'Term', 'Underlying']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sales',
+        type=int,
+        default=10 ** 6,
+        help='Number of realized sales to generate. Defaults to %(default)s.',
+    )
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # These need to be set before any `robinhood` modules are imported.
+    directory = tempfile.mkdtemp(prefix='robinhood-analytics-')
+    path = os.path.join(directory, 'database.sqlite3')
+    os.environ['ROBINHOOD_DATABASE'] = path
+    os.environ['ROBINHOOD_ARCHIVE'] = ''
+
+    try:
+        start = time.perf_counter()
+        populate(args.sales, args.tickers, args.seed)
+        print(f'Generated {args.sales} sales in {time.perf_counter() - start:.2f}s')
+
+        from robinhood.logic import analytics
+
+        pandas_df, pandas_seconds = measure(get_rollup_with_pandas)
+        connection, connect_seconds = measure(lambda: analytics.connect(path))
+        duckdb_df, duckdb_seconds = measure(
+            lambda: analytics.get_rollup(by=BY, sync=False, connection=connection),
+        )
+        parquet = os.path.join(directory, 'parquet')
+        _, export_seconds = measure(lambda: analytics.export_parquet(parquet, connection))
+        parquet_df, parquet_seconds = measure(
+            lambda: analytics.get_rollup(
+                by=BY,
+                sync=False,
+                connection=analytics.connect(parquet=parquet),
+            ),
+        )
+    finally:
+        shutil.rmtree(directory)
+
+    print(f'{"pandas (ORM)":<24} {pandas_seconds:>8.2f}s  {len(pandas_df)} groups')
+    print(
+        f'{"duckdb (sqlite)":<24} {duckdb_seconds:>8.2f}s  '
+        f'(plus {connect_seconds:.2f}s to attach)',
+    )
+    print(
+        f'{"duckdb (parquet)":<24} {parquet_seconds:>8.2f}s  '
+        f'(plus {export_seconds:.2f}s to export)',
+    )
+
+    for name, df in (('sqlite', duckdb_df), ('parquet', parquet_df)):
+        if not _is_equal(pandas_df, df):
+            print(f'ERROR: DuckDB ({name}) results differ from pandas.')
+            return 1
+
+    return 0
+
+
+def populate(num_sales: int, num_tickers: int, seed: int) -> None:
+    from robinhood import database
+    from robinhood.models.instrument import Instrument
+    from robinhood.models.rollup import RealizedSale
+
+    database.session.setup()
+
+    rng = random.Random(seed)
+    instruments: List[Dict[str, Any]] = []
+    for index in range(num_tickers):
+        ticker = f'T{index:04d}'
+        instruments.append({'name': ticker, 'underlying': ticker, 'is_option': False})
+        instruments.append({
+            'name': f'{ticker}201218C00150000',
+            'underlying': ticker,
+            'is_option': True,
+        })
+
+    database.session.bulk_insert_mappings(Instrument, instruments)
+
+    start = datetime.date(2012, 1, 3)
+    sales = []
+    for index in range(num_sales):
+        bought = start + datetime.timedelta(days=index * 3650 // num_sales)
+        price = rng.uniform(1, 500)
+        sold_price = price * rng.uniform(0.5, 1.5)
+        quantity = float(rng.randint(1, 100))
+        instrument_id = rng.randrange(len(instruments)) + 1
+        sales.append({
+            'instrument_id': instrument_id,
+            'date_bought': bought,
+            'price_bought': price,
+            'date_sold': bought + datetime.timedelta(days=rng.randrange(1, 800)),
+            'price_sold': sold_price,
+            'quantity': quantity,
+            'earnings': (sold_price - price) * quantity * (100 if instrument_id % 2 == 0 else 1),
+        })
+        if len(sales) == 50000:
+            database.session.bulk_insert_mappings(RealizedSale, sales)
+            sales = []
+
+    database.session.bulk_insert_mappings(RealizedSale, sales)
+    database.session.commit()
+
+
+def get_rollup_with_pandas() -> Any:
+    import pandas as pd
+
+    from robinhood import database
+    from robinhood.logic.rollup import is_long_term
+    from robinhood.models.instrument import Instrument
+    from robinhood.models.rollup import RealizedSale
+
+    instruments = {item.id: item for item in database.session.query(Instrument)}
+
+    data = []
+    for sale in database.session.query(RealizedSale).yield_per(10000):
+        instrument = instruments[sale.instrument_id]
+        data.append([
+            sale.date_sold.replace(day=1),
+            'Options' if instrument.is_option else 'Stocks',
+            'Long' if is_long_term(sale.date_bought, sale.date_sold) else 'Short',
+            instrument.underlying,
+            sale.earnings,
+            sale.quantity,
+        ])
+
+    df = pd.DataFrame(data, columns=[*BY, 'Earnings', 'Volume'])
+    df = df.groupby(BY).agg(
+        Earnings=('Earnings', 'sum'),
+        Count=('Earnings', 'size'),
+        Volume=('Volume', 'sum'),
+    )
+    df['Earnings'] = df['Earnings'].round(2)
+    return df
+
+
+def measure(func: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    output = func()
+    return output, time.perf_counter() - start
+
+
+def _is_equal(expected: Any, actual: Any) -> bool:
+    actual = actual.reset_index()
+    expected = expected.reset_index()
+    if len(actual) != len(expected):
+        return False
+
+    for column in ('Earnings', 'Count', 'Volume'):
+        difference = (
+            expected[column].astype(float).to_numpy()
+            - actual[column].astype(float).to_numpy()
+        )
+        if abs(difference).max(initial=0) > 0.01:
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(main())
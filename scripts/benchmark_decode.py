@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Measures how long it takes to decode API pages into the typed payloads we sync from, per
+order, on a synthetic trade history.
+
+Usage: python -m scripts.benchmark_decode [--orders N]
+
+This compares the `strptime`-based parsing we used to do on raw dicts with the decoders in
+`robinhood.payloads`, both from already parsed JSON, and from the raw bytes of each page
+(with `orjson`, if it's installed).
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--orders',
+        type=int,
+        default=20000,
+        help='Number of orders to generate. Defaults to %(default)s.',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    from robinhood import synthetic
+    from robinhood.client import _loads
+    from robinhood.payloads import OptionOrder
+    from robinhood.payloads import StockOrder
+
+    history = synthetic.generate(args.orders, seed=args.seed)
+    feeds = {
+        'orders': (history.stock_orders, _decode_stock_order, StockOrder.decode),
+        'options/orders': (history.options_orders, _decode_option_order, OptionOrder.decode),
+    }
+
+    print(f'{"feed":<16} {"orders":>8} {"strptime":>10} {"decode":>10} {"from bytes":>12}')
+    for name, (orders, before, after) in feeds.items():
+        pages = [
+            json.dumps({'results': orders[index:index + args.page_size]}).encode()
+            for index in range(0, len(orders), args.page_size)
+        ]
+        print(
+            f'{name:<16} {len(orders):>8} '
+            f'{measure(orders, before):>8.2f}µs '
+            f'{measure(orders, after):>8.2f}µs '
+            f'{measure_pages(pages, len(orders), after, _loads):>10.2f}µs',
+        )
+
+    return 0
+
+
+def measure(orders: List[Dict[str, Any]], decode: Callable[[Dict[str, Any]], Any]) -> float:
+    """
+    :returns: microseconds per order.
+    """
+    start = time.perf_counter()
+    for order in orders:
+        decode(order)
+
+    return (time.perf_counter() - start) / max(len(orders), 1) * 10 ** 6
+
+
+def measure_pages(
+    pages: List[bytes],
+    num_orders: int,
+    decode: Callable[[Dict[str, Any]], Any],
+    loads: Callable[[bytes], Any],
+) -> float:
+    start = time.perf_counter()
+    for page in pages:
+        for order in loads(page)['results']:
+            decode(order)
+
+    return (time.perf_counter() - start) / max(num_orders, 1) * 10 ** 6
+
+
+# These are what the sync used to do with each order, for comparison.
+def _decode_stock_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': order['id'],
+        'price': float(order['average_price']) if order['average_price'] else None,
+        'quantity': float(order['cumulative_quantity']),
+        'date': (
+            _parse_timestamp(order['last_transaction_at'])
+            if order['last_transaction_at']
+            else None
+        ),
+        'updated_at': _parse_timestamp(order['updated_at']),
+    }
+
+
+def _decode_option_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': order['id'],
+        'updated_at': _parse_timestamp(order['updated_at']),
+        'legs': [
+            {
+                'date': _parse_timestamp(leg['executions'][0]['timestamp']),
+                'price': sum(
+                    float(execution['price']) for execution in leg['executions']
+                ) / len(leg['executions']),
+                'quantity': sum(float(execution['quantity']) for execution in leg['executions']),
+            }
+            for leg in order['legs']
+            if leg['executions']
+        ],
+    }
+
+
+def _parse_timestamp(value: str) -> datetime.datetime:
+    return datetime.datetime.strptime(value.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measures Form 8949 export throughput (and memory usage), by streaming synthetic sales
+through `robinhood.logic.form8949.write_sales`.
+
+Usage: python -m scripts.benchmark_export [--sales N]
+
+Since sales are generated lazily, peak memory should stay flat regardless of N.
+"""
+import argparse
+import datetime
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Iterator
+from typing import TYPE_CHECKING
+
+from scripts.benchmark import get_peak_rss_mb
+
+if TYPE_CHECKING:
+    from robinhood.logic.dataframe.trades import Sale
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sales',
+        type=int,
+        default=10 ** 6,
+        help='Number of sales to export. Defaults to %(default)s.',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from robinhood.logic.form8949 import write_sales
+
+    # Generating sales isn't free, so we measure it separately to subtract it out.
+    start = time.perf_counter()
+    for _ in generate_sales(args.sales, args.seed):
+        pass
+    generation_seconds = time.perf_counter() - start
+
+    directory = tempfile.mkdtemp(prefix='robinhood-export-')
+    try:
+        baseline_rss = get_peak_rss_mb()
+        start = time.perf_counter()
+        counts = write_sales(generate_sales(args.sales, args.seed), directory)
+        seconds = time.perf_counter() - start - generation_seconds
+    finally:
+        shutil.rmtree(directory)
+
+    print(f'{sum(counts.values())} sales in {len(counts)} files, in {seconds:.2f}s')
+    print(f'{args.sales / seconds:,.0f} sales/sec (plus {generation_seconds:.2f}s to generate)')
+    print(f'Peak RSS: {get_peak_rss_mb():.1f} MB (before export: {baseline_rss:.1f} MB)')
+    return 0
+
+
+def generate_sales(num_sales: int, seed: int) -> Iterator['Sale']:
+    from robinhood.logic.dataframe.trades import Sale
+    from robinhood.logic.dataframe.trades import Trade
+
+    rng = random.Random(seed)
+    start = datetime.date(2012, 1, 3)
+    for index in range(num_sales):
+        bought = start + datetime.timedelta(days=index * 3650 // num_sales)
+        sold = bought + datetime.timedelta(days=rng.randrange(1, 800))
+        is_option = rng.random() < 0.3
+        price = rng.uniform(1, 500)
+
+        yield Sale(
+            name='ABC201218C00150000' if is_option else 'ABC',
+            bought=Trade(date=bought, price=price),
+            sold=Trade(date=sold, price=price * rng.uniform(0.5, 1.5)),
+            quantity=float(rng.randint(1, 100)),
+            earnings=rng.uniform(-1000, 1000),
+            underlying='ABC',
+            is_option=is_option,
+            instrument_id=1 + is_option,
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Makes sure that entry points stay cheap to import, so that notebooks and CLI invocations
+don't wait on heavy dependencies they don't use.
+
+Usage: python -m scripts.benchmark_import_time [--budget MS] [--runs N]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+
+# These are the modules that interactive sessions (and the CLI) import first.
+ENTRY_POINTS = (
+    'robinhood.cli',
+    'robinhood.client',
+    'robinhood.logic.dataframe',
+    'robinhood.service',
+)
+
+
+def main() -> int:
+    args = parse_args()
+
+    baseline = measure('pass', args.runs)
+    failed = False
+    for module in args.modules or ENTRY_POINTS:
+        elapsed = measure(f'import {module}', args.runs) - baseline
+        status = 'ok'
+        if elapsed > args.budget:
+            status = 'SLOW'
+            failed = True
+
+        print(f'{module:<40} {elapsed:>8.1f} ms  [{status}]')
+
+    if failed:
+        print(f'ERROR: import time exceeded budget of {args.budget:.0f} ms.')
+        return 1
+
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'modules',
+        nargs='*',
+        help='Modules to measure. Defaults to the common entry points.',
+    )
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=300,
+        help='Maximum import time (in milliseconds), on top of interpreter startup.',
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=5,
+        help='Number of fresh interpreters to average over.',
+    )
+
+    return parser.parse_args()
+
+
+def measure(statement: str, runs: int) -> float:
+    """
+    :returns: median wall-clock time (in milliseconds) for a fresh interpreter to run
+        `statement`.
+    """
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Compares building the trades report (and cutting P&L from it) in pandas, as the notebooks
+do, with the Polars backend in `robinhood.logic.dataframe.backends`, on synthetic sales.
+
+Usage: python -m scripts.benchmark_polars [--sales N]
+
+This needs `polars` and `pyarrow` installed.
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+from typing import Any
+from typing import Callable
+from typing import List
+from typing import Tuple
+
+
+BY = ['Month', 'Type', 'Term', 'Underlying']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sales',
+        type=int,
+        default=10 ** 6,
+        help='Number of realized sales to generate. Defaults to %(default)s.',
+    )
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from robinhood.logic.dataframe import backends
+    from robinhood.logic.dataframe import trades
+
+    sales = generate(args.sales, args.tickers, args.seed)
+
+    pandas_df, pandas_build_seconds = measure(lambda: trades.to_dataframe(sales))
+    expected, pandas_rollup_seconds = measure(lambda: get_rollup_with_pandas(pandas_df))
+
+    polars_df, polars_build_seconds = measure(lambda: backends.from_sales(sales))
+    actual, polars_rollup_seconds = measure(
+        lambda: backends.get_rollup(polars_df, by=BY).collect(),
+    )
+
+    print(f'{"":<8} {"build":>10} {"rollup":>10}')
+    print(f'{"pandas":<8} {pandas_build_seconds:>9.2f}s {pandas_rollup_seconds:>9.2f}s')
+    print(f'{"polars":<8} {polars_build_seconds:>9.2f}s {polars_rollup_seconds:>9.2f}s')
+
+    if not _is_equal(expected, backends.to_pandas(actual)):
+        print('ERROR: Polars results differ from pandas.')
+        return 1
+
+    return 0
+
+
+def generate(num_sales: int, num_tickers: int, seed: int) -> List[Any]:
+    from robinhood.logic.dataframe.trades import Sale
+    from robinhood.logic.dataframe.trades import Trade
+
+    rng = random.Random(seed)
+    start = datetime.date(2012, 1, 3)
+
+    output = []
+    for index in range(num_sales):
+        ticker = f'T{rng.randrange(num_tickers):04d}'
+        is_option = rng.random() < .25
+        bought = start + datetime.timedelta(days=index * 3650 // num_sales)
+        price = rng.uniform(1, 500)
+        sold_price = price * rng.uniform(0.5, 1.5)
+        quantity = float(rng.randint(1, 100))
+        output.append(
+            Sale(
+                name=f'{ticker}201218C00150000' if is_option else ticker,
+                bought=Trade(date=bought, price=price),
+                sold=Trade(
+                    date=bought + datetime.timedelta(days=rng.randrange(1, 800)),
+                    price=sold_price,
+                ),
+                quantity=quantity,
+                earnings=(sold_price - price) * quantity * (100 if is_option else 1),
+                underlying=ticker,
+                is_option=is_option,
+                instrument_id=index,
+            ),
+        )
+
+    return output
+
+
+def get_rollup_with_pandas(df: Any) -> Any:
+    from robinhood.logic.rollup import is_long_term
+
+    df = df.assign(
+        Month=df['Date Sold'].apply(lambda date: date.replace(day=1)),
+        Type=df['Is Option'].map({True: 'Options', False: 'Stocks'}),
+        Term=df.apply(
+            lambda row: (
+                'Long'
+                if is_long_term(row['Date Bought'], row['Date Sold'])
+                else 'Short'
+            ),
+            axis=1,
+        ),
+    )
+    df = df.groupby(BY).agg(
+        Earnings=('Earnings', 'sum'),
+        Count=('Earnings', 'size'),
+        Volume=('Quantity', 'sum'),
+    )
+    df['Earnings'] = df['Earnings'].round(2)
+    return df
+
+
+def measure(func: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    output = func()
+    return output, time.perf_counter() - start
+
+
+def _is_equal(expected: Any, actual: Any) -> bool:
+    expected = expected.reset_index()
+    if len(actual) != len(expected):
+        return False
+
+    for column in ('Earnings', 'Count', 'Volume'):
+        difference = (
+            expected[column].astype(float).to_numpy()
+            - actual[column].astype(float).to_numpy()
+        )
+        if abs(difference).max(initial=0) > 0.01:
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,6 +7,11 @@ setup(
     packages=find_packages(exclude=(['test*', 'tmp*', 'pyrh'])),
     version='0.1',
     license='GNU GPL v3',
+    entry_points={
+        'console_scripts': [
+            'robinhood = robinhood.cli:main',
+        ],
+    },
     install_requires=[
         'pyotp',
         'sqlalchemy',
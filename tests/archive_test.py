@@ -0,0 +1,107 @@
+import pathlib
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Tuple
+
+import pytest
+
+from robinhood import archive
+from robinhood import database
+from robinhood import synthetic
+from robinhood.client import use_client
+from robinhood.logic import replay
+from robinhood.logic.stock_split import process_splits
+from robinhood.logic.trades import sync_all
+from robinhood.models.option import OptionExpirationEvent
+from robinhood.models.option import OptionStrategy
+from robinhood.models.option import OptionStrategyLegs
+from robinhood.models.option import OptionTrade
+from robinhood.models.stock import StockTrade
+
+
+@pytest.fixture
+def recorded(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Generator[archive.Archive, None, None]:
+    """
+    A synthetic trade history, synced into the database and recorded to an archive.
+    """
+    monkeypatch.setenv('ROBINHOOD_ARCHIVE', str(tmp_path / 'archive'))
+    archive.get_archive.cache_clear()
+
+    history = synthetic.generate(300)
+
+    # Pretend that this is the API, so that its responses get archived.
+    client = history.get_client()
+    client.offline = False
+
+    process_splits(history.splits)
+    with use_client(client):
+        sync_all()
+
+    try:
+        yield archive.get_archive()
+    finally:
+        archive.get_archive.cache_clear()
+
+
+def test_replay_matches_sync(recorded):
+    expected = _get_tables()
+    assert all(expected.values())
+
+    replay.rebuild_database()
+
+    assert _get_tables() == expected
+
+
+def test_archive_is_deduplicated(recorded):
+    records = list(recorded.iter_records())
+    assert records
+
+    assert not any(
+        recorded.append(record['url'], record['payload'], params=record['params'])
+        for record in records
+    )
+    assert len(list(recorded.iter_records())) == len(records)
+
+
+def test_refuses_archive_that_is_missing_trades(recorded, tmp_path):
+    expected = _get_tables()
+
+    with pytest.raises(ValueError):
+        replay.rebuild_database(archive.Archive(str(tmp_path / 'empty')))
+
+    assert _get_tables() == expected
+
+
+def _get_tables() -> Dict[str, List[Tuple[Any, ...]]]:
+    """
+    :returns: table => rows, without their IDs (which are assigned in the order of syncing).
+    """
+    database.session.remove()
+    return {
+        'stock_trade': sorted(
+            (row.uuid, row.name, row.side, row.date, row.price, row.quantity, row.updated_at)
+            for row in database.session.query(StockTrade)
+        ),
+        'option_trade': sorted(
+            (row.uuid, row.side, row.date, row.price, row.quantity)
+            for row in database.session.query(OptionTrade)
+        ),
+        'option_strategy': sorted(
+            (row.uuid, row.name, row.side, row.type, row.date)
+            for row in database.session.query(OptionStrategy)
+        ),
+        'option_strategy_legs': sorted(
+            database.session.query(OptionStrategy.uuid, OptionTrade.uuid)
+            .join(OptionStrategyLegs, OptionStrategyLegs.strategy_id == OptionStrategy.id)
+            .join(OptionTrade, OptionTrade.id == OptionStrategyLegs.trade_id)
+        ),
+        'option_expiration_event': sorted(
+            (row.uuid, row.date, row.quantity, row.updated_at)
+            for row in database.session.query(OptionExpirationEvent)
+        ),
+    }
@@ -0,0 +1,63 @@
+import os
+import pathlib
+import tempfile
+from typing import Generator
+from urllib.parse import quote
+
+import pytest
+
+# These need to be set before anything from `robinhood` is imported, so that tests never
+# touch the real database, archive or price history.
+os.environ['ROBINHOOD_DATABASE'] = os.path.join(tempfile.mkdtemp(), 'database.sqlite3')
+os.environ['ROBINHOOD_ARCHIVE'] = ''
+os.environ['ROBINHOOD_PRICES'] = ''
+
+from robinhood import database  # noqa: E402
+from robinhood import synthetic  # noqa: E402
+from robinhood.client import use_client  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database_path(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Generator[str, None, None]:
+    """
+    Every test gets a database of its own.
+    """
+    from sqlalchemy import create_engine
+
+    path = str(tmp_path / 'database.sqlite3')
+    monkeypatch.setattr(database, 'ENGINE_URI', path)
+
+    engine = create_engine(f'sqlite+pysqlite:///file:{quote(path)}?uri=true')
+    database.add_listeners(engine)
+
+    original = database.session.get_bind()
+    database.session.remove()
+    database.session.configure(bind=engine)
+    type(database.session).setup.cache_clear()
+    try:
+        database.session.setup()
+        yield path
+    finally:
+        database.session.remove()
+        database.session.configure(bind=original)
+        type(database.session).setup.cache_clear()
+        engine.dispose()
+
+
+@pytest.fixture
+def history() -> synthetic.SyntheticHistory:
+    """
+    A synthetic trade history, synced into the database.
+    """
+    from robinhood.logic.stock_split import process_splits
+    from robinhood.logic.trades import sync_all
+
+    output = synthetic.generate(300)
+    process_splits(output.splits)
+    with use_client(output.get_client()):
+        sync_all()
+
+    return output
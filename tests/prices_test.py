@@ -0,0 +1,170 @@
+import datetime
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+
+import pytest
+
+from robinhood.client import use_client
+from robinhood.logic import prices
+from robinhood.offline import OfflineClient
+from robinhood.util import split_api_url
+
+
+START = datetime.date(2020, 1, 6)
+
+
+class StubClient(OfflineClient):
+    """Keeps track of the symbols that were asked for, in each request."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.requests: List[List[str]] = []
+
+    def get(self, url: Any, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        feed, _ = split_api_url(url)
+        if feed in ('quotes', 'quotes/historicals'):
+            self.requests.append((params or {})['symbols'].split(','))
+
+        return super().get(url, params=params, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Generator[None, None, None]:
+    prices.get_price_history.cache_clear()
+    prices.get_quote_cache.cache_clear()
+    yield
+    prices.get_price_history.cache_clear()
+    prices.get_quote_cache.cache_clear()
+
+
+@pytest.fixture
+def client() -> Generator[StubClient, None, None]:
+    output = StubClient(
+        historicals={
+            f'T{index:03d}': [
+                _get_point(_get_day(day), index + day)
+                for day in range(0, 28)
+                if _get_day(day).weekday() < 5
+            ]
+            for index in range(120)
+        },
+    )
+    with use_client(output):
+        yield output
+
+
+def test_get_prices_fetches_in_batches(client):
+    tickers = [f'T{index:03d}' for index in range(120)]
+
+    output = prices.get_prices(tickers, _get_day(2))
+    assert [len(batch) for batch in client.requests] == [50, 50, 20]
+    assert output['T007'] == 9
+
+    # Everything has been fetched through today, so this doesn't need to ask again.
+    assert prices.get_prices(tickers, _get_day(9))['T007'] == 16
+    assert len(client.requests) == 3
+
+
+def test_unknown_tickers_are_none(client):
+    assert prices.get_prices(['NOPE'], START) == {'NOPE': None}
+
+
+def test_get_uses_last_trading_day():
+    history = _get_history()
+
+    # Saturday and Sunday have the same price as Friday.
+    friday = _get_day(4)
+    assert history.get('ABC', friday) == 4
+    assert history.get('ABC', friday + datetime.timedelta(days=1)) == 4
+    assert history.get('ABC', friday + datetime.timedelta(days=2)) == 4
+    assert history.get('ABC', friday + datetime.timedelta(days=3)) == 7
+
+    assert history.get('ABC', _get_day(-1)) is None
+    assert history.get('XYZ', START) is None
+
+
+def test_get_range_is_inclusive():
+    history = _get_history()
+
+    assert history.get_range('ABC', _get_day(3), _get_day(7)) == [
+        (_get_day(3), 3.),
+        (_get_day(4), 4.),
+        (_get_day(7), 7.),
+    ]
+    assert history.get_range('ABC', _get_day(-7), START) == [(START, 0.)]
+
+    # A weekend.
+    assert history.get_range('ABC', _get_day(5), _get_day(6)) == []
+    assert history.get_range('XYZ', START, START) == []
+
+
+def test_add_prefers_newer_prices():
+    history = _get_history()
+    history.add('ABC', [_get_day(1), _get_day(100)], [-1., 100.])
+
+    assert history.get('ABC', START) == 0
+    assert history.get('ABC', _get_day(1)) == -1
+    assert history.get('ABC', _get_day(2)) == 2
+    assert history.get('ABC', _get_day(200)) == 100
+
+
+def test_save_and_load(tmp_path):
+    history = _get_history()
+    history.fetched_through['ABC'] = START.toordinal()
+
+    path = str(tmp_path / 'prices.npz')
+    history.save(path)
+    loaded = prices.PriceHistory.load(path)
+
+    assert loaded.get_range('ABC', START, _get_day(30)) == (
+        history.get_range('ABC', START, _get_day(30))
+    )
+    assert loaded.is_covered('ABC', START)
+    assert not loaded.is_covered('ABC', _get_day(1))
+
+
+def test_latest_quotes_are_cached_until_they_expire(client, monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(prices.time, 'monotonic', lambda: now[0])
+
+    # The quote is the latest close, i.e. from the 25th day.
+    assert prices.get_prices(['T001', 'T002'])['T001'] == 26
+    assert client.requests == [['T001', 'T002']]
+
+    now[0] += prices.QUOTE_TTL
+    assert prices.get_prices(['T001', 'T002', 'T003'])['T002'] == 27
+    assert client.requests[1:] == [['T003']]
+
+    now[0] += 1
+    prices.get_prices(['T001', 'T002', 'T003'])
+    assert client.requests[2:] == [['T001', 'T002']]
+
+
+def _get_history() -> prices.PriceHistory:
+    """
+    :returns: prices for ABC on weekdays, which are the number of days since START.
+    """
+    history = prices.PriceHistory()
+    days = [day for day in range(0, 14) if _get_day(day).weekday() < 5]
+    history.add(
+        'ABC',
+        [_get_day(day) for day in days],
+        [float(day) for day in days],
+    )
+
+    return history
+
+
+def _get_day(days: int) -> datetime.date:
+    return START + datetime.timedelta(days=days)
+
+
+def _get_point(date: datetime.date, price: float) -> Dict[str, Any]:
+    return {
+        'begins_at': f'{date.isoformat()}T00:00:00Z',
+        'open_price': str(price),
+        'close_price': str(price),
+    }
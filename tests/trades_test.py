@@ -0,0 +1,29 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from robinhood.logic.dataframe import trades
+
+
+def test_add_returns():
+    bought = datetime.date(2020, 1, 2)
+    df = trades.add_returns(pd.DataFrame({
+        'Date Bought': [bought, bought, bought],
+        'Date Sold': [bought, datetime.date(2020, 1, 31), datetime.date(2021, 1, 1)],
+        'Earnings': [2.0, 2.0, 10.0],
+        'Cost Basis': [100.0, 100.0, 100.0],
+    }))
+
+    assert df['Holding Days'].tolist() == [0, 29, 365]
+    assert df['Return'].tolist() == pytest.approx([0.02, 0.02, 0.1])
+
+    # Shorter holds aren't annualized, since compounding them is meaningless.
+    assert np.isnan(df['Annualized Return'][:2]).all()
+    assert df['Annualized Return'][2] == pytest.approx(0.1)
+
+
+def test_add_returns_needs_cost_basis():
+    with pytest.raises(ValueError):
+        trades.add_returns(pd.DataFrame(columns=trades.COLUMNS))
@@ -0,0 +1,72 @@
+import datetime
+from typing import Any
+from typing import List
+from typing import Tuple
+
+from robinhood import database
+from robinhood.client import use_client
+from robinhood.logic import rollup
+from robinhood.logic import verify
+from robinhood.models.rollup import PnlRollup
+from robinhood.models.stock import StockTrade
+
+
+def test_nothing_to_repair_after_sync(history):
+    with use_client(history.get_client()):
+        assert verify.verify(repair=False) == []
+
+
+def test_repairs_months_that_differ(history):
+    trades = database.session.query(StockTrade).order_by(StockTrade.id).all()
+    deleted, aged = trades[10], trades[-10]
+    deleted_uuid, aged_uuid, updated_at = deleted.uuid, aged.uuid, aged.updated_at
+
+    expected = {
+        ('stock_trade', _get_month(deleted.updated_at)),
+        ('stock_trade', _get_month(updated_at)),
+        ('stock_trade', _get_month(updated_at - datetime.timedelta(days=40))),
+    }
+    database.session.delete(deleted)
+    aged.updated_at = updated_at - datetime.timedelta(days=40)
+    database.session.commit()
+
+    with use_client(history.get_client()):
+        assert {(item.table, item.month) for item in verify.verify()} == expected
+        assert verify.verify(repair=False) == []
+
+    assert _get_trade(deleted_uuid)
+    assert _get_trade(aged_uuid).updated_at == updated_at
+
+
+def test_repairs_rollup(history):
+    rollup.update()
+    database.session.query(StockTrade).filter(
+        StockTrade.id.in_([
+            trade.id
+            for trade in database.session.query(StockTrade).order_by(StockTrade.id)[:20]
+        ]),
+    ).delete(synchronize_session=False)
+    database.session.commit()
+    rollup.update()
+
+    with use_client(history.get_client()):
+        assert verify.verify()
+
+    repaired = _get_rollup()
+    rollup.rebuild()
+    assert repaired == _get_rollup()
+
+
+def _get_month(value: datetime.datetime) -> datetime.date:
+    return value.date().replace(day=1)
+
+
+def _get_trade(uuid: str) -> StockTrade:
+    return database.session.query(StockTrade).filter(StockTrade.uuid == uuid).one_or_none()
+
+
+def _get_rollup() -> List[Tuple[Any, ...]]:
+    return sorted(
+        (row.month, row.is_option, row.is_long_term, row.underlying, round(row.earnings, 2))
+        for row in database.session.query(PnlRollup)
+    )